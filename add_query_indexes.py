@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Add the indexes declared in models.py to an existing database.
+
+Usage: python add_query_indexes.py
+
+db.create_all() only builds indexes together with new tables, so databases
+created before an index was declared are missing it. This is the deploy step
+that adds them; the app never builds them at startup. It creates every
+declared index that does not exist yet: composite, partial (WHERE is_active)
+and lower(category) expression indexes alike, on Postgres or sqlite. On
+Postgres they are built CONCURRENTLY so live traffic keeps writing, and
+indexes no longer declared (OBSOLETE_INDEXES) are dropped the same way.
+Safe to re-run; check_query_plans.py lists any that are still missing.
+"""
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db
+from check_query_plans import index_exists
+
+# Indexes earlier versions declared that are now dropped
+OBSOLETE_INDEXES = (
+    'ix_products_active_id',  # duplicated the primary key
+)
+
+def add_query_indexes():
+    with app.app_context():
+        db.create_all()
+        postgres = db.engine.dialect.name == 'postgresql'
+        created, failed = 0, 0
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for table in db.metadata.sorted_tables:
+                for index in sorted(table.indexes, key=lambda ix: ix.name):
+                    if index_exists(conn, index.name):
+                        continue
+                    if postgres:
+                        index.dialect_options['postgresql']['concurrently'] = True
+                    try:
+                        index.create(conn)
+                        created += 1
+                        print(f'✅ Created {index.name} on {table.name}')
+                    except SQLAlchemyError as e:
+                        failed += 1
+                        print(f'❌ Could not create {index.name}: {e}')
+                        if postgres:
+                            # A failed concurrent build leaves an INVALID index behind; drop it so a re-run retries
+                            conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}')
+                    finally:
+                        if postgres:
+                            index.dialect_options['postgresql']['concurrently'] = False
+
+            for name in OBSOLETE_INDEXES:
+                if index_exists(conn, name):
+                    conn.exec_driver_sql(f'DROP INDEX {"CONCURRENTLY " if postgres else ""}IF EXISTS {name}')
+                    print(f'✅ Dropped obsolete {name}')
+
+        print(f'\n✅ Created {created} indexes' + (f', {failed} failed' if failed else ''))
+        return failed == 0
+
+if __name__ == '__main__':
+    add_query_indexes()
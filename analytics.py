@@ -0,0 +1,533 @@
+"""
+Order analytics
+
+/admin_analytics reads daily rollup tables (DailyOrderRollup,
+DailyCategoryRollup) that complete_order / verify_payment keep up to date
+incrementally, so the page only touches a few hundred pre-aggregated rows.
+live_order_analytics() computes the same figures straight from the order
+tables with GROUP BY, using the unit price stored on each OrderItem.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import and_, case, exists, extract, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Order, OrderItem, Product, DailyOrderRollup, DailyCategoryRollup
+
+logger = logging.getLogger(__name__)
+
+SCAFFOLDING_ANALYTICS_CATEGORIES = ['aluminium', 'h-frames', 'cuplock', 'accessories', 'vertical']
+FABRICATION_ANALYTICS_CATEGORIES = ['steel', 'custom', 'parts', 'fabrication', 'fabrications']
+
+# Bits of Order.panel_mask
+PANEL_BITS = {
+    'scaffolding': 1,
+    'fabrication': 2
+}
+
+
+def panel_for_category(category):
+    """Admin panel that owns a product category, or None"""
+    if category in SCAFFOLDING_ANALYTICS_CATEGORIES:
+        return 'scaffolding'
+    if category in FABRICATION_ANALYTICS_CATEGORIES:
+        return 'fabrication'
+    return None
+
+
+def order_item_snapshot(product):
+    """The product's category / cuplock type / panel as OrderItem column values,
+    so admin views never need to join back to products"""
+    category = product.category if product else None
+    return {
+        'product_category': category,
+        'cuplock_type': product.cuplock_type if product else None,
+        'panel': panel_for_category(category)
+    }
+
+
+def snapshot_order_item(item, product):
+    """Copy order_item_snapshot(product) onto an OrderItem"""
+    for column, value in order_item_snapshot(product).items():
+        setattr(item, column, value)
+
+
+def order_panel_mask(panels):
+    """PANEL_BITS of every panel in `panels` (the items' panel column)"""
+    mask = 0
+    for panel in panels:
+        mask |= PANEL_BITS.get(panel, 0)
+    return mask
+
+
+def panel_mask_filter(panel_type):
+    """
+    Condition matching orders with at least one item from the admin's panel,
+    or None. Orders not backfilled yet (NULL mask) match every panel rather
+    than disappearing until backfill_order_panels.py has run.
+    """
+    bit = PANEL_BITS.get(panel_type)
+    if bit is None:
+        return None
+    return or_(Order.panel_mask.is_(None), Order.panel_mask.op('&')(bit) != 0)
+
+
+def panel_order_filter(panel_type):
+    """Orders with at least one item from the admin's panel, or None (all orders)"""
+    return panel_mask_filter(panel_type)
+
+
+def backfill_order_snapshots(full=False):
+    """
+    Fill the panel / category snapshot on orders placed before it existed:
+    order_items.product_category / cuplock_type from products, then
+    order_items.panel and orders.panel_mask. Set-based UPDATEs that only
+    touch rows still missing the snapshot, so re-runs are cheap;
+    full=True re-derives every panel and mask (categories already captured
+    at checkout are never overwritten). Does NOT commit.
+    Returns (order items updated, orders updated).
+    """
+    product = select(Product).where(Product.id == OrderItem.product_id)
+    missing_category = OrderItem.product_category.is_(None) & exists(
+        product.where(Product.category.isnot(None))
+    )
+    items = db.session.execute(
+        update(OrderItem)
+        .where(missing_category)
+        .values(
+            product_category=product.with_only_columns(Product.category).scalar_subquery(),
+            cuplock_type=product.with_only_columns(Product.cuplock_type).scalar_subquery()
+        )
+    ).rowcount
+
+    panel = case(
+        (OrderItem.product_category.in_(SCAFFOLDING_ANALYTICS_CATEGORIES), 'scaffolding'),
+        (OrderItem.product_category.in_(FABRICATION_ANALYTICS_CATEGORIES), 'fabrication'),
+        else_=None
+    )
+    db.session.execute(
+        update(OrderItem)
+        .where(*([] if full else [OrderItem.panel.is_(None) & OrderItem.product_category.in_(
+            SCAFFOLDING_ANALYTICS_CATEGORIES + FABRICATION_ANALYTICS_CATEGORIES
+        )]))
+        .values(panel=panel)
+    )
+
+    mask = 0
+    for name, bit in PANEL_BITS.items():
+        has_panel = exists().where(OrderItem.order_id == Order.id, OrderItem.panel == name)
+        mask = mask + case((has_panel, bit), else_=0)
+    # A mask of 0 was the column default for orders that predate it
+    stale = or_(Order.panel_mask.is_(None), and_(Order.panel_mask == 0, mask != 0))
+    orders = db.session.execute(
+        update(Order).where(*([] if full else [stale])).values(panel_mask=mask)
+    ).rowcount
+    return items, orders
+
+
+def ensure_order_panels():
+    """
+    Deploy step (backfill_order_panels.py) after the snapshot columns are
+    added: backfill orders that lack them and rebuild the rollups if any
+    order's panels changed. Runs under the rollup rebuild lock, so two
+    concurrent runs do not both rebuild.
+    """
+    _lock_rollup_rebuild()
+    items, orders = backfill_order_snapshots()
+    if orders:
+        rebuild_order_rollups()
+    db.session.commit()
+    if items or orders:
+        logger.info(f"Backfilled panel snapshot on {items} order items and {orders} orders")
+
+
+def parse_date_range(start, end):
+    """
+    'YYYY-MM-DD' strings -> (start datetime, exclusive end datetime).
+    The end date is inclusive for the user; blank or invalid values are None.
+    """
+    def parse(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d') if value else None
+        except ValueError:
+            return None
+
+    start_dt = parse(start)
+    end_dt = parse(end)
+    return start_dt, end_dt + timedelta(days=1) if end_dt else None
+
+
+def _order_filters(panel_type, start=None, end=None):
+    filters = []
+    panel_filter = panel_order_filter(panel_type)
+    if panel_filter is not None:
+        filters.append(panel_filter)
+    if start:
+        filters.append(Order.order_date >= start)
+    if end:
+        filters.append(Order.order_date < end)
+    return filters
+
+
+def live_order_analytics(panel_type=None, start=None, end=None):
+    """
+    Monthly, yearly and per-category revenue for the orders an admin can
+    see, optionally limited to [start, end). Two queries regardless of the
+    number of orders.
+    """
+    filters = _order_filters(panel_type, start, end)
+
+    year = extract('year', Order.order_date)
+    month = extract('month', Order.order_date)
+    monthly_rows = db.session.query(
+        year.label('year'),
+        month.label('month'),
+        func.coalesce(func.sum(Order.total_price), 0).label('revenue'),
+        func.count(Order.id).label('orders')
+    ).filter(*filters).group_by(year, month).all()
+
+    monthly_data = {}
+    yearly_data = {}
+    total_revenue = 0.0
+    total_orders = 0
+    for row in monthly_rows:
+        revenue = float(row.revenue)
+        total_revenue += revenue
+        total_orders += row.orders
+        if row.year is None:
+            continue
+
+        month_key = f"{int(row.year):04d}-{int(row.month):02d}"
+        monthly_data[month_key] = {'revenue': revenue, 'orders': row.orders}
+
+        year_key = f"{int(row.year):04d}"
+        yearly = yearly_data.setdefault(year_key, {'revenue': 0, 'orders': 0})
+        yearly['revenue'] += revenue
+        yearly['orders'] += row.orders
+
+    category = func.coalesce(func.nullif(OrderItem.product_category, ''), 'Other')
+    category_rows = db.session.query(
+        category.label('category'),
+        func.coalesce(func.sum(OrderItem.price * OrderItem.quantity), 0).label('revenue'),
+        func.coalesce(func.sum(OrderItem.quantity), 0).label('quantity')
+    ).select_from(OrderItem).join(
+        Order, Order.id == OrderItem.order_id
+    ).filter(*filters).group_by(category).all()
+
+    category_data = {
+        row.category: {'revenue': float(row.revenue), 'quantity': int(row.quantity)}
+        for row in category_rows
+    }
+
+    return {
+        'monthly_data': monthly_data,
+        'yearly_data': yearly_data,
+        'category_data': category_data,
+        'sorted_months': sorted(monthly_data.keys()),
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'avg_order_value': total_revenue / total_orders if total_orders > 0 else 0
+    }
+
+
+# ===========================
+# DAILY ROLLUPS
+# ===========================
+
+ALL_PANELS = 'all'
+GST_RATE = 0.18
+ROLLUP_BATCH_SIZE = 1000
+
+
+def order_deposit(total_price, subtotal):
+    """Deposit part of an order total: total - (subtotal + 18% GST)"""
+    deposit = float(total_price or 0) - round(subtotal * (1 + GST_RATE), 2)
+    return max(round(deposit, 2), 0.0)
+
+
+def _rollup_category(category):
+    return category or 'Other'
+
+
+def _order_contributions(order_date, status, total_price, panel_mask, items, sign=1):
+    """
+    Rollup deltas for one order. `items` is [(category, unit price, quantity)].
+    Returns ({(day, panel, status): [revenue, orders, deposit]},
+             {(day, panel, status, category): [revenue, quantity]}).
+    """
+    day = order_date.date()
+    panels = [ALL_PANELS] + [
+        panel for panel, bit in PANEL_BITS.items() if (panel_mask or 0) & bit
+    ]
+
+    subtotal = sum(float(price or 0) * (quantity or 0) for _, price, quantity in items)
+    deposit = order_deposit(total_price, subtotal)
+
+    order_rows = {}
+    category_rows = defaultdict(lambda: [0.0, 0])
+    for panel in panels:
+        order_rows[(day, panel, status)] = [sign * float(total_price or 0), sign, sign * deposit]
+        for category, price, quantity in items:
+            row = category_rows[(day, panel, status, _rollup_category(category))]
+            row[0] += sign * float(price or 0) * (quantity or 0)
+            row[1] += sign * (quantity or 0)
+    return order_rows, dict(category_rows)
+
+
+def _merge(target, deltas):
+    for key, values in deltas.items():
+        if key in target:
+            target[key] = [a + b for a, b in zip(target[key], values)]
+        else:
+            target[key] = list(values)
+
+
+def _increment(model, key_columns, value_columns, rows):
+    """Add `rows` ({key tuple: [values]}) onto `model`, inserting missing keys"""
+    if not rows:
+        return
+    records = [
+        dict(zip(key_columns, key), **dict(zip(value_columns, values)))
+        for key, values in rows.items()
+    ]
+
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+        table = model.__table__
+        # One multi-row upsert per table; keys are unique within `rows`
+        stmt = insert(table).values(records)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={col: table.c[col] + stmt.excluded[col] for col in value_columns}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Other databases: read-modify-write inside the caller's transaction
+    for record in records:
+        row = db.session.get(model, tuple(record[col] for col in key_columns))
+        if row is None:
+            db.session.add(model(**record))
+        else:
+            for col in value_columns:
+                setattr(row, col, (getattr(row, col) or 0) + record[col])
+
+
+def _apply_contributions(order_rows, category_rows):
+    _increment(DailyOrderRollup, ['day', 'panel', 'status'],
+               ['revenue', 'order_count', 'deposit_total'], order_rows)
+    _increment(DailyCategoryRollup, ['day', 'panel', 'status', 'category'],
+               ['revenue', 'quantity'], category_rows)
+
+
+def _order_items(order):
+    """[(category, price, quantity)] for an order in one query"""
+    return db.session.query(
+        OrderItem.product_category, OrderItem.price, OrderItem.quantity
+    ).filter(OrderItem.order_id == order.id).all()
+
+
+def record_order_placed(order):
+    """Add a freshly flushed order (and its items) to the rollups. Does NOT commit."""
+    db.session.flush()
+    _apply_contributions(*_order_contributions(
+        order.order_date, order.status, order.total_price, order.panel_mask, _order_items(order)
+    ))
+
+
+def record_order_status_change(order, old_status):
+    """Move an order's rollup contribution from `old_status` to its current status. Does NOT commit."""
+    if old_status == order.status:
+        return
+    items = _order_items(order)
+    order_rows, category_rows = _order_contributions(
+        order.order_date, old_status, order.total_price, order.panel_mask, items, sign=-1
+    )
+    added_orders, added_categories = _order_contributions(
+        order.order_date, order.status, order.total_price, order.panel_mask, items
+    )
+    _merge(order_rows, added_orders)
+    _merge(category_rows, added_categories)
+    _apply_contributions(order_rows, category_rows)
+
+
+def compute_order_rollups():
+    """
+    Rollup rows recomputed from the order tables, streamed one order at a
+    time so only the aggregated rows are held in memory.
+    """
+    rows = db.session.query(
+        Order.id, Order.order_date, Order.status, Order.total_price, Order.panel_mask,
+        OrderItem.product_category, OrderItem.price, OrderItem.quantity, OrderItem.id
+    ).outerjoin(
+        OrderItem, OrderItem.order_id == Order.id
+    ).filter(
+        Order.order_date.isnot(None)
+    ).order_by(Order.id).yield_per(ROLLUP_BATCH_SIZE)
+
+    order_rows = {}
+    category_rows = {}
+    for _, order_lines in groupby(rows, key=lambda r: r[0]):
+        order_lines = list(order_lines)
+        first = order_lines[0]
+        items = [(r[5], r[6], r[7]) for r in order_lines if r[8] is not None]
+        added_orders, added_categories = _order_contributions(first[1], first[2], first[3], first[4], items)
+        _merge(order_rows, added_orders)
+        _merge(category_rows, added_categories)
+    return order_rows, category_rows
+
+
+# pg_advisory_xact_lock key that serialises full rollup rebuilds across workers
+ROLLUP_REBUILD_LOCK = 7310513
+
+
+def _lock_rollup_rebuild():
+    """Hold the rebuild lock until the caller's transaction ends (Postgres only)"""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': ROLLUP_REBUILD_LOCK})
+
+
+def rebuild_order_rollups():
+    """
+    Replace the rollup tables with a full recomputation. Does NOT commit;
+    a concurrent rebuild waits until this transaction ends.
+    """
+    _lock_rollup_rebuild()
+    order_rows, category_rows = compute_order_rollups()
+    DailyCategoryRollup.query.delete()
+    DailyOrderRollup.query.delete()
+    _apply_contributions(order_rows, category_rows)
+    return len(order_rows), len(category_rows)
+
+
+def reconcile_order_rollups():
+    """
+    Compare the stored rollups with a recomputation. Returns a list of
+    (table, key, stored values, expected values) for every row that differs.
+    """
+    expected_orders, expected_categories = compute_order_rollups()
+
+    def stored(model, key_columns, value_columns):
+        result = {}
+        for row in model.query.all():
+            result[tuple(getattr(row, c) for c in key_columns)] = [float(getattr(row, c)) for c in value_columns]
+        return result
+
+    def differs(a, b):
+        return any(abs(x - y) > 0.005 for x, y in zip(a, b))
+
+    mismatches = []
+    for table, model, keys, values, expected in (
+        ('daily_order_rollups', DailyOrderRollup, ['day', 'panel', 'status'],
+         ['revenue', 'order_count', 'deposit_total'], expected_orders),
+        ('daily_category_rollups', DailyCategoryRollup, ['day', 'panel', 'status', 'category'],
+         ['revenue', 'quantity'], expected_categories),
+    ):
+        actual = stored(model, keys, values)
+        zero = [0.0] * len(values)
+        for key in set(actual) | set(expected):
+            have = actual.get(key, zero)
+            want = [float(v) for v in expected.get(key, zero)]
+            if differs(have, want):
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+
+def ensure_order_rollups():
+    """
+    Backfill the rollups once if orders exist but nothing was rolled up yet.
+    The check runs under the rebuild lock, so when two deploy runs overlap
+    only the first backfills and the other sees its rows.
+    """
+    _lock_rollup_rebuild()
+    if (db.session.query(DailyOrderRollup.day).first() is not None
+            or db.session.query(Order.id).first() is None):
+        db.session.commit()
+        return
+    counts = rebuild_order_rollups()
+    db.session.commit()
+    logger.info(f"Backfilled order rollups: {counts[0]} order rows, {counts[1]} category rows")
+
+
+def pending_order_backfills():
+    """
+    Read-only startup check: descriptions of the order backfills that
+    backfill_order_panels.py still has to run. Two indexed probes, no writes.
+    """
+    pending = []
+    if db.session.query(Order.id).filter(Order.panel_mask.is_(None)).first() is not None:
+        pending.append('orders without a panel snapshot')
+    if (db.session.query(Order.id).first() is not None
+            and db.session.query(DailyOrderRollup.day).first() is None):
+        pending.append('order rollups not built')
+    return pending
+
+
+def order_analytics(panel_type=None, start=None, end=None):
+    """
+    Same figures as live_order_analytics(), read from the daily rollups.
+    Two small queries; the rows scanned grow with days, not orders.
+    """
+    panel = panel_type if panel_type in PANEL_BITS else ALL_PANELS
+
+    def day_filters(model):
+        filters = [model.panel == panel]
+        if start:
+            filters.append(model.day >= start.date())
+        if end:
+            filters.append(model.day < end.date())
+        return filters
+
+    year = extract('year', DailyOrderRollup.day)
+    month = extract('month', DailyOrderRollup.day)
+    monthly_rows = db.session.query(
+        year.label('year'),
+        month.label('month'),
+        func.coalesce(func.sum(DailyOrderRollup.revenue), 0).label('revenue'),
+        func.coalesce(func.sum(DailyOrderRollup.order_count), 0).label('orders')
+    ).filter(*day_filters(DailyOrderRollup)).group_by(year, month).all()
+
+    monthly_data = {}
+    yearly_data = {}
+    total_revenue = 0.0
+    total_orders = 0
+    for row in monthly_rows:
+        if not row.orders:
+            continue
+        revenue = float(row.revenue)
+        total_revenue += revenue
+        total_orders += int(row.orders)
+
+        month_key = f"{int(row.year):04d}-{int(row.month):02d}"
+        monthly_data[month_key] = {'revenue': revenue, 'orders': int(row.orders)}
+
+        year_key = f"{int(row.year):04d}"
+        yearly = yearly_data.setdefault(year_key, {'revenue': 0, 'orders': 0})
+        yearly['revenue'] += revenue
+        yearly['orders'] += int(row.orders)
+
+    category_rows = db.session.query(
+        DailyCategoryRollup.category,
+        func.coalesce(func.sum(DailyCategoryRollup.revenue), 0).label('revenue'),
+        func.coalesce(func.sum(DailyCategoryRollup.quantity), 0).label('quantity')
+    ).filter(*day_filters(DailyCategoryRollup)).group_by(DailyCategoryRollup.category).all()
+
+    category_data = {
+        row.category: {'revenue': float(row.revenue), 'quantity': int(row.quantity)}
+        for row in category_rows if row.quantity
+    }
+
+    return {
+        'monthly_data': monthly_data,
+        'yearly_data': yearly_data,
+        'category_data': category_data,
+        'sorted_months': sorted(monthly_data.keys()),
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'avg_order_value': total_revenue / total_orders if total_orders > 0 else 0
+    }
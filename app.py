@@ -1,13 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, stream_with_context
 from models import CuplockVerticalCup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_mail import Mail, Message
 from models import db, User, Admin, Product, Order, OrderItem
 import os
-import qrcode
-import io
-import base64
-from utils import get_image_url
+import math
+from utils import discard_upload, get_image_url, image_srcset, store_upload
+from product_images import (PLACEHOLDER_IMAGE, image_row_diagnostic,
+                            product_image_paths, remove_product_image, set_product_images)
+from catalog import (FACET_NAMES, SCAFFOLDING_LISTING_CATEGORIES, catalog_changed, ensure_catalog_version_row,
+                     get_catalog_listing, get_catalog_snapshot, get_listing_cards, get_product_pricing,
+                     get_scaffolding_facets)
+from carts import add_cart_line, cart_products, clear_cart, get_cart, prune_cart, remove_cart_line
+from search import SEARCH_PAGE_SIZE, search_product_ids
+from suggest import SUGGEST_LIMIT, ensure_suggest_refresher, suggest
+from payment_qr import format_upi_amount, qr_etag, render_qr_svg, upi_payload
+from order_export import stream_orders_csv, stream_orders_xlsx
+from image_diagnostics import run_image_diagnostics, validate_image_file
+from analytics import (order_analytics, order_item_snapshot, order_panel_mask, panel_mask_filter,
+                       parse_date_range, pending_order_backfills, record_order_placed,
+                       record_order_status_change)
 
 
 
@@ -26,9 +38,10 @@ from dotenv import load_dotenv
 import json
 import uuid
 from PIL import Image
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
-from sqlalchemy import text, func
+from sqlalchemy import text, func, insert, or_, tuple_
 from models import Product
 # Import Cuplock blueprint
 from cuplock_routes import cuplock_bp
@@ -68,6 +81,51 @@ def ensure_columns_exist():
                 END IF;
             END $$;
         """))
+        # Image metadata captured at upload (product_images may not exist yet on a fresh DB)
+        conn.execute(text("""
+            ALTER TABLE IF EXISTS product_images ADD COLUMN IF NOT EXISTS dominant_color VARCHAR(7);
+            ALTER TABLE IF EXISTS product_images ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+        """))
+        # Panel / category snapshot taken when an order is placed, and the
+        # checkout idempotency key. Indexes only once the tables exist;
+        # create_all builds them on a fresh database.
+        conn.execute(text("""
+            -- Existing orders start NULL until backfill_order_panels.py fills them
+            ALTER TABLE IF EXISTS orders ADD COLUMN IF NOT EXISTS panel_mask INTEGER;
+            ALTER TABLE IF EXISTS orders ALTER COLUMN panel_mask SET DEFAULT 0;
+            ALTER TABLE IF EXISTS orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+            ALTER TABLE IF EXISTS order_items ADD COLUMN IF NOT EXISTS product_category VARCHAR(100);
+            ALTER TABLE IF EXISTS order_items ADD COLUMN IF NOT EXISTS cuplock_type VARCHAR(50);
+            ALTER TABLE IF EXISTS order_items ADD COLUMN IF NOT EXISTS panel VARCHAR(20);
+            DO $$
+            BEGIN
+                IF to_regclass('orders') IS NOT NULL THEN
+                    CREATE INDEX IF NOT EXISTS ix_orders_panel_mask ON orders (panel_mask);
+                    CREATE UNIQUE INDEX IF NOT EXISTS ix_orders_idempotency_key ON orders (idempotency_key);
+                END IF;
+                IF to_regclass('order_items') IS NOT NULL THEN
+                    CREATE INDEX IF NOT EXISTS ix_order_items_panel ON order_items (panel);
+                    CREATE INDEX IF NOT EXISTS ix_order_items_product_category ON order_items (product_category);
+                END IF;
+            END $$;
+        """))
+        conn.commit()
+        # Fails while duplicate transaction IDs exist; dedupe_transaction_ids.py clears them
+        try:
+            conn.execute(text("""
+                DO $$
+                BEGIN
+                    IF to_regclass('orders') IS NOT NULL THEN
+                        CREATE UNIQUE INDEX IF NOT EXISTS ix_orders_transaction_id ON orders (transaction_id);
+                    END IF;
+                END $$;
+            """))
+        except SQLAlchemyError as e:
+            conn.rollback()
+            app.logger.error(
+                "Could not add unique index on orders.transaction_id, so reused transaction IDs "
+                f"are not rejected by the database. Run python dedupe_transaction_ids.py: {e}"
+            )
         conn.commit()
 
 
@@ -111,7 +169,12 @@ else:
     app.config['SESSION_COOKIE_SECURE'] = False # FIX APPLIED
 # Configure database URL: prefer PostgreSQL from .env (`DATABASE_URL` or `POSTGRES_URL`)
 db_url = os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL') or None
-if db_url:
+# The test suite points the app at a throwaway database (see test_support.py); it wins over DATABASE_URL
+test_db_url = os.environ.get('TEST_DATABASE_URL')
+if test_db_url:
+    app.config['SQLALCHEMY_DATABASE_URI'] = test_db_url
+    app.logger.info('Using TEST_DATABASE_URL from environment')
+elif db_url:
     # Normalize common PostgreSQL URL forms for SQLAlchemy + psycopg2
     normalized = db_url
     if normalized.startswith('postgres://'):
@@ -187,6 +250,7 @@ db.init_app(app)
 
 # Register Jinja filters
 app.jinja_env.filters['indian'] = indian_format
+app.jinja_env.globals['image_srcset'] = image_srcset
 
 IST = ZoneInfo("Asia/Kolkata")
 
@@ -200,85 +264,31 @@ def utc_to_ist(dt):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_image_file(filepath):
-    """Validate a single image file and return diagnostic info.
-    Returns a dict with keys: exists, readable, valid, format, size_bytes, dimensions, error
-    """
-    diagnostic = {
-        'filepath': filepath,
-        'exists': False,
-        'readable': False,
-        'valid': False,
-        'format': None,
-        'size_bytes': 0,
-        'dimensions': None,
-        'error': None
-    }
-    
-    if not os.path.exists(filepath):
-        diagnostic['error'] = 'File does not exist on disk'
-        return diagnostic
-    
-    diagnostic['exists'] = True
-    
-    try:
-        size = os.path.getsize(filepath)
-        diagnostic['size_bytes'] = size
-        diagnostic['readable'] = True
-    except Exception as e:
-        diagnostic['error'] = f'Cannot read file size: {str(e)}'
-        return diagnostic
-    
-    try:
-        with Image.open(filepath) as im:
-            im.verify()
-            diagnostic['valid'] = True
-            diagnostic['format'] = im.format
-    except Exception as e:
-        diagnostic['valid'] = False
-        diagnostic['error'] = f'Image validation failed: {str(e)}'
-        return diagnostic
-    
-    try:
-        with Image.open(filepath) as im:
-            diagnostic['dimensions'] = f"{im.width}x{im.height}"
-    except Exception as e:
-        diagnostic['dimensions'] = 'Unable to read'
-    
-    return diagnostic
+def product_image_diagnostics(product):
+    """Diagnostics for every image of a product. Rows answer from the metadata
+    stored at upload; only unmigrated CSV paths are opened with Pillow."""
+    if product.images:
+        return [image_row_diagnostic(row) for row in product.images]
+    return [
+        validate_image_file(os.path.join(app.static_folder, img_url.lstrip('/')))
+        for img_url in product_image_paths(product)
+    ]
 
 def upload_file_locally(file, filename):
     """Save uploaded file to the correct folder"""
     if file and allowed_file(file.filename):
-        # Create a unique name to avoid conflicts
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        
-        # Create the uploads folder if it doesn't exist
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # Save the file
-        file.save(file_path)
-        
-        # Return the path for database (just 'uploads/filename.jpg')
-        return f"uploads/{unique_filename}"
+        # Stored by content hash, so identical uploads share one file
+        # Return the path for database (just 'uploads/<sha256>.jpg')
+        return store_upload(file, filename)
     return None
 
 def delete_local_file(file_path):
-    """Delete file from local filesystem"""
+    """Retire an upload from local storage once nothing references it"""
     if file_path:
-        # Convert URL path to filesystem path
-        if file_path.startswith('uploads/'):
-            full_path = os.path.join(app.static_folder, file_path)
-        else:
-            full_path = file_path
-            
-        if os.path.exists(full_path):
-            try:
-                os.remove(full_path)
-                return True
-            except Exception as e:
-                app.logger.error(f"Error deleting file {full_path}: {e}")
+        try:
+            return discard_upload(file_path)
+        except Exception as e:
+            app.logger.error(f"Error deleting file {file_path}: {e}")
     return False
 
 # ============================================================================
@@ -525,35 +535,10 @@ def calculate_price(product, customization=None):
             size_id = customization.get('size_id')
             size_label = customization.get('size', '').strip()
 
-            from models import CuplockVerticalSize
-            
-            found_size = None
-
-            # PRIORITY 1: Lookup by ID
-            if size_id:
-                try:
-                    found_size = CuplockVerticalSize.query.get(int(size_id))
-                    if found_size and found_size.product_id != product.id:
-                        found_size = None
-                except (ValueError, TypeError):
-                    pass
-
-            # PRIORITY 2: Lookup by Label
-            if not found_size and size_label:
-                found_size = CuplockVerticalSize.query.filter_by(
-                    product_id=product.id,
-                    size_label=size_label,
-                    is_active=True
-                ).first()
-
-            # PRIORITY 3: Fallback
-            if not found_size:
-                found_size = CuplockVerticalSize.query.filter_by(
-                    product_id=product.id,
-                    is_active=True
-                ).first()
-                if found_size:
-                    app.logger.warning(f"Using fallback size {found_size.id} for product {product.id}")
+            # Sizes / cups / matrix are compiled once per catalog version
+            found_size, used_fallback = get_product_pricing(product).find_size(size_id, size_label)
+            if used_fallback:
+                app.logger.warning(f"Using fallback size {found_size.id} for product {product.id}")
 
             # CALCULATE
             if purchase_type == 'buy':
@@ -788,6 +773,21 @@ with app.app_context():
     except Exception as e:
         app.logger.error(f"Database creation error: {e}")
 
+    try:
+        ensure_catalog_version_row()
+    except Exception as e:
+        app.logger.error(f"Catalog version init error: {e}")
+
+    # Backfills are a deploy step (backfill_order_panels.py), not run by every worker
+    try:
+        pending = pending_order_backfills()
+        if pending:
+            app.logger.warning(f"Pending order backfills ({', '.join(pending)}); "
+                               "run python backfill_order_panels.py")
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Order backfill check error: {e}")
+
 def create_default_admins():
     """
     Create admin accounts ONLY if credentials are provided in .env file
@@ -954,7 +954,6 @@ def login():
             if user and user.check_password(password):
                 login_user(user)
                 session['user_type'] = 'user'
-                session['cart'] = session.get('cart', [])
                 session.permanent = True
                 return redirect(url_for('dashboard'))
 
@@ -1038,184 +1037,22 @@ def national_scaffoldings():
     try:
         # Get category filter from query params
         category = request.args.get('category', 'all')
+        cursor = request.args.get('cursor')
+        next_cursor = None
+        facets = {}
+        
+        # Facet filters (?price=500-2000&mode=rent ...); several values of one facet widen the match
+        filters = {
+            name: sorted({v.lower() for v in request.args.getlist(name) if v and v != 'all'})
+            for name in FACET_NAMES
+        }
+        filters = {name: values for name, values in filters.items() if values}
         
-        # Define scaffolding categories
-        scaffolding_categories = ['aluminium', 'h-frames', 'cuplock', 'accessories']
-        
-        # Build base query with error handling
-        try:
-            query = Product.query.filter(Product.is_active == True)
-            
-            # Filter by scaffolding categories (case-insensitive)
-            query = query.filter(
-                func.lower(Product.category).in_([c.lower() for c in scaffolding_categories])
-            )
-            
-            # Apply specific category filter if not 'all'
-            if category != 'all' and category:
-                query = query.filter(func.lower(Product.category) == category.lower())
-            
-            # Execute query
-            products = query.all()
-            
-            app.logger.info(f"✅ Loaded {len(products)} scaffolding products for category: {category}")
-            
-        except Exception as query_error:
-            app.logger.error(f"❌ Query error in national_scaffoldings: {query_error}", exc_info=True)
-            # Return empty list on query error
-            products = []
-            flash('Error loading products. Please try again.', 'error')
-        
-        # Process each product with individual error handling
-        for product in products:
-            try:
-                # =========================== 
-                # 1. PROCESS IMAGE URL
-                # =========================== 
-                if product.image_url:
-                    # Split comma-separated URLs
-                    image_urls = [url.strip() for url in product.image_url.split(',') if url.strip()]
-                    if image_urls:
-                        try:
-                            # Use get_image_url utility to process the first image
-                            product.display_image_url = get_image_url(image_urls[0])
-                        except Exception as img_error:
-                            app.logger.error(f"Error processing image for product {product.id}: {img_error}")
-                            product.display_image_url = '/static/images/no-image.png'
-                    else:
-                        product.display_image_url = '/static/images/no-image.png'
-                else:
-                    product.display_image_url = '/static/images/no-image.png'
-                
-                # =========================== 
-                # 2. CALCULATE DISPLAY PRICE
-                # =========================== 
-                # Handle VERTICAL CUPLOCK pricing
-                if product.category == 'cuplock' and product.cuplock_type == 'vertical':
-                    try:
-                        from models import CuplockVerticalSize
-                        
-                        # Get the minimum priced size
-                        min_size = CuplockVerticalSize.query.filter_by(
-                            product_id=product.id,
-                            is_active=True
-                        ).order_by(CuplockVerticalSize.buy_price.asc()).first()
-                        
-                        if min_size and min_size.buy_price:
-                            product.display_price = float(min_size.buy_price)
-                        else:
-                            product.display_price = 0
-                            
-                    except Exception as vertical_error:
-                        app.logger.error(f"Error loading vertical cuplock size for product {product.id}: {vertical_error}")
-                        product.display_price = 0
-                
-                # Handle LEDGER CUPLOCK pricing
-                elif product.category == 'cuplock' and product.cuplock_type == 'ledger':
-                    try:
-                        from models import CuplockLedgerSize
-                        
-                        # Get the minimum priced size
-                        min_size = CuplockLedgerSize.query.filter_by(
-                            product_id=product.id,
-                            is_active=True
-                        ).order_by(CuplockLedgerSize.buy_price.asc()).first()
-                        
-                        if min_size and min_size.buy_price and min_size.buy_price > 0:
-                            product.display_price = float(min_size.buy_price)
-                        else:
-                            # Fallback: try to get any size with a valid price
-                            any_size = CuplockLedgerSize.query.filter_by(
-                                product_id=product.id,
-                                is_active=True
-                            ).filter(CuplockLedgerSize.buy_price > 0).first()
-                            
-                            product.display_price = float(any_size.buy_price) if any_size else 0
-                            
-                    except Exception as ledger_error:
-                        app.logger.error(f"Error loading ledger cuplock size for product {product.id}: {ledger_error}")
-                        product.display_price = 0
-                
-                # Handle OTHER PRODUCTS (aluminium, h-frames, accessories)
-                else:
-                    try:
-                        product.display_price = float(product.price) if product.price else 0
-                    except (ValueError, TypeError):
-                        app.logger.error(f"Invalid price for product {product.id}")
-                        product.display_price = 0
-                
-                # =========================== 
-                # 3. ENSURE DESCRIPTION IS NOT NULL
-                # =========================== 
-                if product.description is None:
-                    product.description = ''
-                    
-            except Exception as product_error:
-                # Log error but continue processing other products
-                app.logger.error(
-                    f"Error processing product {product.id} ({product.name}): {product_error}",
-                    exc_info=True
-                )
-                # Set safe defaults
-                product.display_image_url = '/static/images/no-image.png'
-                product.display_price = 0
-                product.description = ''
-        
-        # =========================== 
-        # 4. RENDER TEMPLATE
-        # =========================== 
-        return render_template(
-            'national_scaffoldings.html',
-            products=products,
-            category=category
-        )
-        
-    except Exception as e:
-        # Critical error handler
-        app.logger.error(
-            f"❌ CRITICAL ERROR in national_scaffoldings route: {e}",
-            exc_info=True
-        )
-        
-        # Try to render template with empty products
-        try:
-            flash('An error occurred while loading products. Please try again.', 'error')
-            return render_template(
-                'national_scaffoldings.html',
-                products=[],
-                category='all'
-            )
-        except Exception:
-            # FIX APPLIED HERE: Added the missing except block
-            pass
-    """
-    National Scaffoldings product listing page
-    Displays all scaffolding products with proper error handling
-    """
-    try:
-        # Get category filter from query params
-        category = request.args.get('category', 'all')
-        
-        # Define scaffolding categories
-        scaffolding_categories = ['aluminium', 'h-frames', 'cuplock', 'accessories']
-        
-        # Build base query with error handling
+        # One page of card DTOs plus live facet counts from the catalog snapshot's bitsets
         try:
-            query = Product.query.filter(Product.is_active == True)
-            
-            # Filter by scaffolding categories (case-insensitive)
-            query = query.filter(
-                func.lower(Product.category).in_([c.lower() for c in scaffolding_categories])
-            )
-            
-            # Apply specific category filter if not 'all'
-            if category != 'all' and category:
-                query = query.filter(func.lower(Product.category) == category.lower())
-            
-            # Execute query
-            products = query.all()
+            products, next_cursor, facets = get_scaffolding_facets().search(filters, cursor)
             
-            app.logger.info(f"✅ Loaded {len(products)} scaffolding products for category: {category}")
+            app.logger.info(f"✅ Loaded {len(products)} scaffolding products for filters: {filters}")
             
         except Exception as query_error:
             app.logger.error(f"❌ Query error in national_scaffoldings: {query_error}", exc_info=True)
@@ -1223,108 +1060,17 @@ def national_scaffoldings():
             products = []
             flash('Error loading products. Please try again.', 'error')
         
-        # Process each product with individual error handling
-        for product in products:
-            try:
-                # =========================== 
-                # 1. PROCESS IMAGE URL
-                # =========================== 
-                if product.image_url:
-                    # Split comma-separated URLs
-                    image_urls = [url.strip() for url in product.image_url.split(',') if url.strip()]
-                    if image_urls:
-                        try:
-                            # Use get_image_url utility to process the first image
-                            product.display_image_url = get_image_url(image_urls[0])
-                        except Exception as img_error:
-                            app.logger.error(f"Error processing image for product {product.id}: {img_error}")
-                            product.display_image_url = '/static/images/no-image.png'
-                    else:
-                        product.display_image_url = '/static/images/no-image.png'
-                else:
-                    product.display_image_url = '/static/images/no-image.png'
-                
-                # =========================== 
-                # 2. CALCULATE DISPLAY PRICE
-                # =========================== 
-                # Handle VERTICAL CUPLOCK pricing
-                if product.category == 'cuplock' and product.cuplock_type == 'vertical':
-                    try:
-                        from models import CuplockVerticalSize
-                        
-                        # Get the minimum priced size
-                        min_size = CuplockVerticalSize.query.filter_by(
-                            product_id=product.id,
-                            is_active=True
-                        ).order_by(CuplockVerticalSize.buy_price.asc()).first()
-                        
-                        if min_size and min_size.buy_price:
-                            product.display_price = float(min_size.buy_price)
-                        else:
-                            product.display_price = 0
-                            
-                    except Exception as vertical_error:
-                        app.logger.error(f"Error loading vertical cuplock size for product {product.id}: {vertical_error}")
-                        product.display_price = 0
-                
-                # Handle LEDGER CUPLOCK pricing
-                elif product.category == 'cuplock' and product.cuplock_type == 'ledger':
-                    try:
-                        from models import CuplockLedgerSize
-                        
-                        # Get the minimum priced size
-                        min_size = CuplockLedgerSize.query.filter_by(
-                            product_id=product.id,
-                            is_active=True
-                        ).order_by(CuplockLedgerSize.buy_price.asc()).first()
-                        
-                        if min_size and min_size.buy_price and min_size.buy_price > 0:
-                            product.display_price = float(min_size.buy_price)
-                        else:
-                            # Fallback: try to get any size with a valid price
-                            any_size = CuplockLedgerSize.query.filter_by(
-                                product_id=product.id,
-                                is_active=True
-                            ).filter(CuplockLedgerSize.buy_price > 0).first()
-                            
-                            product.display_price = float(any_size.buy_price) if any_size else 0
-                            
-                    except Exception as ledger_error:
-                        app.logger.error(f"Error loading ledger cuplock size for product {product.id}: {ledger_error}")
-                        product.display_price = 0
-                
-                # Handle OTHER PRODUCTS (aluminium, h-frames, accessories)
-                else:
-                    try:
-                        product.display_price = float(product.price) if product.price else 0
-                    except (ValueError, TypeError):
-                        app.logger.error(f"Invalid price for product {product.id}")
-                        product.display_price = 0
-                
-                # =========================== 
-                # 3. ENSURE DESCRIPTION IS NOT NULL
-                # =========================== 
-                if product.description is None:
-                    product.description = ''
-                    
-            except Exception as product_error:
-                # Log error but continue processing other products
-                app.logger.error(
-                    f"Error processing product {product.id} ({product.name}): {product_error}",
-                    exc_info=True
-                )
-                # Set safe defaults
-                product.display_image_url = '/static/images/no-image.png'
-                product.display_price = 0
-                product.description = ''
-        
         # =========================== 
-        # 4. RENDER TEMPLATE
+        # RENDER TEMPLATE
         # =========================== 
         return render_template(
             'national_scaffoldings.html',
             products=products,
-            category=category
+            category=category,
+            cursor=cursor,
+            next_cursor=next_cursor,
+            facets=facets,
+            filters=filters
         )
         
     except Exception as e:
@@ -1340,38 +1086,100 @@ def national_scaffoldings():
             return render_template(
                 'national_scaffoldings.html',
                 products=[],
-                category='all'
+                category='all',
+                cursor=None,
+                next_cursor=None,
+                facets={},
+                filters={}
             )
         except Exception as render_error:
             # Last resort fallback
             app.logger.error(f"❌ Could not render template: {render_error}", exc_info=True)
             return "An error occurred while loading the page. Please try again later.", 500
         
+def product_page_url(product):
+    """Detail page of a listing card: scaffolding and fabrication products have their own"""
+    if (product.category or '').lower() in SCAFFOLDING_LISTING_CATEGORIES:
+        return url_for('product_detail', product_id=product.id)
+    return url_for('fabrication_detail', product_id=product.id)
+
+app.jinja_env.globals['product_page_url'] = product_page_url
+
+@app.route('/search')
+def search():
+    """Ranked product search over names, descriptions and size labels"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    products, has_next = [], False
+    try:
+        if query:
+            product_ids, has_next = search_product_ids(query, page)
+            products = get_listing_cards(product_ids)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Search error: {e}", exc_info=True)
+        flash('Search is unavailable right now. Please try again.', 'error')
+
+    return render_template('search.html', query=query, products=products, page=page, has_next=has_next)
+
+@app.route('/api/search')
+def api_search():
+    """JSON search results, one page at a time"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int) or SEARCH_PAGE_SIZE, 1), 100)
+    try:
+        product_ids, has_next = search_product_ids(query, page, per_page)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'page': page,
+            'has_next': has_next,
+            'results': [{
+                'id': card.id,
+                'name': card.name,
+                'category': card.category,
+                'cuplock_type': card.cuplock_type,
+                'price': card.display_price,
+                'image_url': card.display_image_url,
+                'url': product_page_url(card)
+            } for card in get_listing_cards(product_ids)]
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Search API error: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Search failed'}), 500
+
+@app.route('/api/suggest')
+def api_suggest():
+    """Search-box autocomplete, answered from the in-memory prefix index"""
+    # The index is kept current off the request path; tests sync it themselves
+    if not app.testing:
+        ensure_suggest_refresher(app)
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int) or SUGGEST_LIMIT, 1), 20)
+    try:
+        suggestions = [{
+            'label': item.label,
+            'kind': item.kind,
+            'url': product_page_url(item) if item.kind == 'product' else url_for('search', q=item.label)
+        } for item in suggest(query, limit)]
+        return jsonify({'success': True, 'query': query, 'suggestions': suggestions})
+    except Exception as e:
+        app.logger.error(f"Suggest API error: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Suggestions unavailable'}), 500
+
 @app.route('/cuplock-shop')
 def cuplock_shop():
     """Display all cuplock products"""
     try:
-        # Get vertical products
-        # Case-insensitive queries so database values like 'Cuplock' still match
-        vertical_products = Product.query.filter(
-            func.lower(Product.category) == 'cuplock',
-            func.lower(Product.cuplock_type) == 'vertical',
-            Product.is_active == True
-        ).all()
-
-        # Get ledger products
-        ledger_products = Product.query.filter(
-            func.lower(Product.category) == 'cuplock',
-            func.lower(Product.cuplock_type) == 'ledger',
-            Product.is_active == True
-        ).all()
-        
-        # ✅ Process images with local filesystem support
-        for product in vertical_products:
-            product.display_image_url = get_image_url(product.image_url)
-        
-        for product in ledger_products:
-            product.display_image_url = get_image_url(product.image_url)
+        # Case-insensitive match so database values like 'Cuplock' still match
+        cuplock_products = [
+            p for p in get_catalog_snapshot().products
+            if (p.category or '').lower() == 'cuplock'
+        ]
+        vertical_products = [p for p in cuplock_products if (p.cuplock_type or '').lower() == 'vertical']
+        ledger_products = [p for p in cuplock_products if (p.cuplock_type or '').lower() == 'ledger']
         
         return render_template('cuplock_shop.html',
                              vertical_products=vertical_products,
@@ -1458,30 +1266,15 @@ def add_to_cart():
         unit_price = float(price_data['price'])
         deposit = float(price_data.get('deposit', 0))
 
-        # Create cart item
-        cart_item = {
-            'product_id': product.id,
-            'product_name': product.name,
-            'category': product.category,
-            'product_type': product.product_type,
-            'quantity': quantity,
-            'unit_price': unit_price,
-            'item_total': unit_price * quantity,
-            'deposit': deposit,
-            'item_deposit': deposit * quantity,
-            'customization': customization,
-            'image_url': product.image_url
-        }
-
-        # Get existing cart or create new one
-        cart = session.get('cart', [])
-        cart.append(cart_item)
-        session['cart'] = cart
-        session.modified = True
+        # Stored server-side; the session only keeps the cart id
+        cart = get_cart(current_user.id, create=True)
+        add_cart_line(cart, product.id, product.name, product.category, product.product_type,
+                      quantity, unit_price, deposit, customization)
+        db.session.commit()
 
         return jsonify({
             'success': True,
-            'cart_count': len(cart),
+            'cart_count': cart.item_count,
             'message': 'Product added to cart',
             'item': {
                 'name': product.name,
@@ -1493,6 +1286,7 @@ def add_to_cart():
         })
 
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Add to cart error: {e}", exc_info=True)
         return jsonify({
             'success': False,
@@ -1507,37 +1301,28 @@ def cart():
             flash('Admins cannot make purchases', 'warning')
             return redirect(url_for('admin_scaffoldings'))
 
-        cart_items = session.get('cart', [])
+        cart = get_cart(current_user.id)
         enriched_cart = []
 
-        total_items_price = 0.0
-        total_deposit = 0.0
-
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-            if not product:
-                continue
-
-            unit_price = float(item.get('unit_price', 0))
-            item_total = float(item.get('item_total', 0))
-            deposit = float(item.get('deposit', 0))
-            item_deposit = float(item.get('item_deposit', 0))
-            quantity = item.get('quantity', 1)
-            customization = item.get('customization', {})
-
-            total_items_price += item_total
-            total_deposit += item_deposit
-
+        # Every product in one IN query; lines for deleted products are dropped
+        products = prune_cart(cart) if cart else {}
+        for line in cart.lines if cart else []:
+            product = products[line.product_id]
             enriched_cart.append({
                 'product_name': product.name,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'item_total': item_total,
-                'deposit': deposit,
-                'item_deposit': item_deposit,
-                'customization': customization,
+                'quantity': line.quantity,
+                'unit_price': float(line.unit_price),
+                'item_total': line.item_total,
+                'deposit': float(line.deposit),
+                'item_deposit': line.item_deposit,
+                'customization': line.customization or {},
                 'image_url': product.image_url
             })
+        db.session.commit()
+
+        # Running totals kept on the cart row
+        total_items_price = float(cart.subtotal) if cart else 0.0
+        total_deposit = float(cart.deposit_total) if cart else 0.0
 
         # ✅ GST LOGIC (ONLY HERE)
         GST_RATE = 0.18
@@ -1568,26 +1353,19 @@ def qr_scanner():
             flash('Admins cannot make purchases', 'warning')
             return redirect(url_for('admin_scaffoldings'))
         
-        cart_items = session.get('cart', [])
+        cart = get_cart(current_user.id)
         
-        if not cart_items:
+        if not cart or not cart.lines:
             flash('Your cart is empty', 'warning')
             return redirect(url_for('national_scaffoldings'))
         
-        # Read stored values (never recalculate)
-        total_items_price = 0.0
-        total_deposit = 0.0
+        prune_cart(cart)
+        db.session.commit()
+        cart_items = cart.lines
         
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-            if not product:
-                continue
-            
-            item_total = float(item.get('item_total', 0))
-            item_deposit = float(item.get('item_deposit', 0))
-            
-            total_items_price += item_total
-            total_deposit += item_deposit
+        # Read stored values (never recalculate)
+        total_items_price = float(cart.subtotal)
+        total_deposit = float(cart.deposit_total)
         
         # Validate totals
         if total_items_price <= 0:
@@ -1597,16 +1375,8 @@ def qr_scanner():
         gst = total_items_price * 0.18
         total_with_gst = total_items_price + total_deposit + gst
         
-        # Generate QR code
-        qr_data = f"upi://pay?pa=nationalscaffolding@phonepe&pn=The National Scaffolding&am={total_with_gst:.2f}&cu=INR"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        qr_code_base64 = base64.b64encode(buffered.getvalue()).decode()
+        # The QR image is rendered and cached separately by /payment_qr
+        qr_url = url_for('payment_qr', amount=format_upi_amount(total_with_gst))
         
         app.logger.info(
             f"[PAYMENT] User {current_user.id} | Total: ₹{total_with_gst:.2f}"
@@ -1618,7 +1388,8 @@ def qr_scanner():
             gst=gst,
             total_deposit=total_deposit,
             total_with_gst=total_with_gst,
-            qr_code=qr_code_base64,
+            qr_url=qr_url,
+            idempotency_key=uuid.uuid4().hex,
             cart_items=cart_items
         )
         
@@ -1627,34 +1398,76 @@ def qr_scanner():
         flash('Error loading payment page', 'error')
         return redirect(url_for('cart'))
 
+@app.route('/payment_qr/<amount>.svg')
+@login_required
+def payment_qr(amount):
+    """SVG UPI QR for an amount; cached in-process and revalidated by ETag"""
+    try:
+        value = float(amount)
+    except ValueError:
+        abort(404)
+    if not math.isfinite(value) or value <= 0:
+        abort(404)
+
+    payload = upi_payload(value)
+    response = Response(render_qr_svg(payload), mimetype='image/svg+xml')
+    response.set_etag(qr_etag(payload))
+    # The url carries the amount, so its image never changes
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response.make_conditional(request)
+
 # ============================================================================
 # CRITICAL FIX #1: complete_order Route
 # Replace your existing @app.route('/complete_order', methods=['POST']) with this
 # ============================================================================
 
+def placed_order_response(order, idempotency_key):
+    """Response for a placed order; retries with the same key get it again"""
+    return jsonify({
+        'success': True,
+        'message': 'Order placed successfully',
+        'order_id': order.id,
+        'total_paid': float(order.total_price),
+        'idempotency_key': idempotency_key
+    }), 200
+
+def find_checkout_order(transaction_id, idempotency_key):
+    """(order placed with this key by the current user, transaction_id taken by another order)"""
+    matches = Order.query.filter(or_(
+        Order.idempotency_key == idempotency_key,
+        Order.transaction_id == transaction_id
+    )).all()
+    for order in matches:
+        if order.idempotency_key == idempotency_key and order.user_id == current_user.id:
+            return order, False
+    return None, bool(matches)
+
 @app.route('/complete_order', methods=['POST'])
 @login_required
 def complete_order():
     try:
         data = request.get_json(silent=True) or {}
         transaction_id = str(data.get('transaction_id', '')).strip()
+        # Issued by the payment page; a double submit or retry sends the same key
+        idempotency_key = str(
+            data.get('idempotency_key') or request.headers.get('Idempotency-Key') or ''
+        ).strip()[:64] or uuid.uuid4().hex
 
         if not transaction_id:
             return jsonify({'success': False, 'message': 'Transaction ID required'}), 400
 
-        existing = Order.query.filter_by(transaction_id=transaction_id).first()
-        if existing:
+        placed, transaction_used = find_checkout_order(transaction_id, idempotency_key)
+        if placed:
+            return placed_order_response(placed, idempotency_key)
+        if transaction_used:
             return jsonify({'success': False, 'message': 'Transaction ID already used'}), 400
 
-        cart = session.get('cart', [])
-        if not cart:
+        cart = get_cart(current_user.id)
+        if not cart or not cart.lines:
             return jsonify({'success': False, 'message': 'Cart is empty'}), 400
 
-        subtotal = 0.0
-        deposit_total = 0.0
-        for item in cart:
-            subtotal += float(item.get('item_total', 0))
-            deposit_total += float(item.get('item_deposit', 0))
+        subtotal = float(cart.subtotal)
+        deposit_total = float(cart.deposit_total)
 
         GST_RATE = 0.18
         gst_amount = round(subtotal * GST_RATE, 2)
@@ -1663,37 +1476,48 @@ def complete_order():
         if total_price <= 0:
             return jsonify({'success': False, 'message': 'Invalid amount'}), 400
 
+        products = cart_products(cart)
+        item_rows = [
+            dict(
+                product_id=line.product_id,
+                product_name=line.product_name or 'Unknown',
+                quantity=line.quantity,
+                price=float(line.unit_price),
+                customization=line.customization or {},
+                **order_item_snapshot(products.get(line.product_id))
+            )
+            for line in cart.lines
+        ]
+
         order = Order(
             user_id=current_user.id,
             total_price=total_price,
             status='pending_verification',
-            transaction_id=transaction_id
+            transaction_id=transaction_id,
+            idempotency_key=idempotency_key,
+            panel_mask=order_panel_mask(row['panel'] for row in item_rows)
         )
-
         db.session.add(order)
         db.session.flush()
 
-        for item in cart:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=int(item.get('product_id')),
-                product_name=str(item.get('product_name', 'Unknown')),
-                quantity=int(item.get('quantity', 1)),
-                price=float(item.get('unit_price', 0)),
-                customization=item.get('customization', {})
-            )
-            db.session.add(order_item)
+        # One executemany for every item instead of an ORM flush per object
+        for row in item_rows:
+            row['order_id'] = order.id
+        db.session.execute(insert(OrderItem), item_rows)
 
+        record_order_placed(order)
+        clear_cart(cart)
         db.session.commit()
-        session.pop('cart', None)
-        session.modified = True
 
-        return jsonify({
-            'success': True,
-            'message': 'Order placed successfully',
-            'order_id': order.id,
-            'total_paid': total_price
-        }), 200
+        return placed_order_response(order, idempotency_key)
+
+    except IntegrityError:
+        # Lost a race with a concurrent submit of the same key or transaction ID
+        db.session.rollback()
+        placed, _ = find_checkout_order(transaction_id, idempotency_key)
+        if placed:
+            return placed_order_response(placed, idempotency_key)
+        return jsonify({'success': False, 'message': 'Transaction ID already used'}), 400
 
     except Exception as e:
         db.session.rollback()
@@ -1724,13 +1548,13 @@ def my_orders():
 @login_required
 def remove_from_cart(index):
     try:
-        cart = session.get('cart', [])
-        if 0 <= index < len(cart):
-            cart.pop(index)
-            session['cart'] = cart
-            session.modified = True
+        cart = get_cart(current_user.id)
+        if cart and 0 <= index < len(cart.lines):
+            remove_cart_line(cart, cart.lines[index])
+            db.session.commit()
         return redirect(url_for('cart'))
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Remove from cart error: {e}")
         return redirect(url_for('cart'))
 
@@ -1760,7 +1584,8 @@ def admin_complete_order(order_id):
         if session.get('user_type') != 'admin':
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
 
-        order = Order.query.get_or_404(order_id)
+        # Row lock so a concurrent verify / complete cannot move the rollups from the same status twice
+        order = Order.query.filter_by(id=order_id).with_for_update().populate_existing().first_or_404()
 
         if order.status != 'approved':
             return jsonify({
@@ -1769,6 +1594,7 @@ def admin_complete_order(order_id):
             }), 400
 
         order.status = 'completed'
+        record_order_status_change(order, 'approved')
         db.session.commit()
 
         return jsonify({
@@ -1803,6 +1629,7 @@ def edit_scaffolding_product(product_id):
               product.deposit_amount = float(request.form.get('deposit_amount', product.deposit_amount or 0))
               product.weight_per_unit = float(request.form.get('weight_per_unit', product.weight_per_unit or 0))
               
+              catalog_changed(product.id)
               db.session.commit()
               flash('Product updated successfully!', 'success')
               return redirect(url_for('admin_scaffoldings'))
@@ -1850,24 +1677,15 @@ def debug_cuplock_ledger(product_id):
 def cuplock_products():
     """List all Cuplock products"""
     try:
-        vertical_products = Product.query.filter_by(
-            category='cuplock',
-            cuplock_type='vertical',
-            is_active=True
-        ).all()
-
-        ledger_products = Product.query.filter_by(
-            category='cuplock',
-            cuplock_type='ledger',
-            is_active=True
-        ).all()
-        
-        # Add display_image_url to each product for template rendering
-        for product in vertical_products:
-            product.display_image_url = get_image_url(product.image_url)
-        
-        for product in ledger_products:
-            product.display_image_url = get_image_url(product.image_url)
+        snapshot = get_catalog_snapshot()
+        vertical_products = [
+            p for p in snapshot.products
+            if p.category == 'cuplock' and p.cuplock_type == 'vertical'
+        ]
+        ledger_products = [
+            p for p in snapshot.products
+            if p.category == 'cuplock' and p.cuplock_type == 'ledger'
+        ]
 
         return render_template(
             'cuplock_products.html',
@@ -2067,6 +1885,34 @@ def admin_scaffoldings():
 # Replace your existing @app.route('/admin_orders') with this
 # ============================================================================
 
+ADMIN_ORDERS_PAGE_SIZE = 50
+
+def admin_orders_panel_filter(panel_type):
+    """Orders an admin panel sees: pending verification, orders without items,
+    and orders with at least one item from the panel (Order.panel_mask)"""
+    conditions = [Order.status == 'pending_verification', ~Order.items.any()]
+    panel_filter = panel_mask_filter(panel_type)
+    if panel_filter is not None:
+        conditions.append(panel_filter)
+    return or_(*conditions)
+
+def admin_order_filters(panel_type, start, end):
+    """Panel and date conditions shared by the order list and its export"""
+    filters = [admin_orders_panel_filter(panel_type)]
+    if start:
+        filters.append(Order.order_date >= start)
+    if end:
+        filters.append(Order.order_date < end)
+    return filters
+
+def parse_order_cursor(value):
+    """'<iso order_date>_<id>' from the "older orders" link -> (datetime, id), or None"""
+    try:
+        date_part, id_part = (value or '').rsplit('_', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
 @app.route('/admin_orders')
 @login_required
 def admin_orders():
@@ -2075,43 +1921,75 @@ def admin_orders():
             return redirect(url_for('dashboard'))
         
         panel_type = session.get('panel_type')
-        all_orders = Order.query.order_by(Order.order_date.desc()).all()
-        filtered_orders = []
-        
-        scaffolding_cats = ['aluminium', 'h-frames', 'cuplock', 'accessories']
-        fabrication_cats = ['steel', 'custom', 'parts', 'fabrication', 'fabrications']
-        
-        for order in all_orders:
-            if order.status == 'pending_verification':
-                filtered_orders.append(order)
-                continue
-            
-            if not order.items:
-                filtered_orders.append(order)
-                continue
-            
-            if panel_type == 'scaffolding':
-                for item in order.items:
-                    product = Product.query.get(item.product_id)
-                    if product and product.category in scaffolding_cats:
-                        filtered_orders.append(order)
-                        break
-                        
-            elif panel_type == 'fabrication':
-                for item in order.items:
-                    product = Product.query.get(item.product_id)
-                    if product and product.category in fabrication_cats:
-                        filtered_orders.append(order)
-                        break
-        
-        for order in filtered_orders:
+        status = request.args.get('status', '')
+        start_date = request.args.get('start', '')
+        end_date = request.args.get('end', '')
+        start, end = parse_date_range(start_date, end_date)
+
+        filters = admin_order_filters(panel_type, start, end)
+
+        # Counts for the summary cards: one GROUP BY over the same filters
+        status_counts = dict(
+            db.session.query(Order.status, func.count(Order.id))
+            .filter(*filters).group_by(Order.status).all()
+        )
+
+        if status:
+            filters.append(Order.status == status)
+        cursor = parse_order_cursor(request.args.get('before'))
+        if cursor:
+            filters.append(tuple_(Order.order_date, Order.id) < cursor)
+
+        # Keyset page on (order_date, id); users and items loaded in two IN queries
+        orders = Order.query.options(
+            selectinload(Order.user),
+            selectinload(Order.items)
+        ).filter(*filters).order_by(
+            Order.order_date.desc(), Order.id.desc()
+        ).limit(ADMIN_ORDERS_PAGE_SIZE + 1).all()
+
+        next_cursor = None
+        if len(orders) > ADMIN_ORDERS_PAGE_SIZE:
+            orders = orders[:ADMIN_ORDERS_PAGE_SIZE]
+            next_cursor = f"{orders[-1].order_date.isoformat()}_{orders[-1].id}"
+
+        for order in orders:
             order.display_time = utc_to_ist(order.order_date)
         
-        return render_template('admin_orders.html', orders=filtered_orders)
+        return render_template('admin_orders.html', orders=orders, status_counts=status_counts,
+                               next_cursor=next_cursor, is_first_page=cursor is None,
+                               status=status, start_date=start_date, end_date=end_date)
         
     except Exception as e:
         app.logger.error(f"Admin orders error: {e}", exc_info=True)
-        return render_template('admin_orders.html', orders=[])
+        return render_template('admin_orders.html', orders=[], status_counts={}, next_cursor=None,
+                               is_first_page=True, status='', start_date='', end_date='')
+
+@app.route('/admin_orders/export')
+@login_required
+def admin_orders_export():
+    """Stream the filtered orders as CSV (default) or ?format=xlsx for accounting"""
+    if session.get('user_type') != 'admin':
+        return redirect(url_for('dashboard'))
+
+    status = request.args.get('status', '')
+    start, end = parse_date_range(request.args.get('start', ''), request.args.get('end', ''))
+    filters = admin_order_filters(session.get('panel_type'), start, end)
+    if status:
+        filters.append(Order.status == status)
+
+    filename = f"orders_{datetime.now(IST).strftime('%Y%m%d_%H%M')}"
+    if request.args.get('format') == 'xlsx':
+        body = stream_orders_xlsx(filters, IST)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename += '.xlsx'
+    else:
+        body = stream_orders_csv(filters, IST)
+        mimetype = 'text/csv'
+        filename += '.csv'
+
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @app.route('/admin_analytics')
 @login_required
@@ -2121,63 +1999,17 @@ def admin_analytics():
             return redirect(url_for('dashboard'))
         
         panel_type = session.get('panel_type')
-        
-        # Filter orders based on admin panel type
-        if panel_type == 'scaffolding':
-            # Scaffolding admin: Orders containing scaffolding products
-            scaffolding_categories = ['aluminium', 'h-frames', 'cuplock', 'accessories', 'vertical']
-            orders = db.session.query(Order).join(OrderItem).join(Product).filter(
-                Product.category.in_(scaffolding_categories)
-            ).distinct().all()
-        elif panel_type == 'fabrication':
-            # Fabrication admin: Orders containing fabrication products
-            fabrication_categories = ['steel', 'custom', 'parts', 'fabrication', 'fabrications']
-            orders = db.session.query(Order).join(OrderItem).join(Product).filter(
-                Product.category.in_(fabrication_categories)
-            ).distinct().all()
-        else:
-            orders = Order.query.all()
-        
-        monthly_data = {}
-        yearly_data = {}
-        category_data = {}
-        
-        for order in orders:
-            month_key = order.order_date.strftime('%Y-%m')
-            if month_key not in monthly_data:
-                monthly_data[month_key] = {'revenue': 0, 'orders': 0}
-            monthly_data[month_key]['revenue'] += float(order.total_price)
-            monthly_data[month_key]['orders'] += 1
-            
-            year_key = order.order_date.strftime('%Y')
-            if year_key not in yearly_data:
-                yearly_data[year_key] = {'revenue': 0, 'orders': 0}
-            yearly_data[year_key]['revenue'] += float(order.total_price)
-            yearly_data[year_key]['orders'] += 1
-            
-            # Fix: Use OrderItem.query.filter_by() instead of order.items
-            order_items = OrderItem.query.filter_by(order_id=order.id).all()
-            for item in order_items:
-                product = Product.query.get(item.product_id)
-                if product:
-                    category = product.category or 'Other'
-                    if category not in category_data:
-                        category_data[category] = {'revenue': 0, 'quantity': 0}
-                    
-                    price_data = calculate_price(product, item.customization or {})
-                    unit_price = price_data['price']
-                    category_data[category]['revenue'] += unit_price * item.quantity 
-                    category_data[category]['quantity'] += item.quantity
-        
-        sorted_months = sorted(monthly_data.keys())
-        total_revenue = sum(order.total_price for order in orders)
-        total_orders = len(orders)
-        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-        
-        return render_template('admin_analytics.html', monthly_data=monthly_data, yearly_data=yearly_data, category_data=category_data, sorted_months=sorted_months, total_revenue=total_revenue, total_orders=total_orders, avg_order_value=avg_order_value)
+        start_date = request.args.get('start', '')
+        end_date = request.args.get('end', '')
+        start, end = parse_date_range(start_date, end_date)
+
+        # Pre-aggregated daily rollups, kept current by complete_order / verify_payment
+        data = order_analytics(panel_type, start, end)
+
+        return render_template('admin_analytics.html', start_date=start_date, end_date=end_date, **data)
     except Exception as e:
         app.logger.error(f"Admin analytics error: {e}")
-        return render_template('admin_analytics.html', monthly_data={}, yearly_data={}, category_data={}, sorted_months=[], total_revenue=0, total_orders=0, avg_order_value=0)
+        return render_template('admin_analytics.html', monthly_data={}, yearly_data={}, category_data={}, sorted_months=[], total_revenue=0, total_orders=0, avg_order_value=0, start_date='', end_date='')
 
 @app.route('/admin_logout')
 @login_required
@@ -2222,20 +2054,15 @@ def admin_add_fabrication_product():
             
             for image in images:
                 if image and image.filename:
-                    filename = secure_filename(image.filename)
-                    unique_filename = f"{uuid.uuid4().hex}_{filename}"
-                    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                        os.makedirs(app.config['UPLOAD_FOLDER'])
-                    
-                    image_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                    image.save(image_path)
-                    image_urls.append(f"uploads/{unique_filename}")
+                    image_urls.append(store_upload(image, image.filename))
             
             if image_urls:
-                new_product.image_url = ','.join(image_urls)
+                set_product_images(new_product, image_urls)
         
         # Save to database
         db.session.add(new_product)
+        db.session.flush()
+        catalog_changed(new_product.id)
         db.session.commit()
         
         app.logger.info(f"Added new fabrication product: {name}")
@@ -2309,14 +2136,13 @@ def admin_add_product():
             for file in uploaded_files:
                 if file and file.filename and allowed_file(file.filename):
                     filename = secure_filename(file.filename)
-                    unique_name = f"{uuid.uuid4().hex}_{filename}"
                     
                     # ✅ Upload to local filesystem
-                    file_path = upload_file_locally(file, unique_name)
+                    file_path = upload_file_locally(file, filename)
                     if file_path:
                         image_urls.append(file_path)
 
-        product.image_url = ','.join(image_urls) if image_urls else 'images/no-image.png'
+        set_product_images(product, image_urls, placeholder=PLACEHOLDER_IMAGE)
 
         db.session.add(product)
         db.session.flush()
@@ -2353,6 +2179,7 @@ def admin_add_product():
             if size_count == 0:
                 flash('Ledger product created, but no sizes were added.', 'warning')
 
+        catalog_changed(product.id)
         db.session.commit()
 
         if category == 'cuplock' and cuplock_type == 'ledger':
@@ -2530,45 +2357,20 @@ def debug_fabrication_products():
 def fabrications():
     try:
         category_filter = request.args.get('category', 'all')
+        cursor = request.args.get('cursor')
         
-        # ✅ Define scaffolding categories to EXCLUDE
-        scaffolding_categories = ['aluminium', 'h-frames', 'cuplock', 'accessories']
-        
-        # ✅ Query for NON-scaffolding products
-        query = Product.query.filter(
-            Product.category.notin_(scaffolding_categories),
-            Product.is_active == True
-        )
-        
-        # Apply category filter if specified
-        if category_filter != 'all' and category_filter:
-            query = query.filter(Product.category == category_filter)
-        
-        products = query.order_by(Product.id.desc()).all()
-        
-        # ✅ Process images for each product
-        for product in products:
-            if product.image_url:
-                image_list = [img.strip() for img in product.image_url.split(',') if img.strip()]
-                if image_list:
-                    product.display_image_url = get_image_url(image_list[0])
-                else:
-                    product.display_image_url = '/static/images/no-image.png'
-            else:
-                product.display_image_url = '/static/images/no-image.png'
-            
-            # Ensure price is valid
-            try:
-                product.price = float(product.price or 0)
-            except (ValueError, TypeError):
-                product.price = 0.0
+        # ✅ NON-scaffolding products, one keyset page by category then newest first
+        category_key = category_filter if category_filter and category_filter != 'all' else None
+        products, next_cursor = get_catalog_listing('fabrication').page(category_key, cursor)
         
         app.logger.info(f"📦 Loaded {len(products)} fabrication products")
         
         return render_template(
             'fabrications.html',
             products=products,
-            category=category_filter
+            category=category_filter,
+            cursor=cursor,
+            next_cursor=next_cursor
         )
         
     except Exception as e:
@@ -2577,7 +2379,9 @@ def fabrications():
         return render_template(
             'fabrications.html',
             products=[],
-            category='all'
+            category='all',
+            cursor=None,
+            next_cursor=None
         )
 
 # Replace your fabrication_detail route in app.py with this fixed version:
@@ -2726,6 +2530,7 @@ def fix_vertical_product_162():
             db.session.add(new_size)
             added_sizes.append(size_data)
         
+        catalog_changed(162)
         db.session.commit()
         
         return jsonify({
@@ -2796,6 +2601,7 @@ def fix_vertical_product_generic(product_id):
             )
             db.session.add(new_size)
         
+        catalog_changed(product_id)
         db.session.commit()
         
         return jsonify({
@@ -2911,6 +2717,7 @@ def fix_vertical_product_generic(product_id):
             )
             db.session.add(new_size)
         
+        catalog_changed(162)
         db.session.commit()
         
         return jsonify({
@@ -2953,6 +2760,7 @@ def fix_fabrication_categories():
                 })
         
         if updated_count > 0:
+            catalog_changed(*[p['id'] for p in updated_products])
             db.session.commit()
             return jsonify({
                 'success': True,
@@ -3003,6 +2811,7 @@ def create_test_fabrication_products():
         ]
         
         created_products = []
+        new_products = []
         for prod_data in test_products:
             # Check if already exists
             existing = Product.query.filter_by(name=prod_data['name']).first()
@@ -3018,7 +2827,10 @@ def create_test_fabrication_products():
                 )
                 db.session.add(new_product)
                 created_products.append(prod_data['name'])
+                new_products.append(new_product)
         
+        db.session.flush()
+        catalog_changed(*[p.id for p in new_products])
         db.session.commit()
         
         return jsonify({
@@ -3115,6 +2927,7 @@ def edit_ledger_sizes(product_id):
                     )
                     db.session.add(new_size)
             
+            catalog_changed(product.id)
             db.session.commit()
             flash('Product sizes updated successfully!', 'success')
             return redirect(url_for('admin_scaffoldings'))
@@ -3145,6 +2958,7 @@ def delete_ledger_size(size_id):
         size_name = size.size_label
         
         db.session.delete(size)
+        catalog_changed(product_id)
         db.session.commit()
         
         flash(f'Size "{size_name}" deleted successfully', 'success')
@@ -3178,7 +2992,7 @@ def admin_update_product(product_id):
             existing_list = []
 
         # Determine which images were removed
-        current_list = [u for u in (product.image_url or '').split(',') if u.strip()]
+        current_list = product_image_paths(product)
         removed_images = [img for img in current_list if img not in existing_list]
 
         # ✅ Upload new images to local filesystem
@@ -3189,10 +3003,9 @@ def admin_update_product(product_id):
             for file in uploaded_files:
                 if file and file.filename and allowed_file(file.filename):
                     filename = secure_filename(file.filename)
-                    unique_name = f"{uuid.uuid4().hex}_{filename}"
                     
                     # ✅ Upload to local filesystem
-                    file_path = upload_file_locally(file, unique_name)
+                    file_path = upload_file_locally(file, filename)
                     
                     if file_path:
                         new_urls.append(file_path)
@@ -3200,13 +3013,9 @@ def admin_update_product(product_id):
                     else:
                         app.logger.error(f"Failed to upload {filename} to local filesystem")
 
-        # ✅ Delete removed images from local filesystem
-        for img in removed_images:
-            delete_local_file(img)
-
         # Update product image URLs
         merged_urls = existing_list + new_urls
-        product.image_url = ','.join(merged_urls) if merged_urls else 'images/no-image.png'
+        set_product_images(product, merged_urls, placeholder=PLACEHOLDER_IMAGE)
 
         # Update other product fields
         product.name = request.form.get('name')
@@ -3254,7 +3063,13 @@ def admin_update_product(product_id):
             except Exception as e:
                 app.logger.error(f"Error parsing pricing matrix: {e}")
         
+        catalog_changed(product.id)
         db.session.commit()
+        
+        # ✅ Delete removed images from local filesystem (only if unused now)
+        for img in removed_images:
+            delete_local_file(img)
+        
         app.logger.info(f"Product {product_id} updated. image_url={product.image_url}")
         return jsonify({'success': True})
         
@@ -3424,7 +3239,8 @@ def api_product_images(product_id):
         if not product:
             return jsonify({'success': False, 'message': 'Product not found'}), 404
         
-        if not product.image_url:
+        images = product_image_paths(product)
+        if not images:
             return jsonify({
                 'success': True,
                 'product_id': product_id,
@@ -3433,13 +3249,22 @@ def api_product_images(product_id):
                 'image_count': 0
             })
         
-        images = [url.strip() for url in product.image_url.split(',') if url.strip()]
-        
         return jsonify({
             'success': True,
             'product_id': product_id,
             'product_name': product.name,
             'images': images,
+            'image_details': [
+                {
+                    'path': img.path,
+                    'position': img.position,
+                    'width': img.width,
+                    'height': img.height,
+                    'bytes': img.bytes,
+                    'format': img.format
+                }
+                for img in product.images
+            ],
             'image_count': len(images),
             'raw_image_url': product.image_url
         })
@@ -3447,6 +3272,29 @@ def api_product_images(product_id):
         app.logger.error(f"API product images error: {e}")
         return jsonify({'error': str(e)})
 
+def image_diagnostics_targets(full=False):
+    """(id, name, category, [images]) for every product with images, loaded
+    up front so the diagnostics engine never touches the session. Rows with
+    metadata stored at upload come as ready diagnostics; only the rest (and
+    everything when `full`) are file paths for the engine to decode."""
+    products = Product.query.options(selectinload(Product.images)).order_by(Product.id).all()
+    targets = []
+    for product in products:
+        images = []
+        if product.images:
+            for row in product.images:
+                if row.bytes is not None and not full:
+                    images.append(image_row_diagnostic(row))
+                else:
+                    images.append(os.path.join(app.static_folder, row.path.lstrip('/')))
+        else:
+            # uploads/xyz.png → static/uploads/xyz.png
+            images = [os.path.join(app.static_folder, img_url.lstrip('/'))
+                      for img_url in product_image_paths(product)]
+        if images:
+            targets.append((product.id, product.name, product.category, images))
+    return targets
+
 @app.route('/admin_image_diagnostics')
 @login_required
 def admin_image_diagnostics():
@@ -3454,64 +3302,41 @@ def admin_image_diagnostics():
         if session.get('user_type') != 'admin':
             return jsonify({'success': False, 'message': 'Admin access required'}), 403
 
-        products = Product.query.all()
-
-        diagnostics = {
-            'total_products': len(products),
-            'products': [],
-            'summary': {
-                'total_images': 0,
-                'valid_images': 0,
-                'missing_images': 0,
-                'corrupted_images': 0,
-                'total_size_mb': 0
-            }
-        }
-
-        for product in products:
-            if not product.image_url:
-                continue
-
-            images = [u.strip() for u in product.image_url.split(',') if u.strip()]
-            if not images:
-                continue
-
-            product_diag = {
-                'product_id': product.id,
-                'product_name': product.name,
-                'category': product.category,
-                'images': []
-            }
-
-            for img_url in images:
-                filepath = img_url.lstrip('/')  # uploads/xyz.png → static/uploads/xyz.png
-                filepath = os.path.join(app.static_folder, filepath)
-
-                img_info = validate_image_file(filepath)
-                product_diag['images'].append(img_info)
+        full = request.args.get('full') == '1'
+        diagnostics = {'products': []}
+        for result in run_image_diagnostics(image_diagnostics_targets(full), full=full):
+            if result.pop('type') == 'summary':
+                diagnostics['total_products'] = result.pop('total_products')
+                diagnostics['summary'] = result
+            else:
+                diagnostics['products'].append(result)
 
-                diagnostics['summary']['total_images'] += 1
+        return jsonify({'success': True, 'data': diagnostics})
 
-                if img_info['valid']:
-                    diagnostics['summary']['valid_images'] += 1
-                elif not img_info['exists']:
-                    diagnostics['summary']['missing_images'] += 1
-                else:
-                    diagnostics['summary']['corrupted_images'] += 1
+    except Exception as e:
+        app.logger.error(f"Admin image diagnostics error: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Error running diagnostics'}), 500
 
-                diagnostics['summary']['total_size_mb'] += img_info['size_bytes'] / (1024 * 1024)
+@app.route('/admin_image_diagnostics/stream')
+@login_required
+def admin_image_diagnostics_stream():
+    """Same checks as /admin_image_diagnostics, one NDJSON line per product as it finishes"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
 
-            diagnostics['products'].append(product_diag)
+    full = request.args.get('full') == '1'
+    targets = image_diagnostics_targets(full)
 
-        diagnostics['summary']['total_size_mb'] = round(
-            diagnostics['summary']['total_size_mb'], 2
-        )
+    def generate():
+        try:
+            for result in run_image_diagnostics(targets, full=full):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            app.logger.error(f"Streaming image diagnostics error: {e}", exc_info=True)
+            yield json.dumps({'type': 'error', 'message': 'Error running diagnostics'}) + '\n'
 
-        return jsonify({'success': True, 'data': diagnostics})
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-    except Exception as e:
-        app.logger.error(f"Admin image diagnostics error: {e}", exc_info=True)
-        return jsonify({'success': False, 'message': 'Error running diagnostics'}), 500
 @app.route('/admin_image_diagnostics/product/<int:product_id>')
 @login_required
 def admin_image_diagnostics_product(product_id):
@@ -3521,8 +3346,6 @@ def admin_image_diagnostics_product(product_id):
 
         product = Product.query.get_or_404(product_id)
 
-        images = [u.strip() for u in (product.image_url or '').split(',') if u.strip()]
-
         diagnostics = {
             'product_id': product.id,
             'product_name': product.name,
@@ -3537,11 +3360,7 @@ def admin_image_diagnostics_product(product_id):
             }
         }
 
-        for img_url in images:
-            filepath = img_url.lstrip('/')
-            filepath = os.path.join(app.static_folder, filepath)
-
-            img_info = validate_image_file(filepath)
+        for img_info in product_image_diagnostics(product):
             diagnostics['images'].append(img_info)
 
             diagnostics['summary']['total_images'] += 1
@@ -3584,6 +3403,7 @@ def admin_update_pricing_matrix(product_id):
         
         flag_modified(product, 'customization_options')
         
+        catalog_changed(product.id)
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Pricing matrix updated successfully'})
@@ -3609,15 +3429,12 @@ def admin_remove_photo(product_id):
         if not image_url:
             return jsonify({'success': False, 'message': 'No image_url provided'}), 400
 
-        current = [u for u in (product.image_url or '').split(',') if u.strip()]
-        if image_url in current:
-            # ✅ Delete from local filesystem
-            delete_local_file(image_url)
-
-            current.remove(image_url)
-            product.image_url = ','.join(current) if current else 'images/no-image.png'
-
+        if remove_product_image(product, image_url, placeholder=PLACEHOLDER_IMAGE):
+            catalog_changed(product.id)
             db.session.commit()
+
+            # ✅ Delete from local filesystem once no product uses it
+            delete_local_file(image_url)
             return jsonify({'success': True, 'message': 'Photo removed successfully'})
 
         return jsonify({'success': False, 'message': 'Image not found'}), 404
@@ -3648,20 +3465,10 @@ def admin_delete_product(product_id):
         product_name = product.name
         app.logger.info(f"Found product: {product_name} (ID: {product.id})")
         
-        # Delete associated images
-        if product.image_url:
-            image_paths = product.image_url.split(',')
-            for img_path in image_paths:
-                try:
-                    old_image_path = os.path.join(app.static_folder, img_path.strip().lstrip('/'))
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-                        app.logger.info(f"Deleted image file: {old_image_path}")
-                except Exception as e:
-                    app.logger.error(f"Error removing file {old_image_path}: {e}")
-        
         # Delete product (This action now triggers CASCADE DELETE in database)
+        # The row stays (soft delete), so its images stay referenced and on disk
         product.is_active = False
+        catalog_changed(product.id)
         db.session.commit()
         
         app.logger.info(f"Successfully deleted product: {product_name} (ID: {product.id}) and its associated order items.")
@@ -3733,6 +3540,7 @@ def admin_update_aluminium_pricing():
                 
                 flag_modified(product, 'customization_options')
         
+        catalog_changed(*[int(pid) for pid in pricing_data.keys()])
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Aluminium pricing updated successfully'})
@@ -3779,6 +3587,7 @@ def admin_update_hframes_pricing():
                 
                 flag_modified(product, 'customization_options')
         
+        catalog_changed(*[int(pid) for pid in pricing_data.keys()])
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'H-Frames pricing updated successfully'})
@@ -3825,6 +3634,7 @@ def admin_update_accessories_pricing():
                 
                 flag_modified(product, 'customization_options')
         
+        catalog_changed(*[int(pid) for pid in pricing_data.keys()])
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Accessories pricing updated successfully'})
@@ -3892,7 +3702,9 @@ def verify_payment(order_id):
         if session.get('user_type') != 'admin':
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
-        order = Order.query.get_or_404(order_id)
+        # Row lock so a concurrent verify / complete cannot move the rollups from the same status twice
+        order = Order.query.filter_by(id=order_id).with_for_update().populate_existing().first_or_404()
+        old_status = order.status
         data = request.json or {}
         action = data.get('action')
         
@@ -3937,6 +3749,7 @@ def verify_payment(order_id):
             # Amount matches exactly - approve the order
             order.amount_paid = amount_paid_rounded
             order.status = 'completed'
+            record_order_status_change(order, old_status)
             db.session.commit()
             
             app.logger.info(f"Order {order_id} approved by admin {current_user.username}. Amount verified: ₹{amount_paid_rounded:.2f}")
@@ -3951,6 +3764,7 @@ def verify_payment(order_id):
             reason = data.get('reason', 'Payment verification failed')
             
             order.status = 'rejected'
+            record_order_status_change(order, old_status)
             db.session.commit()
             
             app.logger.info(f"Order {order_id} rejected by admin {current_user.username}. Reason: {reason}")
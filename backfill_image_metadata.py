@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""Fill in dominant colour / content hash for ProductImage rows created before they were stored"""
+
+from app import app, db
+from models import ProductImage
+from catalog import bump_catalog_version
+from product_images import read_image_metadata
+
+def backfill_image_metadata(batch_size=100):
+    with app.app_context():
+        rows = ProductImage.query.filter(
+            db.or_(ProductImage.sha256.is_(None), ProductImage.dominant_color.is_(None))
+        ).order_by(ProductImage.id).all()
+
+        print(f'\nReading metadata for {len(rows)} images')
+        print('='*100)
+
+        updated = 0
+        for i, row in enumerate(rows, 1):
+            meta = read_image_metadata(row.path)
+            for key, value in meta.items():
+                if value is not None:
+                    setattr(row, key, value)
+            if meta['sha256'] is not None:
+                updated += 1
+            else:
+                print(f'⚠️ Could not read {row.path}')
+
+            if i % batch_size == 0:
+                db.session.commit()
+
+        # Snapshots carry the dimensions / colour, so listing pages must reload
+        bump_catalog_version()
+        db.session.commit()
+        print(f'\n✅ Stored metadata for {updated} images')
+
+if __name__ == '__main__':
+    backfill_image_metadata()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Backfill the panel / category snapshot on existing orders.
+
+Usage: python backfill_order_panels.py [--full]
+
+Run once as a deploy step after the snapshot columns are added; the app
+only warns at startup while orders still lack it. Orders missing the
+snapshot get products.category and products.cuplock_type copied onto their
+order_items, then order_items.panel and orders.panel_mask derived from them,
+and the analytics rollups are rebuilt (or built, if there are none yet).
+--full recomputes the snapshot for every order. Every step is one set-based
+UPDATE under the rollup rebuild lock, so it is safe to re-run.
+"""
+
+import sys
+
+from app import app, db
+from analytics import (backfill_order_snapshots, ensure_order_panels, ensure_order_rollups,
+                       rebuild_order_rollups)
+
+def backfill_order_panels(full=False):
+    with app.app_context():
+        db.create_all()
+
+        if not full:
+            ensure_order_panels()
+            ensure_order_rollups()
+            print('✅ Backfilled orders missing the panel snapshot and the rollups')
+            return
+
+        items, orders = backfill_order_snapshots(full=True)
+        print(f'✅ Snapshotted product category on {items} order items')
+        print(f'✅ Set panel_mask on {orders} orders')
+
+        order_rows, category_rows = rebuild_order_rollups()
+        db.session.commit()
+        print(f'\n✅ Rebuilt rollups: {order_rows} order rows, {category_rows} category rows')
+
+if __name__ == '__main__':
+    backfill_order_panels(full='--full' in sys.argv)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""Generate thumbnail / card / detail variants for images uploaded before variants existed"""
+
+import os
+
+from app import app
+from utils import IMAGE_VARIANTS, VARIANT_FORMATS, generate_image_variants, variant_path
+
+def build_image_variants():
+    with app.app_context():
+        upload_dir = os.path.join(app.static_folder, 'uploads')
+        names = sorted(
+            name for name in os.listdir(upload_dir)
+            if os.path.isfile(os.path.join(upload_dir, name))
+        )
+
+        print(f'\nChecking variants for {len(names)} uploads')
+        print('='*100)
+
+        generated = 0
+        for name in names:
+            path = f'uploads/{name}'
+            expected = [
+                variant_path(path, variant, ext)
+                for variant, _ in IMAGE_VARIANTS
+                for ext, _, _ in VARIANT_FORMATS
+            ]
+            if all(os.path.exists(os.path.join(app.static_folder, p)) for p in expected):
+                continue
+
+            if generate_image_variants(path):
+                print(f'Generated variants for {name}')
+                generated += 1
+
+        print(f'\n✅ Generated variants for {generated} images')
+
+if __name__ == '__main__':
+    build_image_variants()
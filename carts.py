@@ -0,0 +1,124 @@
+"""
+DB-backed shopping carts.
+
+Each user has one Cart row; the Flask session only carries its id as
+'cart_id', so the cookie stays small however large the cart gets. Cart
+count and totals live on the Cart row and are adjusted on every add / remove
+instead of being re-summed from the lines.
+"""
+
+from decimal import Decimal
+
+from flask import g, session
+from sqlalchemy.orm import load_only
+
+from models import db, Cart, CartLine, Product
+
+CART_SESSION_KEY = 'cart_id'
+# Carts stored in the cookie before the server-side store
+LEGACY_SESSION_KEY = 'cart'
+
+
+def _money(value):
+    return Decimal(str(round(float(value or 0), 2)))
+
+
+def get_cart(user_id, create=False):
+    """The user's cart (via the session's cart_id when it matches), or None"""
+    cart = None
+    cart_id = session.get(CART_SESSION_KEY)
+    if cart_id:
+        cart = db.session.get(Cart, cart_id)
+        if cart is not None and cart.user_id != user_id:
+            cart = None
+    if cart is None:
+        cart = Cart.query.filter_by(user_id=user_id).first()
+    if cart is None and create:
+        cart = Cart(user_id=user_id, item_count=0, subtotal=0, deposit_total=0)
+        db.session.add(cart)
+        db.session.flush()
+
+    legacy_items = session.pop(LEGACY_SESSION_KEY, None)
+    if legacy_items:
+        if cart is None:
+            cart = get_cart(user_id, create=True)
+        for item in legacy_items:
+            add_cart_line(
+                cart, item.get('product_id'), item.get('product_name'), item.get('category'),
+                item.get('product_type'), int(item.get('quantity', 1)),
+                item.get('unit_price', 0), item.get('deposit', 0), item.get('customization', {})
+            )
+        db.session.commit()
+
+    if cart is not None and session.get(CART_SESSION_KEY) != cart.id:
+        session[CART_SESSION_KEY] = cart.id
+    return cart
+
+
+def add_cart_line(cart, product_id, product_name, category, product_type, quantity,
+                  unit_price, deposit, customization):
+    """Append a line and bump the cart's counters"""
+    line = CartLine(
+        product_id=int(product_id),
+        product_name=product_name,
+        category=category,
+        product_type=product_type,
+        quantity=quantity,
+        unit_price=_money(unit_price),
+        deposit=_money(deposit),
+        customization=customization or {}
+    )
+    cart.lines.append(line)
+    cart.item_count = (cart.item_count or 0) + 1
+    cart.subtotal = (cart.subtotal or 0) + line.unit_price * quantity
+    cart.deposit_total = (cart.deposit_total or 0) + line.deposit * quantity
+    return line
+
+
+def remove_cart_line(cart, line):
+    """Drop a line and take it off the cart's counters"""
+    cart.lines.remove(line)
+    cart.item_count = max((cart.item_count or 0) - 1, 0)
+    cart.subtotal = max((cart.subtotal or 0) - line.unit_price * line.quantity, 0)
+    cart.deposit_total = max((cart.deposit_total or 0) - line.deposit * line.quantity, 0)
+
+
+def cart_products(cart):
+    """
+    {product_id: Product} for every line of the cart, loaded in one IN query
+    with only the columns the cart, payment and checkout paths read. Cached on
+    flask.g for the rest of the request.
+    """
+    product_ids = {line.product_id for line in cart.lines}
+    cached = g.get('cart_products')
+    if cached is not None and product_ids <= cached.keys():
+        return cached
+
+    products = {}
+    if product_ids:
+        products = {p.id: p for p in Product.query.options(
+            load_only(Product.id, Product.name, Product.category, Product.cuplock_type, Product.image_url)
+        ).filter(Product.id.in_(product_ids))}
+    # Remember misses too, so deleted products are not looked up again
+    for product_id in product_ids:
+        products.setdefault(product_id, None)
+    g.cart_products = products
+    return products
+
+
+def prune_cart(cart):
+    """Drop lines whose product has been deleted; returns the product map"""
+    products = cart_products(cart)
+    for line in list(cart.lines):
+        if products.get(line.product_id) is None:
+            remove_cart_line(cart, line)
+    return products
+
+
+def clear_cart(cart):
+    """Empty the cart after checkout with a single DELETE"""
+    CartLine.query.filter_by(cart_id=cart.id).delete(synchronize_session=False)
+    db.session.expire(cart, ['lines'])
+    cart.item_count = 0
+    cart.subtotal = 0
+    cart.deposit_total = 0
@@ -0,0 +1,719 @@
+"""
+Catalog read helpers shared by app.py and cuplock_routes.py
+"""
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from flask import g, has_request_context
+from sqlalchemy import case, func, literal, union_all
+
+from models import (db, Product, CuplockVerticalSize, CuplockVerticalCup, CuplockLedgerSize,
+                    ProductCatalogSummary, CatalogVersion)
+from product_images import load_primary_image_rows, load_primary_images, primary_image_path
+from search import refresh_search_index
+from utils import get_image_url
+
+logger = logging.getLogger(__name__)
+
+NO_IMAGE_URL = '/static/images/no-image.png'
+
+
+def _is_sized_cuplock(product):
+    """Vertical / ledger cuplock products are priced per size"""
+    return product.category == 'cuplock' and product.cuplock_type in ('vertical', 'ledger')
+
+
+def _size_stats_query(size_model, cuplock_type, product_ids):
+    """Per-product price aggregates over active sizes"""
+    return db.session.query(
+        size_model.product_id.label('product_id'),
+        literal(cuplock_type).label('cuplock_type'),
+        func.min(size_model.buy_price).label('min_buy_price'),
+        func.max(size_model.buy_price).label('max_buy_price'),
+        func.min(
+            case((size_model.buy_price > 0, size_model.buy_price))
+        ).label('min_positive_buy_price'),
+        func.min(
+            case((size_model.rent_price > 0, size_model.rent_price))
+        ).label('min_rent_price'),
+        func.count(size_model.id).label('active_size_count')
+    ).filter(
+        size_model.product_id.in_(product_ids),
+        size_model.is_active == True
+    ).group_by(size_model.product_id)
+
+
+def _cuplock_size_stats(products):
+    """
+    Return {product_id: row} of size aggregates for the vertical / ledger
+    products in `products`, fetched with a single UNION ALL query.
+    Products without active sizes are missing from the result.
+    """
+    vertical_ids = [p.id for p in products if _is_sized_cuplock(p) and p.cuplock_type == 'vertical']
+    ledger_ids = [p.id for p in products if _is_sized_cuplock(p) and p.cuplock_type == 'ledger']
+
+    queries = []
+    if vertical_ids:
+        queries.append(_size_stats_query(CuplockVerticalSize, 'vertical', vertical_ids))
+    if ledger_ids:
+        queries.append(_size_stats_query(CuplockLedgerSize, 'ledger', ledger_ids))
+    if not queries:
+        return {}
+
+    statement = union_all(*[q.statement for q in queries]) if len(queries) > 1 else queries[0].statement
+    return {row.product_id: row for row in db.session.execute(statement).all()}
+
+
+def _display_price(row):
+    """
+    Listing price for a vertical / ledger product from its size aggregates:
+      - vertical: cheapest active size, 0 if it has no buy price
+      - ledger:   cheapest active size if > 0, otherwise any active size with
+                  buy_price > 0, otherwise 0
+    """
+    if row is None:
+        return 0
+    min_price = float(row.min_buy_price) if row.min_buy_price is not None else 0
+    if row.cuplock_type == 'vertical':
+        return min_price if min_price else 0
+    if min_price > 0:
+        return min_price
+    # Fallback: any size with a valid price
+    positive = row.min_positive_buy_price
+    return float(positive) if positive is not None else 0
+
+
+def get_cuplock_display_prices(products):
+    """
+    Return {product_id: display_price} for the cuplock products in `products`.
+
+    All vertical and ledger prices come back from a single grouped query, so
+    listing pages cost the same number of queries however many products they
+    show. Products without any active size get 0.
+    """
+    stats = _cuplock_size_stats(products)
+    return {p.id: _display_price(stats.get(p.id)) for p in products if _is_sized_cuplock(p)}
+
+
+# ===========================
+# PRODUCT CATALOG SUMMARY
+# ===========================
+
+def refresh_catalog_summary(*product_ids):
+    """
+    Recompute product_catalog_summary rows for the given products.
+
+    Runs inside the caller's session and does NOT commit, so the summary is
+    written in the same transaction as the product / size change that
+    triggered it. Call it after the change has been added to the session.
+    """
+    product_ids = {int(pid) for pid in product_ids if pid is not None}
+    if not product_ids:
+        return 0
+
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    stats = _cuplock_size_stats(products)
+    primary_images = load_primary_images(product_ids)
+    existing = {
+        s.product_id: s for s in
+        ProductCatalogSummary.query.filter(ProductCatalogSummary.product_id.in_(product_ids)).all()
+    }
+
+    for product in products:
+        summary = existing.get(product.id)
+        if summary is None:
+            summary = ProductCatalogSummary(product_id=product.id)
+            db.session.add(summary)
+
+        if _is_sized_cuplock(product):
+            row = stats.get(product.id)
+            summary.min_buy_price = row.min_buy_price if row else None
+            summary.max_buy_price = row.max_buy_price if row else None
+            summary.min_rent_price = row.min_rent_price if row else None
+            summary.active_size_count = row.active_size_count if row else 0
+            summary.display_price = _display_price(row)
+        else:
+            summary.min_buy_price = product.price
+            summary.max_buy_price = product.price
+            summary.min_rent_price = product.rent_price
+            summary.active_size_count = 0
+            try:
+                summary.display_price = float(product.price) if product.price else 0
+            except (ValueError, TypeError):
+                summary.display_price = 0
+
+        summary.first_image_url = get_image_url(primary_image_path(product, primary_images))
+
+    return len(products)
+
+
+def rebuild_catalog_summary(batch_size=200):
+    """Recompute the summary for every product, committing per batch"""
+    product_ids = [pid for (pid,) in db.session.query(Product.id).order_by(Product.id).all()]
+    for start in range(0, len(product_ids), batch_size):
+        refresh_catalog_summary(*product_ids[start:start + batch_size])
+        db.session.commit()
+    return len(product_ids)
+
+
+def apply_catalog_summary(products):
+    """
+    Set display_price / min_rent_price / display_image_url on `products` from the summary
+    table with one primary-key lookup. Products that have no summary row
+    yet (e.g. created before the table existed) are computed live.
+    """
+    if not products:
+        return products
+
+    summaries = {
+        s.product_id: s for s in
+        ProductCatalogSummary.query.filter(
+            ProductCatalogSummary.product_id.in_([p.id for p in products])
+        ).all()
+    }
+
+    missing = [p for p in products if p.id not in summaries]
+    if missing:
+        logger.warning(f"Catalog summary missing for {len(missing)} products; computing live")
+    live_stats = _cuplock_size_stats(missing) if missing else {}
+    primary_images = load_primary_images([p.id for p in missing]) if missing else {}
+
+    for product in products:
+        summary = summaries.get(product.id)
+        if summary is not None:
+            product.display_price = float(summary.display_price or 0)
+            product.min_rent_price = float(summary.min_rent_price or 0)
+            product.display_image_url = summary.first_image_url or NO_IMAGE_URL
+            continue
+
+        if _is_sized_cuplock(product):
+            row = live_stats.get(product.id)
+            product.display_price = _display_price(row)
+            product.min_rent_price = float(row.min_rent_price or 0) if row else 0
+        else:
+            product.min_rent_price = float(product.rent_price or 0)
+            try:
+                product.display_price = float(product.price) if product.price else 0
+            except (ValueError, TypeError):
+                product.display_price = 0
+        product.display_image_url = get_image_url(primary_image_path(product, primary_images))
+
+    return products
+
+
+# ===========================
+# CATALOG VERSION
+# ===========================
+
+CATALOG_VERSION_ID = 1
+
+
+def ensure_catalog_version_row():
+    """Create the counter row if it is missing (called at startup)"""
+    if db.session.get(CatalogVersion, CATALOG_VERSION_ID) is None:
+        db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=0, updated_at=datetime.utcnow()))
+        db.session.commit()
+
+
+def bump_catalog_version():
+    """
+    Increment the catalog version inside the caller's transaction.
+    The UPDATE is atomic, so concurrent writers never lose a bump.
+    """
+    updated = CatalogVersion.query.filter_by(id=CATALOG_VERSION_ID).update({
+        CatalogVersion.version: CatalogVersion.version + 1,
+        CatalogVersion.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=1, updated_at=datetime.utcnow()))
+
+    if has_request_context():
+        g.pop('catalog_version', None)
+
+
+def catalog_changed(*product_ids):
+    """
+    Single hook for every admin write that touches the catalog: refreshes the
+    summary and search rows of `product_ids` and bumps the catalog version.
+    Like refresh_catalog_summary() it does NOT commit.
+    """
+    refresh_catalog_summary(*product_ids)
+    refresh_search_index(*product_ids)
+    bump_catalog_version()
+
+
+def get_catalog_version():
+    """
+    Current (version, updated_at) key, or None if the counter row does not
+    exist. Read at most once per request.
+    """
+    if has_request_context() and 'catalog_version' in g:
+        return g.catalog_version
+
+    row = db.session.query(CatalogVersion.version, CatalogVersion.updated_at).filter(
+        CatalogVersion.id == CATALOG_VERSION_ID
+    ).first()
+    version = (row.version, row.updated_at) if row else None
+
+    if has_request_context():
+        g.catalog_version = version
+    return version
+
+
+# ===========================
+# CATALOG SNAPSHOT
+# ===========================
+
+CatalogEntry = namedtuple('CatalogEntry', [
+    'id', 'name', 'description', 'category', 'cuplock_type', 'product_type',
+    'price', 'rent_price', 'image_url', 'display_price', 'display_image_url',
+    'image_width', 'image_height', 'image_color', 'min_rent_price', 'weight'
+])
+
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'products'])
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _build_catalog_snapshot(version):
+    """Load every active product once and freeze it for listing pages"""
+    products = Product.query.filter(Product.is_active == True).order_by(Product.id).all()
+    apply_catalog_summary(products)
+    primary_rows = load_primary_image_rows([p.id for p in products])
+    primary_images = {pid: row.path for pid, row in primary_rows.items()}
+
+    entries = []
+    for product in products:
+        try:
+            price = float(product.price or 0)
+        except (ValueError, TypeError):
+            price = 0.0
+        # Stored at upload time so templates can reserve space without reading the file
+        primary = primary_rows.get(product.id)
+        entries.append(CatalogEntry(
+            id=product.id,
+            name=product.name,
+            description=product.description or '',
+            category=product.category,
+            cuplock_type=product.cuplock_type,
+            product_type=product.product_type,
+            price=price,
+            rent_price=float(product.rent_price) if product.rent_price is not None else None,
+            image_url=primary_image_path(product, primary_images),
+            display_price=product.display_price,
+            display_image_url=product.display_image_url,
+            image_width=primary.width if primary else None,
+            image_height=primary.height if primary else None,
+            image_color=primary.dominant_color if primary else None,
+            min_rent_price=product.min_rent_price,
+            weight=float(product.weight_per_unit) if product.weight_per_unit is not None else None
+        ))
+
+    logger.info(f"Built catalog snapshot v{version[0] if version else '-'} with {len(entries)} products")
+    return CatalogSnapshot(version=version, products=tuple(entries))
+
+
+def get_catalog_snapshot():
+    """
+    Return this worker's immutable snapshot of active products, rebuilding
+    it only when the catalog version in the database has moved on.
+    Without a counter row there is nothing to key on, so the snapshot is
+    built fresh and not cached.
+    """
+    global _snapshot
+
+    version = get_catalog_version()
+    if version is None:
+        return _build_catalog_snapshot(None)
+
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        # Another thread may have rebuilt while we waited
+        if _snapshot is not None and _snapshot.version == version:
+            return _snapshot
+        _snapshot = _build_catalog_snapshot(version)
+        return _snapshot
+
+
+def clear_catalog_snapshot():
+    """Drop this worker's snapshot (used by tests and maintenance scripts)"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+# ===========================
+# LISTING PAGES
+# ===========================
+
+LISTING_PAGE_SIZE = 48
+# Templates print 100 characters and '...' when there are more
+LISTING_DESCRIPTION_CHARS = 101
+SCAFFOLDING_LISTING_CATEGORIES = ('aluminium', 'h-frames', 'cuplock', 'accessories')
+
+
+class ListingCard:
+    """The columns a listing card renders, without the rest of the catalog entry"""
+    __slots__ = ('id', 'name', 'description', 'category', 'cuplock_type', 'price', 'display_price',
+                 'image_url', 'display_image_url', 'image_width', 'image_height', 'image_color')
+
+    def __init__(self, entry):
+        self.id = entry.id
+        self.name = entry.name
+        self.description = entry.description[:LISTING_DESCRIPTION_CHARS]
+        self.category = entry.category
+        self.cuplock_type = entry.cuplock_type
+        self.price = entry.price
+        self.display_price = entry.display_price
+        self.image_url = entry.image_url
+        self.display_image_url = entry.display_image_url
+        self.image_width = entry.image_width
+        self.image_height = entry.image_height
+        self.image_color = entry.image_color
+
+
+class CatalogListing:
+    """
+    Cards of one listing sorted by (category, id) with their sort keys, so a
+    category and a ?cursor= position are both found by bisecting the keys.
+    Descending listings store -id to keep newest first inside a category.
+    """
+    __slots__ = ('cards', 'keys', 'descending')
+
+    def __init__(self, cards, category_key, descending=False):
+        sign = -1 if descending else 1
+        keyed = sorted(((category_key(c.category), sign * c.id), c) for c in cards)
+        self.keys = [key for key, _ in keyed]
+        self.cards = [card for _, card in keyed]
+        self.descending = descending
+
+    def format_cursor(self, key):
+        return f"{key[0]},{abs(key[1])}"
+
+    def parse_cursor(self, value):
+        """'<category>,<id>' -> sort key, or None"""
+        try:
+            category, product_id = (value or '').rsplit(',', 1)
+            product_id = int(product_id)
+        except ValueError:
+            return None
+        return category, -product_id if self.descending else product_id
+
+    def page(self, category=None, cursor=None, page_size=LISTING_PAGE_SIZE):
+        """(cards, next cursor or None) for one page of a category (None for all)"""
+        lo, hi = 0, len(self.keys)
+        if category:
+            lo = bisect_left(self.keys, (category,))
+            hi = bisect_left(self.keys, (category + '\x00',))
+        key = self.parse_cursor(cursor)
+        if key:
+            lo = max(lo, bisect_right(self.keys, key))
+        end = min(lo + page_size, hi)
+        next_cursor = self.format_cursor(self.keys[end - 1]) if end < hi else None
+        return self.cards[lo:end], next_cursor
+
+
+def _build_listings(snapshot):
+    scaffolding, fabrication = [], []
+    for entry in snapshot.products:
+        if (entry.category or '').lower() in SCAFFOLDING_LISTING_CATEGORIES:
+            scaffolding.append(ListingCard(entry))
+        elif entry.category is not None:
+            fabrication.append(ListingCard(entry))
+    listings = {
+        # Scaffolding categories match case-insensitively, fabrication ones exactly
+        'scaffolding': CatalogListing(scaffolding, lambda c: (c or '').lower()),
+        'fabrication': CatalogListing(fabrication, lambda c: c, descending=True)
+    }
+    listings['by_id'] = {card.id: card for card in scaffolding + fabrication}
+    values = {entry.id: _facet_values(entry) for entry in snapshot.products}
+    listings['scaffolding_facets'] = FacetIndex(listings['scaffolding'], values)
+    return listings
+
+
+_listings = None
+_listings_snapshot = None
+_listings_lock = threading.Lock()
+
+
+def _current_listings():
+    """Listings built once per catalog snapshot (an uncached snapshot gets uncached listings)"""
+    global _listings, _listings_snapshot
+
+    snapshot = get_catalog_snapshot()
+    with _listings_lock:
+        if _listings_snapshot is not snapshot:
+            _listings = _build_listings(snapshot)
+            _listings_snapshot = snapshot
+        return _listings
+
+
+def get_catalog_listing(name):
+    """The 'scaffolding' or 'fabrication' listing of the current catalog snapshot"""
+    return _current_listings()[name]
+
+
+def get_listing_cards(product_ids):
+    """Cards for `product_ids` in the given order, skipping products not in the snapshot"""
+    by_id = _current_listings()['by_id']
+    return [by_id[pid] for pid in product_ids if pid in by_id]
+
+
+# ===========================
+# LISTING FACETS
+# ===========================
+
+FACET_NAMES = ('category', 'cuplock_type', 'mode', 'price', 'weight')
+
+PURCHASE_MODES = [('buy', 'Buy'), ('rent', 'Rent')]
+# (value, label, lower bound, upper bound or None); display price in ₹, weight in kg
+PRICE_BANDS = [
+    ('under-500', 'Under ₹500', 0, 500),
+    ('500-2000', '₹500 – ₹2,000', 500, 2000),
+    ('2000-10000', '₹2,000 – ₹10,000', 2000, 10000),
+    ('10000-plus', '₹10,000 and above', 10000, None),
+]
+WEIGHT_BANDS = [
+    ('under-5', 'Under 5 kg', 0, 5),
+    ('5-15', '5 – 15 kg', 5, 15),
+    ('15-30', '15 – 30 kg', 15, 30),
+    ('30-plus', '30 kg and above', 30, None),
+]
+
+FacetOption = namedtuple('FacetOption', ['value', 'label', 'count', 'selected'])
+
+
+def _band(value, bands):
+    for band, _, low, high in bands:
+        if value >= low and (high is None or value < high):
+            return band
+    return None
+
+
+def _facet_values(entry):
+    """{facet: [values]} of one catalog entry; a product can be both bought and rented"""
+    values = {name: [] for name in FACET_NAMES}
+    values['category'].append((entry.category or '').lower())
+    if entry.cuplock_type:
+        values['cuplock_type'].append(entry.cuplock_type.lower())
+    if entry.display_price:
+        values['mode'].append('buy')
+        values['price'].append(_band(entry.display_price, PRICE_BANDS))
+    if entry.min_rent_price:
+        values['mode'].append('rent')
+    if entry.weight:
+        values['weight'].append(_band(entry.weight, WEIGHT_BANDS))
+    return values
+
+
+class FacetIndex:
+    """
+    Bitsets over one listing: bit i stands for listing.cards[i], and every
+    facet value keeps the int whose bits are the products carrying it.
+    Values of one facet are ORed, facets are ANDed, and a facet count is the
+    popcount of its value under the other facets' filters, so a filtered
+    page and all of its counts come from one pass over a handful of ints.
+    """
+    __slots__ = ('listing', 'postings', 'all')
+
+    def __init__(self, listing, values_by_id):
+        positions = {name: {} for name in FACET_NAMES}
+        for i, card in enumerate(listing.cards):
+            for name, values in values_by_id[card.id].items():
+                for value in values:
+                    positions[name].setdefault(value, []).append(i)
+        self.listing = listing
+        self.postings = {
+            name: {value: _bitset(bits) for value, bits in by_value.items()}
+            for name, by_value in positions.items()
+        }
+        self.all = (1 << len(listing.cards)) - 1
+
+    def _options(self, name, counts, chosen):
+        if name == 'mode':
+            labels = PURCHASE_MODES
+        elif name == 'price':
+            labels = [band[:2] for band in PRICE_BANDS]
+        elif name == 'weight':
+            labels = [band[:2] for band in WEIGHT_BANDS]
+        else:
+            labels = [(value, value.replace('-', ' ')) for value in sorted(counts)]
+        return [
+            FacetOption(value, label, counts.get(value, 0), value in chosen)
+            for value, label in labels if value in counts
+        ]
+
+    def search(self, selected=None, cursor=None, page_size=LISTING_PAGE_SIZE):
+        """
+        One page of the listing filtered by `selected` ({facet: values};
+        unknown facets and values are ignored) in listing order:
+        (cards, next cursor or None, {facet: [FacetOption]}).
+        """
+        selected = {name: set(selected.get(name) or ()) for name in FACET_NAMES} if selected else {}
+        masks = {}
+        for name, chosen in selected.items():
+            if chosen:
+                mask = 0
+                for value in chosen:
+                    mask |= self.postings[name].get(value, 0)
+                masks[name] = mask
+
+        matched = self.all
+        for mask in masks.values():
+            matched &= mask
+
+        facets = {}
+        for name in FACET_NAMES:
+            base = self.all
+            for other, mask in masks.items():
+                if other != name:
+                    base &= mask
+            counts = {value: (base & posting).bit_count() for value, posting in self.postings[name].items()}
+            facets[name] = self._options(name, counts, selected.get(name, ()))
+
+        key = self.listing.parse_cursor(cursor)
+        if key:
+            start = bisect_right(self.listing.keys, key)
+            matched &= ~((1 << start) - 1)
+
+        cards, last = [], None
+        while matched and len(cards) < page_size:
+            low = matched & -matched
+            last = low.bit_length() - 1
+            cards.append(self.listing.cards[last])
+            matched ^= low
+        next_cursor = self.listing.format_cursor(self.listing.keys[last]) if matched else None
+        return cards, next_cursor, facets
+
+
+def _bitset(positions):
+    bits = bytearray((positions[-1] >> 3) + 1)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def get_scaffolding_facets():
+    """The FacetIndex over the scaffolding listing of the current catalog snapshot"""
+    return _current_listings()['scaffolding_facets']
+
+
+# ===========================
+# COMPILED PRICING TABLES
+# ===========================
+
+PricedSize = namedtuple('PricedSize', ['id', 'label', 'buy_price', 'rent_price', 'deposit', 'is_active'])
+PricedCup = namedtuple('PricedCup', ['id', 'cup_count', 'buy_price', 'rent_price', 'deposit'])
+
+
+class ProductPricing:
+    """
+    Everything calculate_price() needs for one product, compiled from a
+    single sizes/cups query so each lookup is a dict access.
+    """
+    __slots__ = ('product_id', 'sizes_by_id', 'sizes_by_label', 'default_size', 'cups', 'matrix')
+
+    def __init__(self, product_id, sizes, cups, matrix):
+        self.product_id = product_id
+        self.sizes_by_id = {s.id: s for s in sizes}
+        # First active size wins for a label, same as the old .first() lookups
+        self.sizes_by_label = {}
+        for s in sizes:
+            if s.is_active:
+                self.sizes_by_label.setdefault(s.label, s)
+        self.default_size = next((s for s in sizes if s.is_active), None)
+        self.cups = cups
+        self.matrix = matrix
+
+    def find_size(self, size_id=None, size_label=None):
+        """
+        Size for a cart customization: by id (any state, must belong to this
+        product), then by active label, then the first active size.
+        Returns (size, used_fallback).
+        """
+        if size_id:
+            try:
+                size = self.sizes_by_id.get(int(size_id))
+                if size:
+                    return size, False
+            except (ValueError, TypeError):
+                pass
+        if size_label:
+            size = self.sizes_by_label.get(size_label)
+            if size:
+                return size, False
+        return self.default_size, self.default_size is not None
+
+    def cup(self, size_id, cup_count):
+        return self.cups.get((size_id, cup_count))
+
+
+_pricing_tables = {}
+_pricing_version = None
+_pricing_lock = threading.Lock()
+
+
+def _compile_product_pricing(product):
+    rows = db.session.query(
+        CuplockVerticalSize.id, CuplockVerticalSize.size_label, CuplockVerticalSize.buy_price,
+        CuplockVerticalSize.rent_price, CuplockVerticalSize.deposit, CuplockVerticalSize.is_active,
+        CuplockVerticalCup.id, CuplockVerticalCup.cup_count, CuplockVerticalCup.buy_price,
+        CuplockVerticalCup.rent_price, CuplockVerticalCup.deposit_amount
+    ).outerjoin(
+        CuplockVerticalCup, CuplockVerticalCup.vertical_size_id == CuplockVerticalSize.id
+    ).filter(
+        CuplockVerticalSize.product_id == product.id
+    ).order_by(CuplockVerticalSize.id, CuplockVerticalCup.id).all()
+
+    sizes = {}
+    cups = {}
+    for row in rows:
+        size_id = row[0]
+        if size_id not in sizes:
+            sizes[size_id] = PricedSize(size_id, row[1], row[2], row[3], row[4], bool(row[5]))
+        if row[6] is not None:
+            cups.setdefault((size_id, row[7]), PricedCup(row[6], row[7], row[8], row[9], row[10]))
+
+    matrix = (product.customization_options or {}).get('pricing_matrix') or {}
+    return ProductPricing(product.id, list(sizes.values()), cups, matrix)
+
+
+def get_product_pricing(product):
+    """
+    Compiled pricing for `product`, cached per worker until the catalog
+    version moves (every size / cup / matrix write bumps it).
+    """
+    global _pricing_tables, _pricing_version
+
+    version = get_catalog_version()
+    if version is None:
+        return _compile_product_pricing(product)
+
+    with _pricing_lock:
+        if _pricing_version != version:
+            _pricing_tables = {}
+            _pricing_version = version
+        pricing = _pricing_tables.get(product.id)
+    if pricing is not None:
+        return pricing
+
+    pricing = _compile_product_pricing(product)
+    with _pricing_lock:
+        if _pricing_version == version:
+            _pricing_tables[product.id] = pricing
+    return pricing
+
+
+def clear_pricing_tables():
+    """Drop this worker's compiled pricing (used by tests)"""
+    global _pricing_tables, _pricing_version
+    with _pricing_lock:
+        _pricing_tables = {}
+        _pricing_version = None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Check that every hot query is answered from an index.
+
+Usage: python check_query_plans.py
+
+Runs EXPLAIN (Postgres) or EXPLAIN QUERY PLAN (sqlite) on each query in
+HOT_QUERIES and exits non-zero if any plan reads a whole table. On Postgres
+sequential scans are disabled for the check, because the planner prefers
+them on small tables even when an index exists; a Seq Scan in the plan then
+means no usable index. Declared indexes missing from the database are
+listed first; add_query_indexes.py (a deploy step) creates them.
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+
+from app import app, db
+from models import AdminOTP, CuplockLedgerSize, CuplockVerticalCup, CuplockVerticalSize, Order, Product
+
+# (name, statement) for the query shapes the storefront and admin run most
+HOT_QUERIES = [
+    ('active products by lower(category)', select(Product.id).where(
+        func.lower(Product.category) == 'cuplock', Product.is_active == True)),
+    ('active cuplock products by type', select(Product.id).where(
+        Product.category == 'cuplock', Product.cuplock_type == 'vertical', Product.is_active == True)),
+    ('active vertical sizes of a product', select(CuplockVerticalSize.id).where(
+        CuplockVerticalSize.product_id == 1, CuplockVerticalSize.is_active == True)),
+    ('active ledger sizes of a product', select(CuplockLedgerSize.id).where(
+        CuplockLedgerSize.product_id == 1, CuplockLedgerSize.is_active == True)),
+    ('cups of a vertical size', select(CuplockVerticalCup.id).where(
+        CuplockVerticalCup.vertical_size_id == 1, CuplockVerticalCup.cup_count == 4)),
+    ("a user's orders by date", select(Order.id).where(Order.user_id == 1).order_by(Order.order_date.desc())),
+    ('orders since a date for a user', select(Order.id).where(
+        Order.user_id == 1, Order.order_date >= datetime(2025, 1, 1))),
+    ('order by transaction id', select(Order.id).where(Order.transaction_id == 'TX1')),
+    ('OTP of an admin', select(AdminOTP.id).where(AdminOTP.admin_id == 1)),
+]
+
+
+def index_exists(conn, name):
+    """By name, so expression indexes (which the inspector skips) are found too"""
+    if conn.dialect.name == 'postgresql':
+        return conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"), {'name': name}
+    ).first() is not None
+
+
+def missing_indexes():
+    """(table, index) names declared in models.py that the database lacks"""
+    with db.engine.connect() as conn:
+        return [
+            (table.name, index.name)
+            for table in db.metadata.sorted_tables
+            for index in sorted(table.indexes, key=lambda ix: ix.name)
+            if not index_exists(conn, index.name)
+        ]
+
+
+def explain(statement):
+    """Plan lines of `statement` on the current database"""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    conn = db.session.connection()
+    if dialect.name == 'postgresql':
+        conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = conn.exec_driver_sql(f'EXPLAIN {sql}').all()
+        lines = [row[0] for row in rows]
+    else:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()
+        lines = [row[-1] for row in rows]
+    db.session.rollback()
+    return lines
+
+
+def full_scans(lines):
+    """Plan lines that read a whole table rather than an index"""
+    return [
+        line for line in lines
+        if 'Seq Scan' in line or (line.startswith('SCAN ') and ' USING ' not in line)
+    ]
+
+
+def check_query_plans(queries=HOT_QUERIES):
+    """Print each plan verdict and return the names of the queries that scan a table"""
+    failures = []
+    for name, statement in queries:
+        lines = explain(statement)
+        scans = full_scans(lines)
+        if scans:
+            failures.append(name)
+            print(f'❌ {name}: {"; ".join(scans)}')
+        else:
+            print(f'✅ {name}: {lines[0].strip() if lines else "no plan"}')
+    return failures
+
+
+def main():
+    with app.app_context():
+        missing = missing_indexes()
+        for table, name in missing:
+            print(f'❌ Missing index {name} on {table}')
+        if missing:
+            print('   Run python add_query_indexes.py\n')
+
+        failures = check_query_plans()
+        if failures:
+            print(f'\n❌ {len(failures)} hot queries fall back to a full scan')
+            return 1
+        if missing:
+            return 1
+        print(f'\n✅ All {len(HOT_QUERIES)} hot queries use an index')
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+# Load the isolated test database before any test module imports app
+import test_support  # noqa: F401
@@ -1,12 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_required
 from models import db, Product, CuplockVerticalSize, CuplockLedgerSize, CuplockVerticalCup
 from sqlalchemy.exc import IntegrityError
 import logging
-import os
-import uuid
-from werkzeug.utils import secure_filename
-from utils import get_image_url
+from utils import get_image_url, store_upload
+from catalog import catalog_changed
+from product_images import set_product_images
 
 cuplock_bp = Blueprint('cuplock', __name__)
 logger = logging.getLogger(__name__)
@@ -244,17 +243,15 @@ def vertical_create():
                 for file in files:
                     if file and file.filename and allowed_file(file.filename):
                         try:
-                            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                            os.makedirs(upload_folder, exist_ok=True)
-                            unique_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                            filepath = os.path.join(upload_folder, unique_name)
-                            file.save(filepath)
-                            uploaded_images.append(f'uploads/{unique_name}')
+                            stored_path = store_upload(file, file.filename)
+                            uploaded_images.append(stored_path)
                         except Exception as e:
                             logger.error(f"Error saving image: {e}")
             
-            if uploaded_images: product.image_url = ','.join(uploaded_images)
+            if uploaded_images: set_product_images(product, uploaded_images)
             db.session.add(product)
+            db.session.flush()
+            catalog_changed(product.id)
             db.session.commit()
 
             # Handle Sizes
@@ -280,6 +277,7 @@ def vertical_create():
                                                       deposit=deposit, weight=weight, is_active=True)
                         db.session.add(new_size)
                     size_index += 1
+                catalog_changed(product.id)
                 db.session.commit()
             except Exception as e: logger.warning(f"Error processing sizes: {e}")
 
@@ -310,15 +308,12 @@ def vertical_edit(product_id):
                 for file in files:
                     if file and file.filename and allowed_file(file.filename):
                         try:
-                            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                            os.makedirs(upload_folder, exist_ok=True)
-                            unique_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                            filepath = os.path.join(upload_folder, unique_name)
-                            file.save(filepath)
-                            uploaded_images.append(f'uploads/{unique_name}')
+                            stored_path = store_upload(file, file.filename)
+                            uploaded_images.append(stored_path)
                         except Exception as e: logger.error(f"Error saving image: {e}")
-                if uploaded_images: product.image_url = ','.join(uploaded_images)
+                if uploaded_images: set_product_images(product, uploaded_images)
             
+            catalog_changed(product.id)
             db.session.commit()
             flash('✅ Product updated successfully!', 'success')
             return redirect(url_for('cuplock.vertical_edit', product_id=product_id))
@@ -339,6 +334,7 @@ def vertical_delete_product(product_id):
         if session.get('user_type') != 'admin': return jsonify({'success': False, 'message': 'Admin access required'}), 403
         product = Product.query.get_or_404(product_id)
         product.is_active = False
+        catalog_changed(product.id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Product deleted successfully'})
     except Exception as e:
@@ -366,6 +362,7 @@ def vertical_add_size(product_id):
         size = CuplockVerticalSize(product_id=product_id, size_label=size_label, weight=safe_decimal(request.form.get('weight')),
                                   buy_price=buy_price, rent_price=rent_price, deposit=safe_decimal(request.form.get('deposit')), is_active=True)
         db.session.add(size)
+        catalog_changed(product_id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Size added successfully'})
     except Exception as e:
@@ -389,13 +386,9 @@ def vertical_add_cup(size_id):
         if 'cup_image' in request.files and request.files['cup_image']:
             file = request.files['cup_image']
             if file and file.filename and allowed_file(file.filename):
-                upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-                unique_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                filepath = os.path.join(upload_folder, unique_name)
                 try:
-                    file.save(filepath)
-                    cup_image_url = unique_name
+                    # Cup images are stored as a bare file name under uploads/
+                    cup_image_url = store_upload(file, file.filename).split('/', 1)[1]
                 except Exception as e: return jsonify({'success': False, 'message': str(e)}), 500
         
         cup = CuplockVerticalCup(vertical_size_id=size_id, cup_count=int(cup_count), cup_image_url=cup_image_url,
@@ -404,6 +397,7 @@ def vertical_add_cup(size_id):
                                  rent_price=float(request.form.get('rent_price') or 0),
                                  deposit_amount=float(request.form.get('deposit') or 0))
         db.session.add(cup)
+        catalog_changed(size.product_id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Cup configuration added'})
     except Exception as e:
@@ -414,13 +408,13 @@ def vertical_add_cup(size_id):
 @cuplock_bp.route('/admin/vertical/size/<int:size_id>/delete', methods=['POST'])
 @login_required
 def vertical_delete_size(size_id):
-    try: size = CuplockVerticalSize.query.get_or_404(size_id); size.is_active = False; db.session.commit(); return jsonify({'success': True})
+    try: size = CuplockVerticalSize.query.get_or_404(size_id); size.is_active = False; catalog_changed(size.product_id); db.session.commit(); return jsonify({'success': True})
     except Exception as e: db.session.rollback(); logger.error(f"Error deleting vertical size: {e}"); return jsonify({'success': False, 'message': str(e)}), 500
 
 @cuplock_bp.route('/admin/vertical/cup/<int:cup_id>/delete', methods=['POST'])
 @login_required
 def vertical_delete_cup(cup_id):
-    try: cup = CuplockVerticalCup.query.get_or_404(cup_id); db.session.delete(cup); db.session.commit(); return jsonify({'success': True, 'message': 'Cup configuration deleted'})
+    try: cup = CuplockVerticalCup.query.get_or_404(cup_id); product_id = cup.size.product_id; db.session.delete(cup); catalog_changed(product_id); db.session.commit(); return jsonify({'success': True, 'message': 'Cup configuration deleted'})
     except Exception as e: db.session.rollback(); logger.error(f"Error deleting cup: {e}"); return jsonify({'success': False, 'message': str(e)}), 500
 
 # ===========================
@@ -453,15 +447,11 @@ def ledger_create():
                 file = request.files['image']
                 if file and file.filename and allowed_file(file.filename):
                     try:
-                        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                        os.makedirs(upload_folder, exist_ok=True)
-                        unique_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                        filepath = os.path.join(upload_folder, unique_name)
-                        file.save(filepath)
-                        product.image_url = f'uploads/{unique_name}'
+                        stored_path = store_upload(file, file.filename)
+                        set_product_images(product, [stored_path])
                     except Exception as e: logger.error(f"Error saving image: {e}")
 
-            db.session.add(product); db.session.commit()
+            db.session.add(product); db.session.flush(); catalog_changed(product.id); db.session.commit()
             flash('Ledger product created — now add sizes.', 'success')
             return redirect(url_for('cuplock.ledger_edit', product_id=product.id))
         return render_template('cuplock_ledger_create.html', ledger_sizes=LEDGER_SIZES)
@@ -480,14 +470,10 @@ def ledger_edit(product_id):
                 file = request.files['image']
                 if file and file.filename and allowed_file(file.filename):
                     try:
-                        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-                        os.makedirs(upload_folder, exist_ok=True)
-                        unique_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-                        filepath = os.path.join(upload_folder, unique_name)
-                        file.save(filepath)
-                        product.image_url = f'uploads/{unique_name}'
+                        stored_path = store_upload(file, file.filename)
+                        set_product_images(product, [stored_path])
                     except Exception as e: logger.error(f"Error saving image: {e}")
-            db.session.commit(); flash('Product updated!', 'success'); return redirect(url_for('cuplock.ledger_edit', product_id=product_id))
+            catalog_changed(product.id); db.session.commit(); flash('Product updated!', 'success'); return redirect(url_for('cuplock.ledger_edit', product_id=product_id))
 
         sizes = CuplockLedgerSize.query.filter_by(product_id=product_id, is_active=True).all()
         image_url = get_image_url(product.image_url)
@@ -499,7 +485,7 @@ def ledger_edit(product_id):
 def ledger_delete_product(product_id):
     try:
         if session.get('user_type') != 'admin': return jsonify({'success': False, 'message': 'Admin access required'}), 403
-        product = Product.query.get_or_404(product_id); product.is_active = False; db.session.commit()
+        product = Product.query.get_or_404(product_id); product.is_active = False; catalog_changed(product.id); db.session.commit()
         return jsonify({'success': True, 'message': 'Product deleted successfully'})
     except Exception as e: db.session.rollback(); logger.exception("Error deleting ledger product"); return jsonify({'success': False, 'message': 'Server error occurred'}), 500
 
@@ -517,14 +503,14 @@ def ledger_add_size(product_id):
                                  buy_price=float(request.form.get('buy_price') or 0),
                                  rent_price=float(request.form.get('rent_price') or 0),
                                  deposit_amount=float(request.form.get('deposit') or 0), is_active=True)
-        db.session.add(size); db.session.commit()
+        db.session.add(size); catalog_changed(product_id); db.session.commit()
         return jsonify({'success': True, 'message': 'Size added successfully'})
     except Exception as e: db.session.rollback(); logger.error(f"Error adding ledger size: {e}"); return jsonify({'success': False, 'message': str(e)}), 500
 
 @cuplock_bp.route('/admin/ledger/size/<int:size_id>/delete', methods=['POST'])
 @login_required
 def ledger_delete_size(size_id):
-    try: size = CuplockLedgerSize.query.get_or_404(size_id); size.is_active = False; db.session.commit(); return jsonify({'success': True})
+    try: size = CuplockLedgerSize.query.get_or_404(size_id); size.is_active = False; catalog_changed(size.product_id); db.session.commit(); return jsonify({'success': True})
     except Exception as e: db.session.rollback(); logger.error(f"Error deleting ledger size: {e}"); return jsonify({'success': False, 'message': str(e)}), 500
 
 # ===========================
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Clear duplicate transaction IDs so orders.transaction_id can be unique.
+
+Usage: python dedupe_transaction_ids.py [--dry-run]
+
+For every transaction ID used by more than one order, the oldest order keeps
+it and the later ones are renamed to '<transaction id>#dup-<order id>', so no
+order is lost and the clash stays visible to admins. Then the unique index
+that ensure_columns_exist() could not build is created. Safe to re-run.
+"""
+
+import sys
+
+from sqlalchemy import func, text
+
+from app import app, db
+from models import Order
+
+# Order.transaction_id is a String(100)
+TRANSACTION_ID_LENGTH = 100
+
+
+def duplicate_transaction_ids():
+    """{transaction id: [orders, oldest first]} for IDs used more than once"""
+    ids = [tx for (tx,) in db.session.query(Order.transaction_id).filter(
+        Order.transaction_id.isnot(None)
+    ).group_by(Order.transaction_id).having(func.count(Order.id) > 1)]
+    duplicates = {}
+    for order in Order.query.filter(Order.transaction_id.in_(ids)).order_by(Order.order_date, Order.id):
+        duplicates.setdefault(order.transaction_id, []).append(order)
+    return duplicates
+
+
+def renamed_transaction_id(transaction_id, order_id):
+    suffix = f'#dup-{order_id}'
+    return transaction_id[:TRANSACTION_ID_LENGTH - len(suffix)] + suffix
+
+
+def dedupe_transaction_ids(dry_run=False):
+    with app.app_context():
+        duplicates = duplicate_transaction_ids()
+        renamed = 0
+
+        print(f'\n{len(duplicates)} transaction IDs used by more than one order')
+        print('='*100)
+        for transaction_id, orders in duplicates.items():
+            kept, *later = orders
+            print(f'{transaction_id}: kept on order {kept.id}')
+            for order in later:
+                new_id = renamed_transaction_id(transaction_id, order.id)
+                print(f'  order {order.id} -> {new_id}')
+                order.transaction_id = new_id
+                renamed += 1
+
+        if dry_run:
+            db.session.rollback()
+            print('\nDry run: nothing changed')
+            return True
+
+        db.session.commit()
+        print(f'\n✅ Renamed {renamed} duplicate transaction IDs')
+
+        if db.engine.dialect.name == 'postgresql':
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS ix_orders_transaction_id ON orders (transaction_id)"
+                    ))
+                    conn.commit()
+                print('✅ Unique index ix_orders_transaction_id in place')
+            except Exception as e:
+                print(f'❌ Could not create ix_orders_transaction_id: {e}')
+                return False
+        return True
+
+if __name__ == '__main__':
+    sys.exit(0 if dedupe_transaction_ids(dry_run='--dry-run' in sys.argv) else 1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Collapse byte-identical files in static/uploads into content-addressed
+uploads/<sha256>.<ext> names and rewrite every DB path that points at them.
+
+Usage: python dedupe_uploads.py [--dry-run]
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+
+from app import app, db
+from models import Product, ProductImage, CuplockVerticalCup
+from catalog import bump_catalog_version, rebuild_catalog_summary
+from product_images import image_reference_count, normalize_image_path, split_image_csv
+from utils import (UPLOAD_CHUNK_SIZE, delete_image_variants, upload_extension,
+                   generate_image_variants, image_index_add, image_index_discard)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan_renames(upload_dir):
+    """{old stored path: new stored path} for every upload not yet content-addressed"""
+    renames = {}
+    for name in sorted(os.listdir(upload_dir)):
+        fs_path = os.path.join(upload_dir, name)
+        if name.startswith('.') or not os.path.isfile(fs_path):
+            continue
+        new_name = f"{file_sha256(fs_path)}{upload_extension(name)}"
+        if new_name != name:
+            renames[f'uploads/{name}'] = f'uploads/{new_name}'
+    return renames
+
+
+def dedupe_uploads(dry_run=False):
+    with app.app_context():
+        upload_dir = os.path.join(app.static_folder, 'uploads')
+        renames = plan_renames(upload_dir)
+        targets = set(renames.values())
+
+        duplicate_bytes = 0
+        seen = set()
+        for old, new in renames.items():
+            if new in seen or os.path.exists(os.path.join(app.static_folder, new)):
+                duplicate_bytes += os.path.getsize(os.path.join(app.static_folder, old))
+            seen.add(new)
+
+        print(f'\n{len(renames)} uploads to rename into {len(targets)} content-addressed files')
+        print(f'Reclaimable: {duplicate_bytes / (1024 * 1024):.2f} MB')
+        print('='*100)
+
+        if dry_run:
+            for old, new in renames.items():
+                print(f'{old} -> {new}')
+            print('\nDry run: nothing changed')
+            return
+
+        # 1. Make sure every target exists before any DB row points at it
+        for old, new in renames.items():
+            new_fs = os.path.join(app.static_folder, new)
+            if not os.path.exists(new_fs):
+                shutil.copy2(os.path.join(app.static_folder, old), new_fs)
+                image_index_add(new_fs)
+                generate_image_variants(new)
+
+        # 2. Rewrite DB paths; '/static/uploads/x' and 'static/uploads/x' are
+        #    stored too, so match on the normalised form
+        for image in ProductImage.query.filter(ProductImage.path.like('%uploads/%')).all():
+            new = renames.get(normalize_image_path(image.path))
+            if new:
+                image.path = new
+
+        for product in Product.query.filter(Product.image_url.like('%uploads/%')).all():
+            paths = split_image_csv(product.image_url)
+            rewritten = [renames.get(normalize_image_path(p), p) for p in paths]
+            if rewritten != paths:
+                product.image_url = ','.join(rewritten)
+
+        bare_renames = {old.split('/', 1)[1]: new.split('/', 1)[1] for old, new in renames.items()}
+        for cup in CuplockVerticalCup.query.filter(CuplockVerticalCup.cup_image_url.isnot(None)).all():
+            if cup.cup_image_url in bare_renames:
+                cup.cup_image_url = bare_renames[cup.cup_image_url]
+            else:
+                cup.cup_image_url = renames.get(normalize_image_path(cup.cup_image_url), cup.cup_image_url)
+
+        db.session.commit()
+
+        # 3. Remove the old names, unless some stored form was still missed above
+        removed = 0
+        kept = 0
+        for old in renames:
+            old_fs = os.path.join(app.static_folder, old)
+            if image_reference_count(old) > 0:
+                kept += 1
+                print(f'⚠️ Keeping {old}: still referenced')
+                continue
+            if os.path.exists(old_fs):
+                os.remove(old_fs)
+                image_index_discard(old_fs)
+                delete_image_variants(old)
+                removed += 1
+
+        rebuild_catalog_summary()
+        bump_catalog_version()
+        db.session.commit()
+
+        print(f'\n✅ Removed {removed} old files; {len(targets)} content-addressed files in use'
+              + (f'; kept {kept} still referenced' if kept else ''))
+
+
+if __name__ == '__main__':
+    dedupe_uploads(dry_run='--dry-run' in sys.argv)
@@ -128,6 +128,20 @@ def check_routes():
     
     return True
 
+def check_search_index():
+    """Validate the product search index has been built"""
+    from search import search_index_ready
+
+    print("\n[SEARCH INDEX]")
+
+    with app.app_context():
+        if search_index_ready():
+            print("  PASS: product_search exists")
+            return True
+
+    print("  ERROR: product_search missing - run python rebuild_search_index.py")
+    return False
+
 def check_database():
     """Validate database connection"""
     print("\n[DATABASE]")
@@ -152,7 +166,8 @@ def main():
         ("Products & Images", check_products),
         ("Orders/Transactions", check_orders),
         ("Image Files", check_images),
-        ("Routes", check_routes)
+        ("Routes", check_routes),
+        ("Search Index", check_search_index)
     ]
     
     results = {}
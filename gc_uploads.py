@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+Garbage-collect uploads nothing references any more.
+
+Usage: python gc_uploads.py [--dry-run] [--grace-hours N] [--purge-days N]
+
+Files in static/uploads (and their variants) that no product (active or
+not) or cup configuration points at, and that are older than the grace period, are
+moved to instance/upload_quarantine. Quarantined files are deleted for good
+after --purge-days, and moved back if something references them again.
+"""
+
+import argparse
+import os
+import posixpath
+import shutil
+import time
+
+from app import app, db
+from models import Product, ProductImage, CuplockVerticalCup
+from product_images import normalize_image_path, split_image_csv
+from utils import UPLOAD_QUARANTINE_FOLDER, VARIANT_FOLDER, image_index_discard, restore_upload
+
+GC_BATCH_SIZE = 500
+GRACE_HOURS = 24
+PURGE_DAYS = 7
+QUARANTINE_FOLDER = UPLOAD_QUARANTINE_FOLDER
+
+
+def referenced_upload_names():
+    """
+    Set of file names under uploads/ that are still in use, by any product
+    row including deactivated ones. Only the path columns are streamed, a
+    batch at a time, so the tables are never loaded.
+    """
+    names = set()
+
+    def add(path):
+        path = normalize_image_path(path)
+        if path.startswith('uploads/'):
+            names.add(path[len('uploads/'):])
+        elif path and '/' not in path:
+            # Cup images are stored as a bare file name
+            names.add(path)
+
+    rows = db.session.query(ProductImage.path).yield_per(GC_BATCH_SIZE)
+    for (path,) in rows:
+        add(path)
+
+    # The CSV mirror also covers products whose images were never migrated
+    rows = db.session.query(Product.image_url).filter(
+        Product.image_url.isnot(None)
+    ).yield_per(GC_BATCH_SIZE)
+    for (image_url,) in rows:
+        for path in split_image_csv(image_url):
+            add(path)
+
+    rows = db.session.query(CuplockVerticalCup.cup_image_url).filter(
+        CuplockVerticalCup.cup_image_url.isnot(None)
+    ).yield_per(GC_BATCH_SIZE)
+    for (path,) in rows:
+        add(path)
+
+    return names
+
+
+def _variant_source_stem(name):
+    """'<stem>_card.webp' -> '<stem>'"""
+    return posixpath.splitext(name)[0].rsplit('_', 1)[0]
+
+
+def find_orphaned_uploads(upload_dir, referenced, grace_seconds, now=None):
+    """
+    Yield (relative path, size) for unreferenced files older than the grace
+    period. Leftover '.upload-*.tmp' files from interrupted uploads count too.
+    """
+    now = now or time.time()
+    referenced_stems = {posixpath.splitext(name)[0] for name in referenced}
+    variant_dir = os.path.join(upload_dir, os.path.basename(VARIANT_FOLDER))
+
+    def scan(directory, prefix, is_referenced):
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if now - st.st_mtime < grace_seconds or is_referenced(entry.name):
+                    continue
+                yield prefix + entry.name, st.st_size
+
+    yield from scan(upload_dir, '', lambda name: name in referenced)
+    yield from scan(variant_dir, os.path.basename(VARIANT_FOLDER) + '/',
+                    lambda name: _variant_source_stem(name) in referenced_stems)
+
+
+def gc_uploads(dry_run=False, grace_hours=GRACE_HOURS, purge_days=PURGE_DAYS):
+    with app.app_context():
+        upload_dir = os.path.join(app.static_folder, 'uploads')
+        quarantine_dir = os.path.join(app.instance_path, QUARANTINE_FOLDER)
+        now = time.time()
+
+        referenced = referenced_upload_names()
+        orphans = list(find_orphaned_uploads(upload_dir, referenced, grace_hours * 3600, now))
+        reclaimable = sum(size for _, size in orphans)
+
+        print(f'\n{len(referenced)} uploads referenced, {len(orphans)} unreferenced '
+              f'(older than {grace_hours}h)')
+        print(f'Reclaimable: {reclaimable / (1024 * 1024):.2f} MB')
+        print('='*100)
+
+        if dry_run:
+            for rel, size in orphans:
+                print(f'{rel} ({size / 1024:.1f} KB)')
+            print('\nDry run: nothing changed')
+            return
+
+        # 1. Bring back anything that became referenced while in quarantine,
+        #    variants included
+        restored = 0
+        if os.path.isdir(quarantine_dir):
+            for name in os.listdir(quarantine_dir):
+                if name in referenced and os.path.isfile(os.path.join(quarantine_dir, name)):
+                    restore_upload(f'uploads/{name}')
+                    restored += 1
+                    print(f'↩️ Restored {name}')
+
+        # 2. Quarantine new orphans; the move time starts the purge clock
+        os.makedirs(os.path.join(quarantine_dir, os.path.basename(VARIANT_FOLDER)), exist_ok=True)
+        for rel, _ in orphans:
+            source = os.path.join(upload_dir, rel)
+            target = os.path.join(quarantine_dir, rel)
+            shutil.move(source, target)
+            os.utime(target, (now, now))
+            image_index_discard(source)
+
+        # 3. Delete whatever has sat in quarantine past the purge period
+        purged = 0
+        purged_bytes = 0
+        for directory, _, files in os.walk(quarantine_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                st = os.stat(path)
+                if now - st.st_mtime >= purge_days * 86400:
+                    os.remove(path)
+                    purged += 1
+                    purged_bytes += st.st_size
+
+        print(f'\n✅ Quarantined {len(orphans)} files, restored {restored}, '
+              f'purged {purged} ({purged_bytes / (1024 * 1024):.2f} MB freed)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quarantine and purge unreferenced uploads')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be collected')
+    parser.add_argument('--grace-hours', type=float, default=GRACE_HOURS)
+    parser.add_argument('--purge-days', type=float, default=PURGE_DAYS)
+    args = parser.parse_args()
+    gc_uploads(dry_run=args.dry_run, grace_hours=args.grace_hours, purge_days=args.purge_days)
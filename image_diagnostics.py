@@ -0,0 +1,228 @@
+"""
+Image diagnostics engine
+
+Validates product images on a thread pool and remembers each file's
+(size, mtime) together with its result in a JSON cache, so a re-run only
+decodes files that changed since the last run. Images whose metadata was
+stored at upload are answered from it without decoding. Results are yielded one
+product at a time so routes can stream them as NDJSON.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSTICS_CACHE_FILE = 'image_diagnostics_cache.json'
+DIAGNOSTICS_WORKERS = 8
+
+_cache_lock = threading.Lock()
+
+
+def validate_image_file(filepath):
+    """Validate a single image file and return diagnostic info.
+    Returns a dict with keys: exists, readable, valid, format, size_bytes, dimensions, error
+    """
+    diagnostic = {
+        'filepath': filepath,
+        'exists': False,
+        'readable': False,
+        'valid': False,
+        'format': None,
+        'size_bytes': 0,
+        'dimensions': None,
+        'error': None
+    }
+
+    if not os.path.exists(filepath):
+        diagnostic['error'] = 'File does not exist on disk'
+        return diagnostic
+
+    diagnostic['exists'] = True
+
+    try:
+        size = os.path.getsize(filepath)
+        diagnostic['size_bytes'] = size
+        diagnostic['readable'] = True
+    except Exception as e:
+        diagnostic['error'] = f'Cannot read file size: {str(e)}'
+        return diagnostic
+
+    try:
+        with Image.open(filepath) as im:
+            # Size comes from the header, so read it before verify() consumes the file
+            diagnostic['dimensions'] = f"{im.width}x{im.height}"
+            diagnostic['format'] = im.format
+            im.verify()
+            diagnostic['valid'] = True
+    except Exception as e:
+        diagnostic['valid'] = False
+        diagnostic['error'] = f'Image validation failed: {str(e)}'
+
+    return diagnostic
+
+
+def default_cache_path():
+    return os.path.join(current_app.instance_path, DIAGNOSTICS_CACHE_FILE)
+
+
+def load_diagnostics_cache(cache_path):
+    """{filepath: {'size', 'mtime_ns', 'result'}} from the last run, or {}"""
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable diagnostics cache {cache_path}: {e}")
+        return {}
+
+
+def save_diagnostics_cache(cache_path, entries):
+    """
+    Merge `entries` into the cache and write it atomically, so a concurrent
+    run never reads half a file. Files this run did not look at (other
+    products, or rows answered from upload metadata) keep their entries;
+    entries of files that are gone are dropped.
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with _cache_lock:
+        merged = {
+            filepath: entry for filepath, entry in load_diagnostics_cache(cache_path).items()
+            if filepath not in entries and os.path.exists(filepath)
+        }
+        merged.update(entries)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _stat_key(filepath):
+    """(size, mtime_ns) of a file, or None when it is missing"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _empty_summary():
+    return {
+        'total_images': 0,
+        'valid_images': 0,
+        'missing_images': 0,
+        'corrupted_images': 0,
+        'total_size_mb': 0,
+        'rechecked': 0,
+        'cached': 0,
+        'from_metadata': 0
+    }
+
+
+def _count(summary, img_info):
+    summary['total_images'] += 1
+    if img_info['valid']:
+        summary['valid_images'] += 1
+    elif not img_info['exists']:
+        summary['missing_images'] += 1
+    else:
+        summary['corrupted_images'] += 1
+    summary['total_size_mb'] += img_info['size_bytes'] / (1024 * 1024)
+
+
+def run_image_diagnostics(products, cache_path=None, workers=DIAGNOSTICS_WORKERS, full=False):
+    """
+    Validate the images of `products` and yield one dict per product:
+
+        {'type': 'product', 'product_id', 'product_name', 'category', 'images': [...]}
+
+    followed by a final {'type': 'summary', ...} with totals and how many
+    distinct files were rechecked versus answered from the cache.
+
+    `products` is a list of (id, name, category, [images]) so nothing
+    touches the database while results stream. An image is either a fs path
+    to validate or a ready diagnostic dict (built from the metadata stored
+    at upload), which is passed through without opening the file.
+    `full=True` ignores the cache.
+    """
+    cache_path = cache_path or default_cache_path()
+    cache = {} if full else load_diagnostics_cache(cache_path)
+    summary = _empty_summary()
+
+    # Decide up front which files need decoding; stat() is cheap
+    stat_keys = {}
+    stale = []
+    for _, _, _, paths in products:
+        for filepath in paths:
+            if isinstance(filepath, dict) or filepath in stat_keys:
+                continue
+            key = _stat_key(filepath)
+            stat_keys[filepath] = key
+            entry = cache.get(filepath)
+            if key is None or entry is None or (entry['size'], entry['mtime_ns']) != key:
+                stale.append(filepath)
+
+    stale_set = set(stale)
+    seen = set()
+    new_cache = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {filepath: pool.submit(validate_image_file, filepath) for filepath in stale}
+
+        for product_id, name, category, paths in products:
+            images = []
+            for filepath in paths:
+                if isinstance(filepath, dict):
+                    images.append(filepath)
+                    summary['from_metadata'] += 1
+                    _count(summary, filepath)
+                    continue
+                if filepath in stale_set:
+                    img_info = futures[filepath].result()
+                else:
+                    img_info = dict(cache[filepath]['result'])
+
+                # A content-addressed file can back several products; count it once
+                if filepath not in seen:
+                    seen.add(filepath)
+                    summary['rechecked' if filepath in stale_set else 'cached'] += 1
+                    key = stat_keys[filepath]
+                    if key is not None:
+                        new_cache[filepath] = {'size': key[0], 'mtime_ns': key[1], 'result': img_info}
+
+                images.append(img_info)
+                _count(summary, img_info)
+
+            yield {
+                'type': 'product',
+                'product_id': product_id,
+                'product_name': name,
+                'category': category,
+                'images': images
+            }
+
+    try:
+        save_diagnostics_cache(cache_path, new_cache)
+    except Exception as e:
+        logger.error(f"Could not save diagnostics cache {cache_path}: {e}")
+
+    summary['total_size_mb'] = round(summary['total_size_mb'], 2)
+    summary['type'] = 'summary'
+    summary['total_products'] = len(products)
+    logger.info(
+        f"Image diagnostics: {summary['total_images']} images, "
+        f"{summary['rechecked']} rechecked, {summary['cached']} cached, "
+        f"{summary['from_metadata']} from upload metadata"
+    )
+    yield summary
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Convert comma-separated Product.image_url values into ProductImage rows"""
+
+from app import app, db
+from models import Product, ProductImage
+from catalog import bump_catalog_version, refresh_catalog_summary
+from product_images import set_product_images, split_image_csv
+
+def migrate_product_images(batch_size=100):
+    with app.app_context():
+        db.create_all()
+
+        # Products that already have rows were migrated (or written) before
+        migrated_ids = {pid for (pid,) in db.session.query(ProductImage.product_id).distinct()}
+        products = Product.query.filter(
+            Product.image_url.isnot(None),
+            Product.image_url != ''
+        ).order_by(Product.id).all()
+
+        print(f'\nConverting images for {len(products)} products')
+        print('='*100)
+
+        converted = 0
+        batch = []
+        for product in products:
+            if product.id in migrated_ids:
+                continue
+
+            # Re-assigning the CSV keeps image_url and the rows in sync
+            rows = set_product_images(product, split_image_csv(product.image_url),
+                                      placeholder=product.image_url)
+            print(f'{product.name}: {len(rows)} images')
+            converted += 1
+            batch.append(product.id)
+
+            if len(batch) >= batch_size:
+                refresh_catalog_summary(*batch)
+                db.session.commit()
+                batch = []
+
+        refresh_catalog_summary(*batch)
+        bump_catalog_version()
+        db.session.commit()
+        print(f'\n✅ Converted {converted} products to ProductImage rows')
+
+if __name__ == '__main__':
+    migrate_product_images()
@@ -65,7 +65,8 @@ class AdminOTP(db.Model):
     admin_id = db.Column(
         db.Integer,
         db.ForeignKey('admins.id', ondelete='CASCADE'),
-        nullable=False
+        nullable=False,
+        index=True
     )
     otp_hash = db.Column(db.String(255), nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)
@@ -77,6 +78,13 @@ class AdminOTP(db.Model):
 # PRODUCTS
 # ===========================
 
+# Partial-index condition for indexes that only cover active rows
+ACTIVE_ROWS = {
+    'postgresql_where': db.text('is_active'),
+    'sqlite_where': db.text('is_active = 1'),
+}
+
+
 class Product(db.Model):
     __tablename__ = 'products'
 
@@ -95,6 +103,47 @@ class Product(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_products_active_category_lower', db.func.lower(category), **ACTIVE_ROWS),
+        # Cuplock pages: category='cuplock' AND cuplock_type=... AND is_active
+        db.Index('ix_products_active_category_type', 'category', 'cuplock_type', **ACTIVE_ROWS),
+    )
+
+    # Ordered photos; image_url above is kept as a CSV mirror of these rows
+    images = db.relationship(
+        'ProductImage',
+        order_by='ProductImage.position',
+        cascade='all, delete-orphan',
+        lazy='select'
+    )
+
+
+# ===========================
+# PRODUCT IMAGES
+# ===========================
+
+class ProductImage(db.Model):
+    __tablename__ = 'product_images'
+    __table_args__ = (
+        db.Index('ix_product_images_product_position', 'product_id', 'position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(
+        db.Integer,
+        db.ForeignKey('products.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    position = db.Column(db.Integer, nullable=False, default=0)
+    path = db.Column(db.String(500), nullable=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    bytes = db.Column(db.Integer)
+    format = db.Column(db.String(20))
+    dominant_color = db.Column(db.String(7))  # '#rrggbb', used as the loading placeholder
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 # ===========================
 # CUPLOCK VERTICAL SIZE
@@ -102,6 +151,9 @@ class Product(db.Model):
 
 class CuplockVerticalSize(db.Model):
     __tablename__ = 'cuplock_vertical_size'
+    __table_args__ = (
+        db.Index('ix_cuplock_vertical_size_product_active', 'product_id', 'is_active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(
@@ -125,6 +177,9 @@ class CuplockVerticalSize(db.Model):
 
 class CuplockVerticalCup(db.Model):
     __tablename__ = 'cuplock_vertical_cups'
+    __table_args__ = (
+        db.Index('ix_cuplock_vertical_cups_size_count', 'vertical_size_id', 'cup_count'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     vertical_size_id = db.Column(
@@ -149,6 +204,9 @@ class CuplockVerticalCup(db.Model):
 
 class CuplockLedgerSize(db.Model):
     __tablename__ = 'cuplock_ledger_sizes'
+    __table_args__ = (
+        db.Index('ix_cuplock_ledger_sizes_product_active', 'product_id', 'is_active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(
@@ -165,12 +223,54 @@ class CuplockLedgerSize(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# ===========================
+# PRODUCT CATALOG SUMMARY
+# ===========================
+
+class ProductCatalogSummary(db.Model):
+    """One row per product with the values listing pages need.
+    Maintained by catalog.refresh_catalog_summary() in the same
+    transaction as the product / size writes."""
+    __tablename__ = 'product_catalog_summary'
+
+    product_id = db.Column(
+        db.Integer,
+        db.ForeignKey('products.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    min_buy_price = db.Column(db.Numeric(10, 2))
+    max_buy_price = db.Column(db.Numeric(10, 2))
+    min_rent_price = db.Column(db.Numeric(10, 2))
+    display_price = db.Column(db.Numeric(10, 2), default=0)
+    active_size_count = db.Column(db.Integer, default=0)
+    first_image_url = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ===========================
+# CATALOG VERSION
+# ===========================
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped by every catalog write.
+    Workers compare it against their in-memory snapshot."""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 # ===========================
 # ORDERS
 # ===========================
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # My Orders: user_id = ? ORDER BY order_date DESC
+        db.Index('ix_orders_user_date', 'user_id', 'order_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -180,10 +280,14 @@ class Order(db.Model):
     )
     total_price = db.Column(db.Numeric(10, 2))
     status = db.Column(db.String(50), default='pending_verification')
-    transaction_id = db.Column(db.String(100))
+    transaction_id = db.Column(db.String(100), unique=True, index=True)
+    # Sent by the payment page so a retried checkout returns the original order
+    idempotency_key = db.Column(db.String(64), unique=True, index=True)
     amount_paid = db.Column(db.Numeric(10, 2))
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     # REMOVED: created_at column - it doesn't exist in your database
+    # Bitmask of the admin panels this order's items belong to (see analytics.PANEL_BITS)
+    panel_mask = db.Column(db.Integer, default=0, index=True)
     
     # Add relationship to load items
     items = db.relationship('OrderItem', backref='order', lazy='select', cascade='all, delete-orphan')
@@ -212,4 +316,93 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Numeric(10, 2))
     customization = db.Column(db.JSON)  # Make sure this line exists
-    
\ No newline at end of file
+    # Snapshot of the product when the order was placed
+    product_category = db.Column(db.String(100), index=True)
+    cuplock_type = db.Column(db.String(50))
+    panel = db.Column(db.String(20), index=True)
+    
+
+# ===========================
+# CARTS
+# ===========================
+
+class Cart(db.Model):
+    """Server-side cart, one per user; the session only carries cart_id"""
+    __tablename__ = 'carts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        unique=True
+    )
+    # Maintained incrementally by carts.add_cart_line / remove_cart_line
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    deposit_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    lines = db.relationship('CartLine', backref='cart', lazy='select', order_by='CartLine.id',
+                            cascade='all, delete-orphan')
+
+
+class CartLine(db.Model):
+    __tablename__ = 'cart_lines'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cart_id = db.Column(
+        db.Integer,
+        db.ForeignKey('carts.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    product_id = db.Column(
+        db.Integer,
+        db.ForeignKey('products.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    product_name = db.Column(db.String(200))
+    category = db.Column(db.String(100))
+    product_type = db.Column(db.String(50))
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    deposit = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    customization = db.Column(db.JSON)
+
+    @property
+    def item_total(self):
+        return float(self.unit_price or 0) * self.quantity
+
+    @property
+    def item_deposit(self):
+        return float(self.deposit or 0) * self.quantity
+
+
+# ===========================
+# ANALYTICS ROLLUPS
+# ===========================
+
+class DailyOrderRollup(db.Model):
+    """Orders per day, admin panel ('all', 'scaffolding', 'fabrication') and
+    status. Kept in step with orders by analytics.record_order_*()."""
+    __tablename__ = 'daily_order_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    panel = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    deposit_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+
+class DailyCategoryRollup(db.Model):
+    """Item revenue / quantity per day, panel, status and product category"""
+    __tablename__ = 'daily_category_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    panel = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    category = db.Column(db.String(100), primary_key=True)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
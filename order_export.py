@@ -0,0 +1,221 @@
+"""
+Streaming order export for accounting (CSV and a minimal XLSX).
+
+Orders are read in keyset batches of EXPORT_BATCH_SIZE on (order_date, id),
+each streamed with yield_per and released before the rows are sent, so memory
+stays flat and no DB connection is held while the client is reading.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import timezone
+from itertools import groupby
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+
+from sqlalchemy import tuple_
+
+from models import db, Order, OrderItem, User
+from analytics import GST_RATE, order_deposit
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_STREAM_CHUNK = 64 * 1024
+# XLSX bodies up to this size stay in memory, larger ones spill to disk
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+
+EXPORT_COLUMNS = [
+    'Order ID', 'Order Date', 'Status', 'Transaction ID',
+    'Customer', 'Email', 'Phone',
+    'Product', 'Category', 'Quantity', 'Unit Price', 'Line Total', 'Line GST',
+    'Order Subtotal', 'Order GST', 'Deposit', 'Order Total', 'Amount Paid'
+]
+
+# Text starting with one of these is run as a formula by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Control characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def safe_cell(value):
+    """Neutralise customer-entered text that a spreadsheet would evaluate"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _order_keys(filters, after, batch_size):
+    """Next batch of (order_date, id) keys, newest first"""
+    query = db.session.query(Order.order_date, Order.id).filter(*filters)
+    if after:
+        query = query.filter(tuple_(Order.order_date, Order.id) < after)
+    return query.order_by(Order.order_date.desc(), Order.id.desc()).limit(batch_size).all()
+
+
+def _batch_lines(order_ids):
+    """Order / customer / item columns for a batch, one row per item"""
+    return db.session.query(
+        Order.id, Order.order_date, Order.status, Order.transaction_id,
+        Order.total_price, Order.amount_paid,
+        User.full_name, User.email, User.phone,
+        OrderItem.id, OrderItem.product_name, OrderItem.product_category,
+        OrderItem.quantity, OrderItem.price
+    ).outerjoin(
+        User, User.id == Order.user_id
+    ).outerjoin(
+        OrderItem, OrderItem.order_id == Order.id
+    ).filter(
+        Order.id.in_(order_ids)
+    ).order_by(
+        Order.order_date.desc(), Order.id.desc(), OrderItem.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def _order_rows(lines, tz):
+    """Export rows for the lines of one order"""
+    first = lines[0]
+    items = [line for line in lines if line[9] is not None]
+    subtotal = sum(float(line[13] or 0) * (line[12] or 0) for line in items)
+    gst = round(subtotal * GST_RATE, 2)
+    deposit = order_deposit(first[4], subtotal)
+    order_date = first[1]
+    if order_date is not None:
+        if order_date.tzinfo is None:
+            order_date = order_date.replace(tzinfo=timezone.utc)
+        order_date = order_date.astimezone(tz).strftime('%Y-%m-%d %H:%M')
+
+    order_columns = [first[0], order_date, first[2], first[3] or '',
+                     first[6] or '', first[7] or '', first[8] or '']
+    totals = [round(subtotal, 2), gst, deposit, float(first[4] or 0),
+              float(first[5]) if first[5] is not None else '']
+
+    if not items:
+        yield order_columns + ['', '', '', '', '', ''] + totals
+    for line in items:
+        unit_price = float(line[13] or 0)
+        line_total = round(unit_price * (line[12] or 0), 2)
+        yield order_columns + [
+            line[10] or '', line[11] or '', line[12], unit_price,
+            line_total, round(line_total * GST_RATE, 2)
+        ] + totals
+
+
+def iter_export_rows(filters, tz=timezone.utc, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield lists of export rows (one list per batch) for the orders matching
+    `filters`, newest first. The session is rolled back after each batch so
+    its connection goes back to the pool while the batch is written out.
+    """
+    after = None
+    while True:
+        keys = _order_keys(filters, after, batch_size)
+        if not keys:
+            break
+        after = tuple(keys[-1])
+
+        rows = []
+        for _, lines in groupby(_batch_lines([k[1] for k in keys]), key=lambda line: line[0]):
+            rows.extend(_order_rows(list(lines), tz))
+        db.session.rollback()
+
+        yield rows
+        if len(keys) < batch_size:
+            break
+
+
+def stream_orders_csv(filters, tz=timezone.utc):
+    """CSV body as a generator of text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_export_rows(filters, tz):
+        writer.writerows([safe_cell(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# ============================================================================
+# MINIMAL XLSX WRITER
+# ============================================================================
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Orders" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            text = XML_ILLEGAL_CHARS.sub('', str(value))
+            cells.append(f'<c t="inlineStr"><is><t>{escape(safe_cell(text))}</t></is></c>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def stream_orders_xlsx(filters, tz=timezone.utc):
+    """
+    XLSX body as a generator of byte chunks. The zip's central directory is
+    written last, so the workbook is built in a spooled temp file first.
+    """
+    spool = SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE)
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        workbook.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        workbook.writestr('xl/workbook.xml', _XLSX_WORKBOOK)
+        workbook.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(EXPORT_COLUMNS).encode('utf-8'))
+            for rows in iter_export_rows(filters, tz):
+                sheet.write(''.join(_xlsx_row(row) for row in rows).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+    spool.seek(0)
+    try:
+        while True:
+            chunk = spool.read(EXPORT_STREAM_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
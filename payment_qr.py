@@ -0,0 +1,42 @@
+"""
+UPI payment QR codes, rendered as SVG.
+
+The payload only depends on the payee and the amount, so rendered codes are
+kept in an LRU cache keyed by the payload and served with an ETag derived
+from its hash; browsers revalidate instead of downloading them again.
+"""
+
+import hashlib
+from functools import lru_cache
+from urllib.parse import quote
+
+import qrcode
+import qrcode.image.svg
+
+UPI_PAYEE_ADDRESS = 'nationalscaffolding@phonepe'
+UPI_PAYEE_NAME = 'The National Scaffolding'
+QR_CACHE_SIZE = 256
+
+
+def format_upi_amount(amount):
+    """Amount as it appears in the payload and the QR url, e.g. '1770.00'"""
+    return f'{float(amount):.2f}'
+
+
+def upi_payload(amount):
+    """upi://pay link for the payee and amount"""
+    return (f'upi://pay?pa={UPI_PAYEE_ADDRESS}&pn={quote(UPI_PAYEE_NAME)}'
+            f'&am={format_upi_amount(amount)}&cu=INR')
+
+
+def qr_etag(payload):
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def render_qr_svg(payload):
+    """SVG bytes for a QR code of the payload"""
+    qr = qrcode.QRCode(box_size=10, border=4, image_factory=qrcode.image.svg.SvgPathImage)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.make_image().to_string(encoding='unicode').encode('utf-8')
@@ -0,0 +1,244 @@
+"""
+Ordered product images (ProductImage rows)
+
+Product.image_url is kept as a comma-separated mirror of the rows so older
+templates and scripts keep working, but routes should read and write images
+through the helpers below.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+import re
+from collections import namedtuple
+
+from flask import current_app
+from PIL import Image
+from sqlalchemy import func
+
+from models import db, Product, ProductImage, CuplockVerticalCup
+from utils import UPLOAD_CHUNK_SIZE, image_exists
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_IMAGE = 'images/no-image.png'
+
+
+def split_image_csv(image_url):
+    """Legacy Product.image_url CSV -> list of stripped paths"""
+    return [u.strip() for u in (image_url or '').split(',') if u.strip()]
+
+
+def image_fs_path(path):
+    """Stored path ('uploads/x.jpg', '/static/uploads/x.jpg') -> file on disk"""
+    path = path.strip().lstrip('/')
+    if path.startswith('static/'):
+        path = path[len('static/'):]
+    return os.path.join(current_app.static_folder, path)
+
+
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{64})\.[a-z0-9]+$')
+
+
+def _dominant_color(img):
+    """Most common colour of a 64px thumbnail, as '#rrggbb'"""
+    small = img.convert('RGB')
+    small.thumbnail((64, 64))
+    palette = small.quantize(colors=4)
+    count, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def _file_sha256(fs_path):
+    # Uploads are stored as <sha256>.<ext>, so the name already is the hash
+    match = CONTENT_ADDRESSED_NAME.match(os.path.basename(fs_path))
+    if match:
+        return match.group(1)
+    digest = hashlib.sha256()
+    with open(fs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_image_metadata(path):
+    """
+    Return {width, height, bytes, format, dominant_color, sha256} for a
+    stored image path. Called once when the image row is created; after
+    that everything reads the row instead of opening the file.
+    """
+    meta = {'width': None, 'height': None, 'bytes': None, 'format': None,
+            'dominant_color': None, 'sha256': None}
+    if path.startswith('http://') or path.startswith('https://'):
+        return meta
+    fs_path = image_fs_path(path)
+    try:
+        meta['bytes'] = os.path.getsize(fs_path)
+        meta['sha256'] = _file_sha256(fs_path)
+        with Image.open(fs_path) as img:
+            meta['width'], meta['height'] = img.size
+            meta['format'] = img.format
+            meta['dominant_color'] = _dominant_color(img)
+    except Exception as e:
+        logger.warning(f"Could not read image metadata for {path}: {e}")
+    return meta
+
+
+def image_row_diagnostic(row):
+    """
+    Diagnostics entry for a ProductImage row, built from its stored
+    metadata. Same keys as app.validate_image_file(); no image decoding.
+    """
+    fs_path = image_fs_path(row.path)
+    diagnostic = {
+        'filepath': fs_path,
+        'exists': image_exists(fs_path),
+        'readable': False,
+        'valid': False,
+        'format': row.format,
+        'size_bytes': row.bytes or 0,
+        'dimensions': f"{row.width}x{row.height}" if row.width and row.height else None,
+        'dominant_color': row.dominant_color,
+        'sha256': row.sha256,
+        'error': None
+    }
+    if not diagnostic['exists']:
+        diagnostic['error'] = 'File does not exist on disk'
+    elif not row.format:
+        diagnostic['readable'] = row.bytes is not None
+        diagnostic['error'] = 'Image could not be decoded when it was uploaded'
+    else:
+        diagnostic['readable'] = True
+        diagnostic['valid'] = True
+    return diagnostic
+
+
+def product_image_paths(product):
+    """Ordered image paths for a product; falls back to the CSV for unmigrated rows"""
+    if product.images:
+        return [img.path for img in product.images]
+    return split_image_csv(product.image_url)
+
+
+def _mirror_image_csv(product, paths, placeholder):
+    product.image_url = ','.join(paths) if paths else placeholder
+
+
+def set_product_images(product, paths, placeholder=None):
+    """
+    Make the product's images exactly `paths`, in order. Existing rows are
+    reused (keeping their metadata), missing ones are created and the rest
+    are deleted. Does NOT commit.
+    """
+    paths = [p for p in paths if p and p != PLACEHOLDER_IMAGE]
+    existing = {img.path: img for img in product.images}
+
+    rows = []
+    for position, path in enumerate(paths):
+        row = existing.pop(path, None)
+        if row is None:
+            row = ProductImage(path=path, **read_image_metadata(path))
+        row.position = position
+        rows.append(row)
+
+    # Assigning the list lets delete-orphan remove rows that were dropped
+    product.images = rows
+    _mirror_image_csv(product, paths, placeholder)
+    return rows
+
+
+def remove_product_image(product, path, placeholder=None):
+    """Delete one image row and close the gap in positions. Does NOT commit."""
+    if not product.images:
+        # Not migrated yet: convert the CSV to rows minus this image
+        paths = split_image_csv(product.image_url)
+        if path not in paths:
+            return False
+        paths.remove(path)
+        set_product_images(product, paths, placeholder)
+        return True
+
+    row = next((img for img in product.images if img.path == path), None)
+    if row is None:
+        return False
+
+    removed_position = row.position
+    product.images.remove(row)
+    for img in product.images:
+        if img.position > removed_position:
+            img.position -= 1
+
+    _mirror_image_csv(product, [img.path for img in product.images], placeholder)
+    return True
+
+
+def load_primary_images(product_ids):
+    """{product_id: path} of the first image for many products in one query"""
+    return {pid: row.path for pid, row in load_primary_image_rows(product_ids).items()}
+
+
+PrimaryImage = namedtuple('PrimaryImage', ['path', 'width', 'height', 'dominant_color'])
+
+
+def load_primary_image_rows(product_ids):
+    """{product_id: PrimaryImage} with the stored metadata of each first image"""
+    if not product_ids:
+        return {}
+    rows = db.session.query(
+        ProductImage.product_id, ProductImage.path, ProductImage.width,
+        ProductImage.height, ProductImage.dominant_color
+    ).filter(
+        ProductImage.product_id.in_(list(product_ids)),
+        ProductImage.position == 0
+    ).all()
+    return {product_id: PrimaryImage(*rest) for product_id, *rest in rows}
+
+
+def primary_image_path(product, primary_images):
+    """Primary image from a load_primary_images() map, else the first CSV entry"""
+    path = primary_images.get(product.id)
+    if path:
+        return path
+    paths = split_image_csv(product.image_url)
+    return paths[0] if paths else None
+
+
+def normalize_image_path(path):
+    """'/static/uploads/x.jpg' -> 'uploads/x.jpg' (the form stored in the DB)"""
+    path = (path or '').strip().lstrip('/')
+    if path.startswith('static/'):
+        path = path[len('static/'):]
+    return path
+
+
+def image_reference_count(path):
+    """
+    How many products and cup configurations still use `path`. Uploads are
+    content-addressed, so one file can back several products; only unlink it
+    when this returns 0. Deactivated products count too: their rows (and
+    order history) stay around and may be switched back on.
+    """
+    path = normalize_image_path(path)
+    if not path:
+        return 0
+    # Legacy rows may keep a '/static/' or 'static/' prefix
+    stored_forms = [path, f'/{path}', f'static/{path}', f'/static/{path}']
+
+    count = db.session.query(func.count(ProductImage.id)).filter(
+        ProductImage.path.in_(stored_forms)
+    ).scalar() or 0
+
+    # Products whose images were never migrated only have the CSV
+    count += Product.query.filter(
+        ~Product.images.any(),
+        # Escape LIKE wildcards: '_' is common in legacy file names
+        Product.image_url.contains(path, autoescape=True)
+    ).count()
+
+    # Cup images are stored either as a bare file name or as uploads/<name>
+    count += CuplockVerticalCup.query.filter(
+        CuplockVerticalCup.cup_image_url.in_(stored_forms + [posixpath.basename(path)])
+    ).count()
+
+    return count
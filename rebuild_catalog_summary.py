@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+"""Rebuild product_catalog_summary for every product"""
+
+from app import app, db
+from catalog import bump_catalog_version, rebuild_catalog_summary
+
+def rebuild():
+    with app.app_context():
+        db.create_all()
+
+        print('\nRebuilding product_catalog_summary...')
+        print('='*100)
+
+        count = rebuild_catalog_summary()
+
+        # Make every worker pick up the rebuilt rows
+        bump_catalog_version()
+        db.session.commit()
+        print(f'\n✅ Rebuilt catalog summary for {count} products')
+
+if __name__ == '__main__':
+    rebuild()
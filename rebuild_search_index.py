@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""
+Rebuild the product search index.
+
+Usage: python rebuild_search_index.py
+
+Creates product_search (tsvector + pg_trgm on Postgres, FTS5 on sqlite) if
+needed and re-indexes every product. The app does not create the table
+itself, so run this once when deploying search (search falls back to a name
+LIKE until then). Admin edits keep it current through catalog_changed(), so
+afterwards it is only needed after bulk imports or restores.
+"""
+
+from app import app, db
+from search import rebuild_search_index
+
+def rebuild_product_search():
+    with app.app_context():
+        db.create_all()
+        indexed = rebuild_search_index()
+        print(f'\n✅ Indexed {indexed} active products for search')
+
+if __name__ == '__main__':
+    rebuild_product_search()
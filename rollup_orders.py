@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Backfill or check the daily analytics rollups.
+
+Usage: python rollup_orders.py [--check]
+
+Without arguments the rollup tables are rebuilt from the order tables.
+--check compares them against a recomputation and exits non-zero on drift.
+"""
+
+import sys
+
+from app import app, db
+from analytics import rebuild_order_rollups, reconcile_order_rollups
+
+def backfill_order_rollups():
+    with app.app_context():
+        db.create_all()
+        order_rows, category_rows = rebuild_order_rollups()
+        db.session.commit()
+        print(f'\n✅ Rebuilt rollups: {order_rows} order rows, {category_rows} category rows')
+
+def check_order_rollups():
+    with app.app_context():
+        mismatches = reconcile_order_rollups()
+
+        print(f'\nReconciling order rollups')
+        print('='*100)
+        for table, key, stored, expected in mismatches:
+            print(f'❌ {table} {key}: stored {stored}, expected {expected}')
+
+        if mismatches:
+            print(f'\n{len(mismatches)} rows differ; run python rollup_orders.py to rebuild')
+            return False
+        print('\n✅ Rollups match the order tables')
+        return True
+
+if __name__ == '__main__':
+    if '--check' in sys.argv:
+        sys.exit(0 if check_order_rollups() else 1)
+    backfill_order_rollups()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Validate every product image from the command line.
+
+Usage: python run_image_diagnostics.py [--full] [--ndjson] [--workers N]
+
+Only files whose size or mtime changed since the last run (route or CLI)
+are decoded again, and images whose metadata was stored at upload are
+answered from it; --full decodes every file, ignoring both.
+"""
+
+import argparse
+import json
+
+from app import app, image_diagnostics_targets
+from image_diagnostics import DIAGNOSTICS_WORKERS, run_image_diagnostics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate product images')
+    parser.add_argument('--full', action='store_true', help='recheck every file, ignoring the cache')
+    parser.add_argument('--ndjson', action='store_true', help='print raw NDJSON lines')
+    parser.add_argument('--workers', type=int, default=DIAGNOSTICS_WORKERS)
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        targets = image_diagnostics_targets(full=args.full)
+        if not args.ndjson:
+            print(f'\nChecking images for {len(targets)} products')
+            print('='*100)
+
+        for result in run_image_diagnostics(targets, workers=args.workers, full=args.full):
+            if args.ndjson:
+                print(json.dumps(result), flush=True)
+                continue
+
+            if result['type'] == 'product':
+                for img in result['images']:
+                    if not img['valid']:
+                        print(f"❌ {result['product_name']} (#{result['product_id']}): "
+                              f"{img['filepath']} - {img['error']}")
+            else:
+                print(f"\n✅ {result['total_images']} images: {result['valid_images']} valid, "
+                      f"{result['missing_images']} missing, {result['corrupted_images']} corrupted "
+                      f"({result['total_size_mb']} MB)")
+                print(f"   {result['rechecked']} files rechecked, {result['cached']} from cache, "
+                      f"{result['from_metadata']} from upload metadata")
+
+if __name__ == '__main__':
+    main()
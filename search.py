@@ -0,0 +1,240 @@
+"""
+Full-text product search.
+
+Each active product has one row in product_search holding its name and a
+body of description, category and size labels. On Postgres the row carries
+a weighted tsvector behind a GIN index, plus a pg_trgm index on the name for
+misspelt queries; on the sqlite fallback product_search is an FTS5 table
+keyed by rowid = product id. Rows are refreshed from catalog_changed(), in
+the same transaction as the admin write.
+
+The table is created and filled by rebuild_search_index.py (a deploy step),
+not at app startup: every worker would race to create and backfill it. Until
+it exists, refreshes are skipped and search falls back to a LIKE on names.
+"""
+
+import logging
+import re
+
+from sqlalchemy import bindparam, text, union_all
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Product, CuplockVerticalSize, CuplockLedgerSize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 24
+SEARCH_MAX_TERMS = 8
+# pg_trgm similarity a name needs to be returned by the fallback
+TRIGRAM_THRESHOLD = 0.3
+
+# Set once the table (and the pg_trgm index) is seen; they are never dropped
+_search_ready = False
+_trigram_ready = False
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def search_terms(query):
+    """Lower-cased word tokens of a user query (at most SEARCH_MAX_TERMS)"""
+    return re.findall(r'\w+', (query or '').lower())[:SEARCH_MAX_TERMS]
+
+
+def search_index_ready():
+    """
+    Whether product_search exists in the database. Checked against the
+    catalog rather than a flag set at startup, so a worker that started
+    before rebuild_search_index.py ran picks the table up; a positive
+    answer is remembered for the life of the process.
+    """
+    global _search_ready, _trigram_ready
+    if _search_ready:
+        return True
+
+    dialect = _dialect()
+    if dialect == 'postgresql':
+        found = db.session.execute(text(
+            "SELECT to_regclass('product_search'), to_regclass('ix_product_search_name_trgm')"
+        )).first()
+        _search_ready, _trigram_ready = found[0] is not None, found[1] is not None
+    elif dialect == 'sqlite':
+        _search_ready = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+        )).first() is not None
+    return _search_ready
+
+
+def ensure_search_index():
+    """
+    Create product_search and its indexes if missing. Run from
+    rebuild_search_index.py, never from a request or at import.
+    """
+    global _search_ready, _trigram_ready
+
+    dialect = _dialect()
+    if dialect == 'postgresql':
+        with db.engine.connect() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS product_search (
+                    product_id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL DEFAULT '',
+                    body TEXT NOT NULL DEFAULT '',
+                    document tsvector GENERATED ALWAYS AS (
+                        setweight(to_tsvector('simple', name), 'A') ||
+                        setweight(to_tsvector('simple', body), 'B')
+                    ) STORED
+                );
+                CREATE INDEX IF NOT EXISTS ix_product_search_document ON product_search USING GIN (document);
+            """))
+            conn.commit()
+            # pg_trgm needs a role allowed to create extensions; search works without it
+            try:
+                conn.execute(text("""
+                    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                    CREATE INDEX IF NOT EXISTS ix_product_search_name_trgm
+                        ON product_search USING GIN (name gin_trgm_ops);
+                """))
+                conn.commit()
+                _trigram_ready = True
+            except SQLAlchemyError as e:
+                conn.rollback()
+                logger.warning(f"pg_trgm unavailable, misspelt searches will return nothing: {e}")
+    elif dialect == 'sqlite':
+        with db.engine.connect() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS product_search "
+                "USING fts5(name, body, tokenize='porter unicode61')"
+            ))
+            conn.commit()
+    else:
+        logger.warning(f"No full-text index for {dialect}; search falls back to LIKE")
+        return False
+
+    _search_ready = True
+    return True
+
+
+def _size_labels(product_ids):
+    """{product_id: [active size labels]} for vertical and ledger sizes"""
+    labels = {}
+    statement = union_all(*[
+        db.session.query(model.product_id, model.size_label).filter(
+            model.product_id.in_(product_ids), model.is_active == True
+        ).statement
+        for model in (CuplockVerticalSize, CuplockLedgerSize)
+    ])
+    for product_id, label in db.session.execute(statement):
+        labels.setdefault(product_id, []).append(label)
+    return labels
+
+
+def _documents(product_ids):
+    """[(product_id, name, body)] for the active products among `product_ids`"""
+    products = db.session.query(
+        Product.id, Product.name, Product.description, Product.category, Product.cuplock_type
+    ).filter(Product.id.in_(product_ids), Product.is_active == True).all()
+    labels = _size_labels(product_ids)
+    return [
+        (p.id, p.name or '', ' '.join(filter(None, [
+            p.description, p.category, p.cuplock_type, ' '.join(labels.get(p.id, []))
+        ])))
+        for p in products
+    ]
+
+
+def refresh_search_index(*product_ids):
+    """
+    Rewrite the search rows of `product_ids` (dropping inactive or deleted
+    products) in the caller's transaction. Does NOT commit.
+    """
+    product_ids = {int(pid) for pid in product_ids if pid is not None}
+    if not product_ids or not search_index_ready():
+        return 0
+
+    key = 'rowid' if _dialect() == 'sqlite' else 'product_id'
+    ids = list(product_ids)
+    db.session.execute(text(f"DELETE FROM product_search WHERE {key} IN :ids").bindparams(
+        bindparam('ids', expanding=True)
+    ), {'ids': ids})
+
+    documents = _documents(ids)
+    if documents:
+        db.session.execute(
+            text(f"INSERT INTO product_search ({key}, name, body) VALUES (:id, :name, :body)"),
+            [{'id': pid, 'name': name, 'body': body} for pid, name, body in documents]
+        )
+    return len(documents)
+
+
+def rebuild_search_index(batch_size=500):
+    """Create the index if needed and re-index every product, committing per batch"""
+    if not ensure_search_index():
+        return 0
+    db.session.execute(text("DELETE FROM product_search"))
+    product_ids = [pid for (pid,) in db.session.query(Product.id).order_by(Product.id).all()]
+    indexed = 0
+    for start in range(0, len(product_ids), batch_size):
+        indexed += refresh_search_index(*product_ids[start:start + batch_size])
+        db.session.commit()
+    db.session.commit()
+    return indexed
+
+
+def _page_ids(rows, per_page):
+    ids = [row[0] for row in rows]
+    return ids[:per_page], len(ids) > per_page
+
+
+def search_product_ids(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Ranked product ids for one page of results: (ids, has_next).
+    Every word must match, the last one as a prefix so results follow typing.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    page = max(int(page or 1), 1)
+    params = {'limit': per_page + 1, 'offset': (page - 1) * per_page}
+
+    dialect = _dialect()
+    ready = search_index_ready()
+    if ready and dialect == 'postgresql':
+        params['tsquery'] = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        rows = db.session.execute(text("""
+            SELECT product_id FROM product_search, to_tsquery('simple', :tsquery) AS query
+            WHERE document @@ query
+            ORDER BY ts_rank_cd(document, query) DESC, product_id
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+        # Trigram fallback only when no document matches at all (not just past the last page)
+        no_match = not rows and (page == 1 or db.session.execute(text("""
+            SELECT 1 FROM product_search WHERE document @@ to_tsquery('simple', :tsquery) LIMIT 1
+        """), params).first() is None)
+        if no_match and _trigram_ready:
+            params.update(q=' '.join(terms), threshold=TRIGRAM_THRESHOLD)
+            rows = db.session.execute(text("""
+                SELECT product_id FROM product_search
+                WHERE name % :q AND similarity(name, :q) >= :threshold
+                ORDER BY similarity(name, :q) DESC, product_id
+                LIMIT :limit OFFSET :offset
+            """), params).all()
+        return _page_ids(rows, per_page)
+
+    if ready and dialect == 'sqlite':
+        params['match'] = ' '.join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        rows = db.session.execute(text("""
+            SELECT rowid FROM product_search
+            WHERE product_search MATCH :match
+            ORDER BY bm25(product_search, 10.0, 1.0), rowid
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+        return _page_ids(rows, per_page)
+
+    # No index: unranked name match
+    conditions = [Product.name.ilike(f'%{t}%') for t in terms]
+    rows = db.session.query(Product.id).filter(Product.is_active == True, *conditions).order_by(
+        Product.id
+    ).limit(per_page + 1).offset(params['offset']).all()
+    return _page_ids(rows, per_page)
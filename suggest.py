@@ -0,0 +1,230 @@
+"""
+In-memory prefix index for search-box autocomplete.
+
+Product names (from every word, so "head" finds "U Head Jack"), category
+names and the cuplock size labels live in one sorted array; a lookup bisects
+to the window of keys starting with the typed prefix and ranks inside it.
+The index follows the catalog snapshot by diffing it per product, merging
+the changed entries into a fresh array in one pass. A background thread per
+worker re-checks the catalog version every SUGGEST_REFRESH_SECONDS; requests
+only ever read the in-memory index and never touch the database.
+"""
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from catalog import get_catalog_snapshot
+from cuplock_routes import LEDGER_SIZES, VERTICAL_SIZES
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 8
+SUGGEST_MIN_CHARS = 1
+SUGGEST_REFRESH_SECONDS = 30
+
+# Suggestion kinds, in the order they are listed for equally good matches
+PRODUCT, CATEGORY, SIZE = 0, 1, 2
+KIND_NAMES = {PRODUCT: 'product', CATEGORY: 'category', SIZE: 'size'}
+
+# `id` and `category` are set for product suggestions, enough for product_page_url()
+Suggestion = namedtuple('Suggestion', ['kind', 'label', 'id', 'category'])
+
+# Sorts after every key that starts with a given prefix
+_PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'[\w.]+', (text or '').lower()))
+
+
+def _word_suffixes(text):
+    """'u head jack' -> [('u head jack', 0), ('head jack', 1), ('jack', 2)]"""
+    words = normalize(text).split()
+    return [(' '.join(words[i:]), i) for i in range(len(words))]
+
+
+def _rank(entry):
+    """Start-of-name matches first, then by kind and label"""
+    return entry[1] > 0, entry[2], entry[3].lower()
+
+
+class SuggestIndex:
+    """
+    Sorted (key, word position, kind, label, product id) entries. Product
+    entries are remembered per product so a changed product is re-keyed
+    without rebuilding the rest.
+    """
+    __slots__ = ('entries', 'products', 'categories', 'snapshot', 'checked_at', 'lock')
+
+    def __init__(self):
+        self.entries = []
+        self.products = {}      # product id -> (name, category, entries)
+        self.categories = {}    # category -> number of products using it
+        self.snapshot = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.entries = sorted({(normalize(label), 0, SIZE, label, None)
+                               for label in set(LEDGER_SIZES) | set(VERTICAL_SIZES)})
+
+    def _add_product(self, delta, product_id, name, category):
+        keys = [(key, position, PRODUCT, name, product_id) for key, position in _word_suffixes(name)]
+        for entry in keys:
+            delta[entry] = delta.get(entry, 0) + 1
+        self.products[product_id] = (name, category, keys)
+        if category:
+            self.categories[category] = self.categories.get(category, 0) + 1
+            if self.categories[category] == 1:
+                for key, position in _word_suffixes(category):
+                    entry = (key, position, CATEGORY, category, None)
+                    delta[entry] = delta.get(entry, 0) + 1
+
+    def _remove_product(self, delta, product_id):
+        name, category, keys = self.products.pop(product_id)
+        for entry in keys:
+            delta[entry] = delta.get(entry, 0) - 1
+        if category:
+            self.categories[category] -= 1
+            if not self.categories[category]:
+                del self.categories[category]
+                for key, position in _word_suffixes(category):
+                    entry = (key, position, CATEGORY, category, None)
+                    delta[entry] = delta.get(entry, 0) - 1
+
+    def sync(self, snapshot):
+        """
+        Apply the products that were added, changed or removed since the
+        last snapshot. Changes are collected first and merged into a new
+        array in one pass (a sort of the additions plus a linear merge, so
+        the first build is one sort), which then replaces `entries`: lookups
+        running meanwhile see a consistent array.
+        """
+        # entry -> +1 added / -1 removed; an entry removed and re-added nets out
+        delta = {}
+        current = {p.id: (p.name or '', p.category) for p in snapshot.products}
+        changed = 0
+        for product_id in [pid for pid in self.products if pid not in current]:
+            self._remove_product(delta, product_id)
+            changed += 1
+        for product_id, (name, category) in current.items():
+            known = self.products.get(product_id)
+            if known is not None and known[:2] == (name, category):
+                continue
+            if known is not None:
+                self._remove_product(delta, product_id)
+            self._add_product(delta, product_id, name, category)
+            changed += 1
+
+        removed = {entry for entry, count in delta.items() if count < 0}
+        added = sorted(entry for entry, count in delta.items() if count > 0)
+        kept = [entry for entry in self.entries if entry not in removed] if removed else self.entries
+        self.entries = list(heapq.merge(kept, added)) if added else list(kept)
+        self.snapshot = snapshot
+        return changed
+
+    def lookup(self, prefix, limit=SUGGEST_LIMIT):
+        """
+        Up to `limit` distinct suggestions for `prefix`: (kind, label,
+        product id). Matches at the start of a name come before matches
+        on a later word.
+        """
+        prefix = normalize(prefix)
+        if len(prefix) < SUGGEST_MIN_CHARS:
+            return []
+
+        entries = self.entries
+        start = bisect_left(entries, (prefix,))
+        end = bisect_left(entries, (prefix + _PREFIX_END,), start)
+        window = entries[start:end]
+
+        # Rank the whole window, taking only as many of the best as needed;
+        # a name matching on several words needs more than `limit`
+        wanted = limit * 2
+        while True:
+            seen = set()
+            results = []
+            best = heapq.nsmallest(wanted, window, key=_rank)
+            for key, position, kind, label, product_id in best:
+                marker = (kind, product_id if kind == PRODUCT else label)
+                if marker in seen:
+                    continue
+                seen.add(marker)
+                results.append((kind, label, product_id))
+                if len(results) == limit:
+                    return results
+            if len(best) == len(window):
+                return results
+            wanted *= 4
+
+
+_index = SuggestIndex()
+_refresher_lock = threading.Lock()
+_refresher_pid = None
+
+
+def get_suggest_index():
+    """The process-wide index, as last synced; never touches the database"""
+    return _index
+
+
+def refresh_suggest_index():
+    """
+    Sync the index with the catalog snapshot (one version query, plus a
+    product load when the catalog changed). Needs an app context; run by
+    the refresher thread, tests and maintenance scripts.
+    """
+    index = _index
+    snapshot = get_catalog_snapshot()
+    with index.lock:
+        if snapshot is not index.snapshot:
+            index.sync(snapshot)
+        index.checked_at = time.monotonic()
+    return index
+
+
+def _refresh_loop(app, interval):
+    while True:
+        try:
+            with app.app_context():
+                refresh_suggest_index()
+        except Exception as e:
+            logger.error(f"Suggest index refresh failed: {e}")
+        time.sleep(interval)
+
+
+def ensure_suggest_refresher(app, interval=SUGGEST_REFRESH_SECONDS):
+    """
+    Start this worker's refresher thread unless it is already running. Keyed
+    by pid: a thread started before the server forks does not survive into
+    the workers.
+    """
+    global _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher_pid == os.getpid():
+            return
+        threading.Thread(target=_refresh_loop, args=(app, interval),
+                         name='suggest-refresher', daemon=True).start()
+        _refresher_pid = os.getpid()
+
+
+def clear_suggest_index():
+    """Start over from an empty index (used by tests and maintenance scripts)"""
+    global _index
+    _index = SuggestIndex()
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    """Autocomplete Suggestions for `prefix`; empty until the first refresh"""
+    index = get_suggest_index()
+    return [
+        Suggestion(KIND_NAMES[kind], label, product_id,
+                   index.products.get(product_id, (None, None))[1] if kind == PRODUCT else None)
+        for kind, label, product_id in index.lookup(prefix, limit)
+    ]
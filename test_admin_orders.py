@@ -0,0 +1,101 @@
+"""
+Tests for the paginated /admin_orders page
+"""
+
+import re
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from test_support import DatabaseTestCase
+import app as app_module
+from app import app, db
+from models import Admin, User, Product, Order, OrderItem
+from analytics import order_panel_mask, snapshot_order_item
+
+
+class AdminOrdersTestCase(DatabaseTestCase):
+    """Test suite for admin order listing"""
+
+    def login_admin(self, panel_type):
+        admin = Admin(username=f'{panel_type}_admin', password_hash='secret', panel_type=panel_type)
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin_id)
+            sess['user_type'] = 'admin'
+            sess['panel_type'] = panel_type
+
+    def seed(self, count):
+        user = User(username='buyer', full_name='Buyer', email='b@example.com', phone='9000000000')
+        user.set_password('secret')
+        frame = Product(name='Frame', price=100, category='h-frames', product_type='scaffolding')
+        gate = Product(name='Gate', price=500, category='steel', product_type='fabrication')
+        db.session.add_all([user, frame, gate])
+        db.session.flush()
+
+        base = datetime(2025, 1, 1)
+        for i in range(count):
+            product = frame if i % 2 == 0 else gate
+            order = Order(user_id=user.id, total_price=100, status='completed',
+                          order_date=base + timedelta(hours=i))
+            db.session.add(order)
+            db.session.flush()
+            item = OrderItem(order_id=order.id, product_id=product.id,
+                             product_name=product.name, quantity=1, price=100)
+            snapshot_order_item(item, product)
+            db.session.add(item)
+            order.panel_mask = order_panel_mask([item.panel])
+        # Pending orders are visible to every panel
+        db.session.add(Order(user_id=user.id, total_price=50, status='pending_verification',
+                             order_date=base - timedelta(days=1)))
+        db.session.commit()
+
+    def order_ids(self, html):
+        return [int(i) for i in re.findall(r'data-order-id="(\d+)"', html)]
+
+    def test_keyset_pages_cover_panel_orders_once(self):
+        with self.app.app_context():
+            self.seed(app_module.ADMIN_ORDERS_PAGE_SIZE * 2 + 10)
+            self.login_admin('scaffolding')
+
+            seen = []
+            url = '/admin_orders'
+            pages = 0
+            while url:
+                html = self.client.get(url).get_data(as_text=True)
+                seen.extend(self.order_ids(html))
+                pages += 1
+                match = re.search(r'href="([^"]*before=[^"]*)"', html)
+                url = match.group(1).replace('&amp;', '&') if match else None
+
+            expected = [o.id for o in Order.query.order_by(Order.order_date.desc(), Order.id.desc())
+                        if o.status == 'pending_verification'
+                        or o.items[0].product_id == Product.query.filter_by(name='Frame').one().id]
+            self.assertEqual(seen, expected)
+            self.assertEqual(pages, 2)
+
+    def test_filters_and_fixed_query_count(self):
+        with self.app.app_context():
+            self.seed(30)
+            self.login_admin('fabrication')
+
+            html = self.client.get('/admin_orders?status=pending_verification').get_data(as_text=True)
+            self.assertEqual(len(self.order_ids(html)), 1)
+
+            html = self.client.get('/admin_orders?start=2025-01-01&end=2025-01-01').get_data(as_text=True)
+            self.assertEqual(len(self.order_ids(html)), 12)
+
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                self.client.get('/admin_orders')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            # admin load, status counts, page, users, items
+            self.assertLessEqual(len(statements), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Tests for analytics.py order aggregation
+"""
+
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+from test_support import DatabaseTestCase
+from app import db
+from models import User, Product, Order, OrderItem, DailyOrderRollup
+from analytics import (ensure_order_rollups, live_order_analytics, order_analytics, order_panel_mask,
+                       panel_mask_filter, parse_date_range, pending_order_backfills, rebuild_order_rollups, reconcile_order_rollups, record_order_placed,
+                       record_order_status_change, snapshot_order_item)
+from backfill_order_panels import backfill_order_panels
+
+
+class AnalyticsTestCase(DatabaseTestCase):
+    """Test suite for SQL-side order analytics"""
+
+    def seed(self):
+        user = User(username='buyer', full_name='Buyer', email='b@example.com', phone='9000000000')
+        user.set_password('secret')
+        frame = Product(name='Frame', price=100, category='h-frames', product_type='scaffolding')
+        gate = Product(name='Gate', price=500, category='steel', product_type='fabrication')
+        db.session.add_all([user, frame, gate])
+        db.session.flush()
+
+        def order(when, total, items):
+            o = Order(user_id=user.id, total_price=total, order_date=when, status='completed')
+            db.session.add(o)
+            db.session.flush()
+            lines = []
+            for product, qty, price in items:
+                line = OrderItem(order_id=o.id, product_id=product.id, product_name=product.name,
+                                 quantity=qty, price=price)
+                snapshot_order_item(line, product)
+                lines.append(line)
+            db.session.add_all(lines)
+            o.panel_mask = order_panel_mask(line.panel for line in lines)
+
+        order(datetime(2024, 1, 5), 236, [(frame, 2, 100)])
+        order(datetime(2024, 1, 20), 590, [(gate, 1, 500)])
+        order(datetime(2025, 3, 1), 708, [(frame, 1, 100), (gate, 1, 500)])
+        rebuild_order_rollups()
+        db.session.commit()
+        return user, frame, gate
+
+    def test_monthly_yearly_and_category_totals(self):
+        with self.app.app_context():
+            self.seed()
+
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                data = live_order_analytics()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+            self.assertEqual(len(statements), 2)
+            self.assertEqual(data['sorted_months'], ['2024-01', '2025-03'])
+            self.assertEqual(data['monthly_data']['2024-01'], {'revenue': 826.0, 'orders': 2})
+            self.assertEqual(data['yearly_data']['2025'], {'revenue': 708.0, 'orders': 1})
+            self.assertEqual(data['category_data']['h-frames'], {'revenue': 300.0, 'quantity': 3})
+            self.assertEqual(data['category_data']['steel'], {'revenue': 1000.0, 'quantity': 2})
+            self.assertEqual(data['total_orders'], 3)
+            self.assertAlmostEqual(data['avg_order_value'], 1534 / 3)
+
+    def test_panel_and_date_filters(self):
+        with self.app.app_context():
+            self.seed()
+
+            data = order_analytics('scaffolding')
+            self.assertEqual(data['total_orders'], 2)
+            # Mixed orders still report every item they contain
+            self.assertEqual(data['category_data']['steel'], {'revenue': 500.0, 'quantity': 1})
+
+            start, end = parse_date_range('2024-01-01', '2024-01-20')
+            data = order_analytics('fabrication', start, end)
+            self.assertEqual(data['total_orders'], 1)
+            self.assertEqual(list(data['category_data']), ['steel'])
+
+            self.assertEqual(parse_date_range('bad', ''), (None, None))
+
+    def test_rollups_match_live_queries(self):
+        with self.app.app_context():
+            self.seed()
+            start, end = parse_date_range('2024-01-01', '2024-12-31')
+            for panel in (None, 'scaffolding', 'fabrication'):
+                self.assertEqual(order_analytics(panel), live_order_analytics(panel))
+                self.assertEqual(order_analytics(panel, start, end), live_order_analytics(panel, start, end))
+
+    def test_rollup_backfill_runs_once(self):
+        with self.app.app_context():
+            self.seed()
+            DailyOrderRollup.query.delete()
+            db.session.commit()
+
+            # Overlapping deploy runs: only the first one may backfill
+            ensure_order_rollups()
+            ensure_order_rollups()
+            self.assertEqual(reconcile_order_rollups(), [])
+
+    def test_rollups_follow_new_orders_and_status_changes(self):
+        with self.app.app_context():
+            user, frame, gate = self.seed()
+
+            # 2 frames at 100 + 18% GST + 50 deposit
+            o = Order(user_id=user.id, total_price=286, order_date=datetime(2025, 3, 2),
+                      status='pending_verification')
+            db.session.add(o)
+            db.session.flush()
+            line = OrderItem(order_id=o.id, product_id=frame.id, product_name='Frame', quantity=2, price=100)
+            snapshot_order_item(line, frame)
+            db.session.add(line)
+            o.panel_mask = order_panel_mask([line.panel])
+            record_order_placed(o)
+            db.session.commit()
+
+            row = db.session.get(DailyOrderRollup, (o.order_date.date(), 'scaffolding', 'pending_verification'))
+            self.assertEqual((float(row.revenue), row.order_count, float(row.deposit_total)), (286.0, 1, 50.0))
+
+            o.status = 'completed'
+            record_order_status_change(o, 'pending_verification')
+            db.session.commit()
+
+            self.assertEqual(reconcile_order_rollups(), [])
+            self.assertEqual(order_analytics('scaffolding')['monthly_data']['2025-03'],
+                             {'revenue': 994.0, 'orders': 2})
+
+            # Drift is reported
+            o.total_price = 300
+            db.session.commit()
+            self.assertEqual(len([m for m in reconcile_order_rollups() if m[0] == 'daily_order_rollups']), 2)
+
+    def test_backfill_snapshots_existing_orders(self):
+        with self.app.app_context():
+            self.seed()
+            expected = {panel: order_analytics(panel) for panel in (None, 'scaffolding', 'fabrication')}
+            # Orders placed before the snapshot columns existed
+            db.session.query(OrderItem).update({'product_category': None, 'cuplock_type': None, 'panel': None})
+            db.session.query(Order).update({'panel_mask': 0})
+            db.session.commit()
+
+            backfill_order_panels(full=True)
+
+            self.assertEqual(sorted(o.panel_mask for o in Order.query), [1, 2, 3])
+            self.assertEqual({i.panel for i in OrderItem.query}, {'scaffolding', 'fabrication'})
+            for panel, data in expected.items():
+                self.assertEqual(order_analytics(panel), data)
+            self.assertEqual(reconcile_order_rollups(), [])
+
+    def test_backfill_fills_orders_missing_panels(self):
+        with self.app.app_context():
+            self.seed()
+            expected = order_analytics('fabrication')
+            # Orders from before the columns existed: NULL (or the old default 0) mask, no item snapshot
+            db.session.query(OrderItem).update({'product_category': None, 'cuplock_type': None, 'panel': None})
+            db.session.query(Order).update({'panel_mask': None})
+            db.session.execute(db.update(Order).where(Order.total_price == 590).values(panel_mask=0))
+            db.session.commit()
+
+            # Until the deploy step runs, startup only reports it and panel admins still see the orders
+            self.assertEqual(pending_order_backfills(), ['orders without a panel snapshot'])
+            self.assertEqual(Order.query.filter(panel_mask_filter('scaffolding')).count(), 2)
+
+            backfill_order_panels()
+
+            self.assertEqual(pending_order_backfills(), [])
+            self.assertEqual(sorted(o.panel_mask for o in Order.query), [1, 2, 3])
+            self.assertEqual(order_analytics('fabrication'), expected)
+            self.assertEqual(reconcile_order_rollups(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Tests for the server-side cart store
+"""
+
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from test_support import DatabaseTestCase
+import app as app_module
+from app import app, db
+from models import User, Product, Cart, CartLine, Order, OrderItem
+
+
+class CartStoreTestCase(DatabaseTestCase):
+    """Test suite for carts.py and the cart routes"""
+
+    def login_user(self):
+        # Requests run outside this app context so each gets a fresh current_user
+        with self.app.app_context():
+            user = User(username='buyer', full_name='Buyer', email='b@example.com', phone='9000000000')
+            user.set_password('secret')
+            gate = Product(name='Gate', price=500, category='steel', product_type='fabrication')
+            db.session.add_all([user, gate])
+            db.session.commit()
+            user_id, gate_id = user.id, gate.id
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['user_type'] = 'user'
+        return user_id, gate_id
+
+    def add(self, product_id, quantity=1):
+        return self.client.post('/add_to_cart', json={
+            'product_id': product_id, 'quantity': quantity,
+            'customization': {'notes': 'x' * 2000}
+        }).get_json()
+
+    def test_session_holds_only_cart_id(self):
+        user_id, gate_id = self.login_user()
+
+        for i in range(5):
+            data = self.add(gate_id, quantity=2)
+        self.assertEqual(data['cart_count'], 5)
+
+        with self.client.session_transaction() as sess:
+            self.assertNotIn('cart', sess)
+            cart_id = sess['cart_id']
+
+        with self.app.app_context():
+            cart = db.session.get(Cart, cart_id)
+            self.assertEqual(cart.user_id, user_id)
+            self.assertEqual((cart.item_count, float(cart.subtotal)), (5, 5000.0))
+            self.assertEqual(len(cart.lines[0].customization['notes']), 2000)
+
+    def cart_state(self, user_id):
+        with self.app.app_context():
+            cart = Cart.query.filter_by(user_id=user_id).one()
+            return cart.item_count, float(cart.subtotal), CartLine.query.count()
+
+    def test_remove_and_checkout_keep_totals(self):
+        user_id, gate_id = self.login_user()
+        self.add(gate_id, quantity=1)
+        self.add(gate_id, quantity=3)
+
+        self.client.get('/remove_from_cart/0')
+        self.assertEqual(self.cart_state(user_id), (1, 1500.0, 1))
+
+        html = self.client.get('/cart').get_data(as_text=True)
+        self.assertIn('1500.00', html)
+
+        data = self.client.post('/complete_order', json={'transaction_id': 'TX1'}).get_json()
+        self.assertTrue(data['success'])
+        # 1500 + 18% GST
+        self.assertEqual(data['total_paid'], 1770.0)
+        with self.app.app_context():
+            self.assertEqual(Order.query.one().items[0].quantity, 3)
+        self.assertEqual(self.cart_state(user_id), (0, 0.0, 0))
+
+    def test_legacy_cookie_cart_is_imported(self):
+        user_id, gate_id = self.login_user()
+        with self.client.session_transaction() as sess:
+            sess['cart'] = [{'product_id': gate_id, 'product_name': 'Gate', 'quantity': 2,
+                             'unit_price': 500, 'deposit': 0, 'customization': {}}]
+
+        self.client.get('/cart')
+
+        with self.client.session_transaction() as sess:
+            self.assertNotIn('cart', sess)
+        self.assertEqual(self.cart_state(user_id), (1, 1000.0, 1))
+
+    def count_queries(self, url, json=None):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            if json is None:
+                response = self.client.get(url)
+            else:
+                response = self.client.post(url, json=json)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_cart_page_query_count_is_constant(self):
+        user_id, gate_id = self.login_user()
+        with self.app.app_context():
+            products = [Product(name=f'Part {i}', price=10 + i, category='parts', product_type='fabrication')
+                        for i in range(40)]
+            db.session.add_all(products)
+            db.session.commit()
+            product_ids = [p.id for p in products]
+
+        for product_id in product_ids[:3]:
+            self.add(product_id)
+        small = self.count_queries('/cart')
+
+        for product_id in product_ids[3:]:
+            self.add(product_id)
+        large = self.count_queries('/cart')
+
+        self.assertEqual(small, large)
+
+    def test_checkout_retry_returns_original_order(self):
+        user_id, gate_id = self.login_user()
+        self.add(gate_id, quantity=2)
+
+        payload = {'transaction_id': 'TX1', 'idempotency_key': 'key-1'}
+        first = self.client.post('/complete_order', json=payload).get_json()
+        retry = self.client.post('/complete_order', json=payload).get_json()
+        self.assertTrue(retry['success'])
+        self.assertEqual((retry['order_id'], retry['total_paid'], retry['idempotency_key']),
+                         (first['order_id'], first['total_paid'], 'key-1'))
+
+        self.add(gate_id)
+        reused = self.client.post('/complete_order', json={'transaction_id': 'TX1', 'idempotency_key': 'key-2'})
+        self.assertEqual(reused.status_code, 400)
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 1)
+            self.assertEqual(Order.query.one().items[0].panel, 'fabrication')
+
+    def test_checkout_race_returns_original_order(self):
+        user_id, gate_id = self.login_user()
+        self.add(gate_id)
+        payload = {'transaction_id': 'TX1', 'idempotency_key': 'key-1'}
+        first = self.client.post('/complete_order', json=payload).get_json()
+
+        # A concurrent submit passed the pre-check before the first one committed
+        real = app_module.find_checkout_order
+        calls = []
+
+        def racing_find(*args):
+            calls.append(args)
+            return (None, False) if len(calls) == 1 else real(*args)
+
+        self.add(gate_id)
+        with mock.patch.object(app_module, 'find_checkout_order', side_effect=racing_find):
+            raced = self.client.post('/complete_order', json=payload)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(raced.status_code, 200)
+        self.assertEqual(raced.get_json()['order_id'], first['order_id'])
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 1)
+
+    def test_checkout_query_count_is_constant(self):
+        user_id, gate_id = self.login_user()
+        with self.app.app_context():
+            products = [Product(name=f'Part {i}', price=10 + i, category='parts', product_type='fabrication')
+                        for i in range(40)]
+            db.session.add_all(products)
+            db.session.commit()
+            product_ids = [p.id for p in products]
+
+        for product_id in product_ids[:3]:
+            self.add(product_id)
+        small = self.count_queries('/complete_order', json={'transaction_id': 'TX1'})
+
+        for product_id in product_ids[3:]:
+            self.add(product_id)
+        large = self.count_queries('/complete_order', json={'transaction_id': 'TX2'})
+
+        self.assertEqual(small, large)
+        with self.app.app_context():
+            self.assertEqual(OrderItem.query.count(), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,269 @@
+"""
+Tests for catalog.py listing helpers
+"""
+
+import unittest
+from test_support import DatabaseTestCase
+from app import db, calculate_price
+from sqlalchemy import event
+from models import (Admin, Product, CuplockVerticalSize, CuplockVerticalCup, CuplockLedgerSize,
+                    ProductCatalogSummary)
+from catalog import (get_cuplock_display_prices, rebuild_catalog_summary, bump_catalog_version,
+                     clear_catalog_snapshot, ensure_catalog_version_row, get_catalog_snapshot,
+                     clear_pricing_tables, get_product_pricing, get_catalog_listing, ListingCard,
+                     catalog_changed, get_scaffolding_facets)
+
+
+class CatalogTestCase(DatabaseTestCase):
+    """Test suite for catalog helpers"""
+
+    def setUp(self):
+        """Set up test client and database"""
+        super().setUp()
+        clear_catalog_snapshot()
+        clear_pricing_tables()
+
+    def create_product(self, name, category='cuplock', cuplock_type=None, price=0):
+        product = Product(
+            name=name,
+            price=price,
+            category=category,
+            product_type='scaffolding',
+            cuplock_type=cuplock_type,
+            is_active=True
+        )
+        db.session.add(product)
+        db.session.flush()
+        return product
+
+    def test_cuplock_display_prices(self):
+        """Vertical/ledger prices follow the per-type rules"""
+        with self.app.app_context():
+            vertical = self.create_product('Vertical', cuplock_type='vertical')
+            ledger = self.create_product('Ledger', cuplock_type='ledger')
+            zero_ledger = self.create_product('Zero Ledger', cuplock_type='ledger')
+            empty = self.create_product('Empty', cuplock_type='vertical')
+            other = self.create_product('Frame', category='h-frames', price=50)
+
+            db.session.add_all([
+                CuplockVerticalSize(product_id=vertical.id, size_label='1m', buy_price=120),
+                CuplockVerticalSize(product_id=vertical.id, size_label='2m', buy_price=90),
+                CuplockVerticalSize(product_id=vertical.id, size_label='3m', buy_price=10, is_active=False),
+                CuplockLedgerSize(product_id=ledger.id, size_label='1m', buy_price=75),
+                CuplockLedgerSize(product_id=ledger.id, size_label='2m', buy_price=60),
+                CuplockLedgerSize(product_id=zero_ledger.id, size_label='1m', buy_price=0),
+                CuplockLedgerSize(product_id=zero_ledger.id, size_label='2m', buy_price=40),
+            ])
+            db.session.commit()
+
+            prices = get_cuplock_display_prices([vertical, ledger, zero_ledger, empty, other])
+
+            self.assertEqual(prices[vertical.id], 90)
+            self.assertEqual(prices[ledger.id], 60)
+            self.assertEqual(prices[zero_ledger.id], 40)
+            self.assertEqual(prices[empty.id], 0)
+            self.assertNotIn(other.id, prices)
+
+    def test_summary_maintained_on_size_writes(self):
+        """Adding and deleting sizes through the blueprint updates the summary"""
+        with self.app.app_context():
+            admin = Admin(username='admin', panel_type='scaffolding')
+            admin.set_password('admin123')
+            db.session.add(admin)
+            product = self.create_product('Summary Ledger', cuplock_type='ledger')
+            db.session.commit()
+            product_id = product.id
+
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+            sess['user_type'] = 'admin'
+
+        for label, price in (('0.9m', 150), ('1.2m', 90)):
+            response = self.client.post(f'/cuplock/admin/ledger/{product_id}/size/add', data={
+                'size_label': label, 'buy_price': price, 'rent_price': 10
+            })
+            self.assertTrue(response.get_json()['success'])
+
+        with self.app.app_context():
+            summary = db.session.get(ProductCatalogSummary, product_id)
+            self.assertEqual(summary.active_size_count, 2)
+            self.assertEqual(float(summary.min_buy_price), 90)
+            self.assertEqual(float(summary.max_buy_price), 150)
+            self.assertEqual(float(summary.display_price), 90)
+            size_id = CuplockLedgerSize.query.filter_by(product_id=product_id, size_label='1.2m').first().id
+
+        self.client.post(f'/cuplock/admin/ledger/size/{size_id}/delete')
+
+        with self.app.app_context():
+            summary = db.session.get(ProductCatalogSummary, product_id)
+            self.assertEqual(summary.active_size_count, 1)
+            self.assertEqual(float(summary.display_price), 150)
+
+    def test_rebuild_catalog_summary(self):
+        """Rebuild creates a row for every product"""
+        with self.app.app_context():
+            self.create_product('Frame', category='h-frames', price=50)
+            self.create_product('Vertical', cuplock_type='vertical')
+            db.session.commit()
+
+            self.assertEqual(rebuild_catalog_summary(), 2)
+            self.assertEqual(ProductCatalogSummary.query.count(), 2)
+
+    def test_catalog_snapshot_follows_version(self):
+        """Snapshot is reused until the catalog version is bumped"""
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            self.create_product('First', category='h-frames', price=10)
+            db.session.commit()
+
+            snapshot = get_catalog_snapshot()
+            self.assertEqual([p.name for p in snapshot.products], ['First'])
+
+            # Written without a bump: still served from memory
+            self.create_product('Second', category='h-frames', price=20)
+            db.session.commit()
+            self.assertIs(get_catalog_snapshot(), snapshot)
+
+            bump_catalog_version()
+            db.session.commit()
+            self.assertEqual([p.name for p in get_catalog_snapshot().products], ['First', 'Second'])
+
+    def test_calculate_price_uses_compiled_sizes(self):
+        """Vertical lookups go by id, then active label, then first active size"""
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            vertical = self.create_product('Vertical', cuplock_type='vertical', price=5)
+            other = self.create_product('Other', cuplock_type='vertical')
+            old = CuplockVerticalSize(product_id=vertical.id, size_label='1m', buy_price=10, is_active=False)
+            one = CuplockVerticalSize(product_id=vertical.id, size_label='1m', buy_price=20,
+                                      rent_price=3, deposit=30)
+            two = CuplockVerticalSize(product_id=vertical.id, size_label='2m', buy_price=40)
+            foreign = CuplockVerticalSize(product_id=other.id, size_label='2m', buy_price=99)
+            db.session.add_all([old, one, two, foreign])
+            db.session.flush()
+            db.session.add(CuplockVerticalCup(vertical_size_id=two.id, cup_count=4, buy_price=7))
+            db.session.commit()
+
+            self.assertEqual(calculate_price(vertical, {'size_id': old.id})['price'], 10.0)
+            self.assertEqual(calculate_price(vertical, {'size_id': foreign.id, 'size': '2m'})['price'], 40.0)
+            self.assertEqual(calculate_price(vertical, {'size': '1m', 'cup_price': 2})['price'], 22.0)
+            self.assertEqual(calculate_price(vertical, {'size': '9m'})['price'], 20.0)
+            self.assertEqual(calculate_price(vertical, {'size': '1m', 'purchase_type': 'rent'}),
+                             {'price': 3.0, 'deposit': 30.0})
+            self.assertEqual(calculate_price(other, {'size': '5m'})['price'], 99.0)
+            self.assertEqual(get_product_pricing(vertical).cup(two.id, 4).buy_price, 7)
+
+            # Cached until the version moves: no further queries for sizes
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                calculate_price(vertical, {'size': '2m'})
+                calculate_price(vertical, {'size': '1m'})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertFalse([s for s in statements if 'cuplock_vertical_size' in s])
+
+            two.buy_price = 45
+            bump_catalog_version()
+            db.session.commit()
+            self.assertEqual(calculate_price(vertical, {'size': '2m'})['price'], 45.0)
+
+    def test_national_scaffoldings_page(self):
+        """Listing page renders with cuplock products"""
+        with self.app.app_context():
+            vertical = self.create_product('Listing Vertical', cuplock_type='vertical')
+            db.session.add(CuplockVerticalSize(product_id=vertical.id, size_label='1m', buy_price=150))
+            db.session.commit()
+
+        response = self.client.get('/national_scaffoldings')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Listing Vertical', response.data)
+
+    def test_listing_keyset_pages(self):
+        """Listings page by (category, id) cursor and carry only card columns"""
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            for i in range(5):
+                self.create_product(f'Frame {i}', category='h-frames', price=10)
+                self.create_product(f'Alu {i}', category='aluminium', price=10)
+                gate = self.create_product(f'Gate {i}', category='steel', price=10)
+                gate.description = 'x' * 500
+            db.session.commit()
+
+            listing = get_catalog_listing('scaffolding')
+            names, cursor = [], None
+            while True:
+                cards, cursor = listing.page(cursor=cursor, page_size=3)
+                names.extend(c.name for c in cards)
+                if not cursor:
+                    break
+            self.assertEqual(names, [f'Alu {i}' for i in range(5)] + [f'Frame {i}' for i in range(5)])
+
+            cards, cursor = listing.page('h-frames', page_size=4)
+            self.assertEqual([c.name for c in cards], ['Frame 0', 'Frame 1', 'Frame 2', 'Frame 3'])
+            cards, cursor = listing.page('h-frames', cursor, page_size=4)
+            self.assertEqual(([c.name for c in cards], cursor), (['Frame 4'], None))
+
+            # Newest first inside a category
+            cards, _ = get_catalog_listing('fabrication').page('steel')
+            self.assertEqual([c.name for c in cards], [f'Gate {i}' for i in reversed(range(5))])
+            self.assertIsInstance(cards[0], ListingCard)
+            self.assertFalse(hasattr(cards[0], '__dict__'))
+            self.assertEqual(len(cards[0].description), 101)
+
+        response = self.client.get('/fabrications?category=steel')
+        self.assertIn(b'Gate 4', response.data)
+
+    def test_facet_filters_and_counts(self):
+        """Facet filters and counts come from the snapshot bitsets without queries"""
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            for i in range(4):
+                frame = self.create_product(f'Frame {i}', category='h-frames', price=300 if i % 2 else 3000)
+                frame.rent_price = 20 if i < 2 else None
+                frame.weight_per_unit = 12
+            vertical = self.create_product('Vertical', cuplock_type='vertical')
+            db.session.add(CuplockVerticalSize(product_id=vertical.id, size_label='1m', buy_price=150, rent_price=15))
+            self.create_product('Hidden', category='h-frames', price=300).is_active = False
+            db.session.flush()
+            catalog_changed(*[p.id for p in Product.query.all()])
+            db.session.commit()
+
+            facets = get_scaffolding_facets()
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                cards, cursor, counts = facets.search({'mode': ['rent']})
+                self.assertEqual([c.name for c in cards], ['Vertical', 'Frame 0', 'Frame 1'])
+                # Counts of a facet ignore its own selection but apply the others
+                self.assertEqual([(o.value, o.count, o.selected) for o in counts['mode']],
+                                 [('buy', 5, False), ('rent', 3, True)])
+                self.assertEqual({o.value: o.count for o in counts['price']},
+                                 {'under-500': 2, '2000-10000': 1})
+                self.assertEqual({o.value: o.count for o in counts['category']}, {'cuplock': 1, 'h-frames': 2})
+
+                cards, _, counts = facets.search({'price': ['under-500', '2000-10000'], 'weight': ['5-15']})
+                self.assertEqual([c.name for c in cards], [f'Frame {i}' for i in range(4)])
+                self.assertEqual({o.value: o.count for o in counts['cuplock_type']}, {'vertical': 0})
+
+                names, cursor = [], None
+                while True:
+                    cards, cursor, _ = facets.search({'category': ['h-frames']}, cursor, page_size=3)
+                    names.extend(c.name for c in cards)
+                    if not cursor:
+                        break
+                self.assertEqual(names, [f'Frame {i}' for i in range(4)])
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(statements, [])
+
+        response = self.client.get('/national_scaffoldings?mode=rent&price=2000-10000')
+        self.assertIn(b'Frame 0', response.data)
+        self.assertNotIn(b'Frame 1', response.data)
+        self.assertIn(b'value="rent"', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
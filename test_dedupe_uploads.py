@@ -0,0 +1,82 @@
+"""
+Tests for dedupe_uploads.py
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from test_support import DatabaseTestCase
+from models import db, Product, ProductImage, CuplockVerticalSize, CuplockVerticalCup
+from catalog import ensure_catalog_version_row
+from dedupe_uploads import dedupe_uploads, file_sha256
+
+
+class DedupeUploadsTestCase(DatabaseTestCase):
+    """Test suite for dedupe_uploads.py"""
+
+    def setUp(self):
+        super().setUp()
+        # Never touch the real static/uploads
+        self.old_static_folder = self.app.static_folder
+        self.static_dir = tempfile.mkdtemp()
+        self.app.static_folder = self.static_dir
+        os.makedirs(os.path.join(self.static_dir, 'uploads'))
+        for name in ('a.png', 'b.png'):
+            Image.new('RGB', (20, 10), (0, 128, 0)).save(os.path.join(self.static_dir, 'uploads', name), 'PNG')
+        self.hashed = f"uploads/{file_sha256(os.path.join(self.static_dir, 'uploads', 'a.png'))}.png"
+
+    def tearDown(self):
+        super().tearDown()
+        self.app.static_folder = self.old_static_folder
+        shutil.rmtree(self.static_dir)
+
+    def test_prefixed_paths_are_rewritten(self):
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            migrated = Product(name='Frame', price=10, category='h-frames', product_type='scaffolding')
+            legacy = Product(name='Ladder', price=10, category='h-frames', product_type='scaffolding',
+                             image_url='static/uploads/b.png, uploads/other.png')
+            db.session.add_all([migrated, legacy])
+            db.session.flush()
+            db.session.add(ProductImage(product_id=migrated.id, path='/static/uploads/a.png'))
+            size = CuplockVerticalSize(product_id=migrated.id, size_label='1m')
+            db.session.add(size)
+            db.session.flush()
+            db.session.add(CuplockVerticalCup(vertical_size_id=size.id, cup_count=2,
+                                              cup_image_url='/static/uploads/b.png'))
+            db.session.commit()
+            migrated_id, legacy_id = migrated.id, legacy.id
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                dedupe_uploads()
+            db.session.expire_all()
+
+            self.assertEqual(ProductImage.query.filter_by(product_id=migrated_id).one().path, self.hashed)
+            self.assertEqual(db.session.get(Product, legacy_id).image_url, f'{self.hashed},uploads/other.png')
+            self.assertEqual(CuplockVerticalCup.query.one().cup_image_url, self.hashed)
+            self.assertEqual(os.listdir(os.path.join(self.static_dir, 'uploads')).count(
+                os.path.basename(self.hashed)), 1)
+            self.assertFalse(os.path.exists(os.path.join(self.static_dir, 'uploads', 'a.png')))
+
+    def test_still_referenced_old_file_is_kept(self):
+        with self.app.app_context():
+            ensure_catalog_version_row()
+            # A stored form the rewrite does not recognise
+            product = Product(name='Frame', price=10, category='h-frames', product_type='scaffolding',
+                              image_url='x\\uploads/a.png')
+            db.session.add(product)
+            db.session.commit()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                dedupe_uploads()
+
+            self.assertTrue(os.path.exists(os.path.join(self.static_dir, 'uploads', 'a.png')))
+            self.assertFalse(os.path.exists(os.path.join(self.static_dir, 'uploads', 'b.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
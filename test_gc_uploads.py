@@ -0,0 +1,100 @@
+"""
+Tests for the orphaned upload garbage collector
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from test_support import DatabaseTestCase
+from app import db
+from models import Product, CuplockVerticalSize, CuplockVerticalCup
+from product_images import set_product_images
+from gc_uploads import QUARANTINE_FOLDER, find_orphaned_uploads, referenced_upload_names
+from utils import restore_upload, variant_path
+
+
+class GcUploadsTestCase(DatabaseTestCase):
+    """Test suite for gc_uploads.py"""
+
+    def setUp(self):
+        super().setUp()
+        self.upload_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.upload_dir)
+
+    def touch(self, rel, age_seconds):
+        path = os.path.join(self.upload_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 10)
+        mtime = time.time() - age_seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_referenced_names_cover_products_and_cups(self):
+        with self.app.app_context():
+            active = Product(name='Frame', price=10, category='h-frames',
+                             product_type='scaffolding', is_active=True)
+            deleted = Product(name='Old', price=10, category='h-frames',
+                              product_type='scaffolding', is_active=False,
+                              image_url='uploads/old.jpg')
+            legacy = Product(name='Legacy', price=10, category='h-frames',
+                             product_type='scaffolding', is_active=True,
+                             image_url='/static/uploads/legacy.jpg, uploads/legacy2.jpg')
+            db.session.add_all([active, deleted, legacy])
+            db.session.flush()
+            set_product_images(active, ['uploads/a.jpg'])
+
+            size = CuplockVerticalSize(product_id=active.id, size_label='1m')
+            db.session.add(size)
+            db.session.flush()
+            db.session.add(CuplockVerticalCup(vertical_size_id=size.id, cup_count=2,
+                                              cup_image_url='cup.png'))
+            db.session.commit()
+
+            # Deactivated products keep their files: the row can be switched back on
+            self.assertEqual(referenced_upload_names(),
+                             {'a.jpg', 'old.jpg', 'legacy.jpg', 'legacy2.jpg', 'cup.png'})
+
+    def test_orphans_respect_grace_period_and_variants(self):
+        day = 86400
+        self.touch('kept.jpg', 2 * day)
+        self.touch('orphan.jpg', 2 * day)
+        self.touch('fresh.jpg', 60)
+        self.touch('.upload-abc.tmp', 2 * day)
+        self.touch('variants/kept_card.webp', 2 * day)
+        self.touch('variants/orphan_thumb.jpg', 2 * day)
+
+        orphans = dict(find_orphaned_uploads(self.upload_dir, {'kept.jpg'}, grace_seconds=day))
+        self.assertEqual(set(orphans), {'orphan.jpg', '.upload-abc.tmp', 'variants/orphan_thumb.jpg'})
+        self.assertEqual(orphans['orphan.jpg'], 10)
+
+    def test_restore_brings_variants_back(self):
+        with self.app.app_context():
+            name = f'restore_{uuid.uuid4().hex}.jpg'
+            rel = f'uploads/{name}'
+            variant = variant_path(rel, 'card', 'webp')
+            quarantine_dir = os.path.join(self.app.instance_path, QUARANTINE_FOLDER)
+            for stored in (rel, variant):
+                path = os.path.join(quarantine_dir, stored[len('uploads/'):])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b'x')
+            try:
+                self.assertTrue(restore_upload(rel))
+                for stored in (rel, variant):
+                    self.assertTrue(os.path.exists(os.path.join(self.app.static_folder, stored)))
+                    self.assertFalse(os.path.exists(os.path.join(quarantine_dir, stored[len('uploads/'):])))
+            finally:
+                for stored in (rel, variant):
+                    path = os.path.join(self.app.static_folder, stored)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
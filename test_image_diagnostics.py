@@ -0,0 +1,139 @@
+"""
+Tests for the incremental image diagnostics engine
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+from PIL import Image
+from test_support import DatabaseTestCase
+from app import app, db
+from models import Product, ProductImage
+from image_diagnostics import run_image_diagnostics
+import run_image_diagnostics as diagnostics_cli
+from utils import image_index_add, image_index_discard
+
+
+class ImageDiagnosticsTestCase(unittest.TestCase):
+    """Test suite for image_diagnostics.run_image_diagnostics"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, 'cache.json')
+        self.good = os.path.join(self.tmp_dir, 'good.png')
+        self.bad = os.path.join(self.tmp_dir, 'bad.png')
+        Image.new('RGB', (20, 10), (0, 128, 0)).save(self.good, 'PNG')
+        with open(self.bad, 'wb') as f:
+            f.write(b'not an image')
+
+        self.targets = [
+            (1, 'Frame', 'h-frames', [self.good, self.bad]),
+            (2, 'Ladder', 'aluminium', [self.good, os.path.join(self.tmp_dir, 'missing.png')]),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_engine(self, **kwargs):
+        with app.app_context():
+            results = list(run_image_diagnostics(self.targets, cache_path=self.cache_path, **kwargs))
+        return results[:-1], results[-1]
+
+    def test_results_streamed_per_product_with_summary(self):
+        products, summary = self.run_engine()
+
+        self.assertEqual([p['product_id'] for p in products], [1, 2])
+        self.assertEqual(products[0]['images'][0]['dimensions'], '20x10')
+        self.assertEqual(summary['type'], 'summary')
+        self.assertEqual((summary['valid_images'], summary['corrupted_images'], summary['missing_images']),
+                         (2, 1, 1))
+        # good.png is shared by both products but decoded once
+        self.assertEqual((summary['rechecked'], summary['cached']), (3, 0))
+
+    def test_unchanged_files_come_from_cache(self):
+        self.run_engine()
+        _, summary = self.run_engine()
+        # Missing files are never cached
+        self.assertEqual((summary['rechecked'], summary['cached']), (1, 2))
+
+        # Rewriting a file changes its size / mtime, so it is checked again
+        Image.new('RGB', (30, 30), (0, 0, 0)).save(self.bad, 'PNG')
+        products, summary = self.run_engine()
+        self.assertEqual((summary['rechecked'], summary['cached']), (2, 1))
+        self.assertTrue(products[0]['images'][1]['valid'])
+
+        _, summary = self.run_engine(full=True)
+        self.assertEqual(summary['cached'], 0)
+
+    def test_metadata_entries_are_not_decoded(self):
+        stored = {'filepath': self.good, 'exists': True, 'readable': True, 'valid': True,
+                  'format': 'PNG', 'size_bytes': 100, 'dimensions': '20x10', 'error': None}
+        self.targets = [(1, 'Frame', 'h-frames', [stored, self.bad])]
+        products, summary = self.run_engine()
+        self.assertIs(products[0]['images'][0], stored)
+        self.assertEqual((summary['rechecked'], summary['cached'], summary['from_metadata']), (1, 0, 1))
+
+    def test_cache_keeps_files_from_other_runs(self):
+        self.run_engine()
+        # A run over one product must not forget the others' files
+        self.targets = [(2, 'Ladder', 'aluminium', [self.good])]
+        self.run_engine()
+        self.targets = [(1, 'Frame', 'h-frames', [self.bad])]
+        _, summary = self.run_engine()
+        self.assertEqual((summary['rechecked'], summary['cached']), (0, 1))
+
+
+class ImageDiagnosticsCliTestCase(DatabaseTestCase):
+    """Test suite for run_image_diagnostics.py"""
+
+    def setUp(self):
+        super().setUp()
+        self.rel = f'uploads/test_{uuid.uuid4().hex}.png'
+        self.fs_path = os.path.join(self.app.static_folder, self.rel)
+        os.makedirs(os.path.dirname(self.fs_path), exist_ok=True)
+        Image.new('RGB', (20, 10), (0, 128, 0)).save(self.fs_path, 'PNG')
+        image_index_add(self.fs_path)
+        with self.app.app_context():
+            product = Product(name='Frame', price=10, category='h-frames', product_type='scaffolding')
+            db.session.add(product)
+            db.session.flush()
+            # Stored metadata that disagrees with the file, to tell the two apart
+            db.session.add(ProductImage(product_id=product.id, path=self.rel, width=99, height=99,
+                                        bytes=1, format='PNG'))
+            db.session.commit()
+
+    def tearDown(self):
+        super().tearDown()
+        os.remove(self.fs_path)
+        image_index_discard(self.fs_path)
+
+    def run_cli(self, *argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            diagnostics_cli.main(['--ndjson', *argv])
+        products, summary = [], None
+        for line in out.getvalue().splitlines():
+            result = json.loads(line)
+            if result['type'] == 'summary':
+                summary = result
+            else:
+                products.append(result)
+        return products, summary
+
+    def test_full_decodes_rows_with_stored_metadata(self):
+        products, summary = self.run_cli()
+        self.assertEqual(products[0]['images'][0]['dimensions'], '99x99')
+        self.assertEqual(summary['from_metadata'], 1)
+
+        products, summary = self.run_cli('--full')
+        self.assertEqual(products[0]['images'][0]['dimensions'], '20x10')
+        self.assertEqual((summary['from_metadata'], summary['rechecked']), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
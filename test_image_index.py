@@ -0,0 +1,81 @@
+"""
+Tests for the in-memory image existence index in utils.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import utils
+
+
+class ImageIndexTestCase(unittest.TestCase):
+    """Test suite for utils image index"""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs('static/uploads')
+        os.makedirs('static/images')
+        self.touch('static/uploads/a.jpg')
+        utils._image_index['static_root'] = None
+        utils.rebuild_image_index()
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp.cleanup()
+        utils._image_index['built'] = False
+        utils._image_index['static_root'] = None
+
+    def touch(self, path):
+        with open(path, 'wb') as f:
+            f.write(b'x')
+
+    def test_lookup_without_syscalls(self):
+        """Indexed paths resolve without touching the filesystem"""
+        with mock.patch.object(utils.os.path, 'exists', side_effect=AssertionError('exists called')), \
+             mock.patch.object(utils.os, 'stat', side_effect=AssertionError('stat called')):
+            self.assertEqual(utils.get_image_url('uploads/a.jpg'), '/static/uploads/a.jpg')
+            self.assertEqual(utils.get_image_url('uploads/missing.jpg'), '/static/images/no-image.png')
+
+    def test_helpers_keep_index_current(self):
+        """Add / discard update the index immediately"""
+        self.touch('static/uploads/b.jpg')
+        utils.image_index_add('static/uploads/b.jpg')
+        self.assertEqual(utils.get_image_url('uploads/b.jpg'), '/static/uploads/b.jpg')
+
+        utils.image_index_discard(os.path.abspath('static/uploads/a.jpg'))
+        self.assertEqual(utils.get_image_url('uploads/a.jpg'), '/static/images/no-image.png')
+
+    def test_resync_picks_up_external_changes(self):
+        """Files written behind the helpers' back show up after a resync"""
+        self.touch('static/images/c.png')
+        os.utime('static/images', (0, 0))
+        utils._image_index['checked_at'] = 0.0
+        self.assertEqual(utils.get_image_url('images/c.png'), '/static/images/c.png')
+
+    def test_app_static_folder_wins_over_working_directory(self):
+        """The index follows the app's static folder, not the cwd"""
+        elsewhere = tempfile.TemporaryDirectory()
+        self.addCleanup(elsewhere.cleanup)
+        os.chdir(elsewhere.name)
+        app = Flask(__name__, static_folder=os.path.join(self.tmp.name, 'static'))
+        with app.app_context():
+            utils.rebuild_image_index()
+            self.assertEqual(utils.get_image_url('uploads/a.jpg'), '/static/uploads/a.jpg')
+            utils.image_index_discard(os.path.join(app.static_folder, 'uploads', 'a.jpg'))
+            self.assertEqual(utils.get_image_url('uploads/a.jpg'), '/static/images/no-image.png')
+
+    def test_missing_warnings_are_capped(self):
+        with mock.patch.object(utils, 'WARNED_MISSING_LIMIT', 3):
+            for i in range(10):
+                utils.get_image_url(f'uploads/missing{i}.jpg')
+            self.assertLessEqual(len(utils._warned_missing), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
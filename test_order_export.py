@@ -0,0 +1,125 @@
+"""
+Tests for the streaming order export
+"""
+
+import csv
+import io
+import re
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+from test_support import DatabaseTestCase
+from app import db
+from models import Admin, User, Product, Order, OrderItem
+from analytics import order_panel_mask, snapshot_order_item
+from order_export import EXPORT_COLUMNS, iter_export_rows
+
+
+class OrderExportTestCase(DatabaseTestCase):
+    """Test suite for /admin_orders/export"""
+
+    def login_admin(self, panel_type):
+        admin = Admin(username=f'{panel_type}_admin', password_hash='secret', panel_type=panel_type)
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(admin_id)
+            sess['user_type'] = 'admin'
+            sess['panel_type'] = panel_type
+
+    def seed(self, count):
+        user = User(username='buyer', full_name='Buyer, Ltd', email='b@example.com', phone='9000000000')
+        user.set_password('secret')
+        frame = Product(name='Frame', price=100, category='h-frames', product_type='scaffolding')
+        db.session.add_all([user, frame])
+        db.session.flush()
+
+        base = datetime(2025, 1, 1)
+        for i in range(count):
+            # 2 frames at 100 + 18% GST + 50 deposit
+            order = Order(user_id=user.id, total_price=286, transaction_id=f'TX{i}',
+                          status='completed' if i % 2 else 'rejected', order_date=base + timedelta(hours=i))
+            db.session.add(order)
+            db.session.flush()
+            item = OrderItem(order_id=order.id, product_id=frame.id, product_name='Frame', quantity=2, price=100)
+            snapshot_order_item(item, frame)
+            db.session.add(item)
+            order.panel_mask = order_panel_mask([item.panel])
+        db.session.commit()
+
+    def test_csv_export_with_filters(self):
+        with self.app.app_context():
+            self.seed(30)
+            self.login_admin('scaffolding')
+
+            response = self.client.get('/admin_orders/export?status=completed&start=2025-01-01&end=2025-01-01')
+            self.assertEqual(response.mimetype, 'text/csv')
+            self.assertIn('attachment', response.headers['Content-Disposition'])
+
+            rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+            self.assertEqual(len(rows), 12)
+            self.assertEqual({r['Status'] for r in rows}, {'completed'})
+            first = rows[0]
+            self.assertEqual(first['Customer'], 'Buyer, Ltd')
+            self.assertEqual((first['Line Total'], first['Line GST']), ('200.0', '36.0'))
+            self.assertEqual((first['Order Subtotal'], first['Order GST'], first['Deposit'], first['Order Total']),
+                             ('200.0', '36.0', '50.0', '286.0'))
+
+    def test_batches_cover_every_order_once(self):
+        with self.app.app_context():
+            self.seed(7)
+            batches = list(iter_export_rows([], batch_size=3))
+            self.assertEqual([len(b) for b in batches], [3, 3, 1])
+            ids = [row[0] for batch in batches for row in batch]
+            self.assertEqual(ids, [o.id for o in Order.query.order_by(Order.order_date.desc(), Order.id.desc())])
+
+    def test_xlsx_export(self):
+        with self.app.app_context():
+            self.seed(5)
+            self.login_admin('scaffolding')
+
+            response = self.client.get('/admin_orders/export?format=xlsx')
+            workbook = zipfile.ZipFile(io.BytesIO(response.get_data()))
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            self.assertEqual(len(re.findall('<row>', sheet)), 6)
+            self.assertIn(EXPORT_COLUMNS[0], sheet)
+            self.assertIn('Buyer, Ltd', sheet)
+
+    def test_formula_cells_are_neutralised(self):
+        with self.app.app_context():
+            self.seed(1)
+            User.query.one().full_name = '=HYPERLINK("http://evil","x")'
+            OrderItem.query.one().product_name = '@SUM(A1)'
+            db.session.commit()
+            self.login_admin('scaffolding')
+
+            response = self.client.get('/admin_orders/export')
+            row = next(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+            self.assertEqual(row['Customer'], '\'=HYPERLINK("http://evil","x")')
+            self.assertEqual(row['Product'], "'@SUM(A1)")
+
+            response = self.client.get('/admin_orders/export?format=xlsx')
+            sheet = zipfile.ZipFile(io.BytesIO(response.get_data())).read('xl/worksheets/sheet1.xml').decode('utf-8')
+            self.assertIn("<t>'@SUM(A1)</t>", sheet)
+            self.assertNotIn('<t>=HYPERLINK', sheet)
+
+    def test_xlsx_drops_xml_illegal_characters(self):
+        with self.app.app_context():
+            self.seed(1)
+            User.query.one().full_name = 'Bell\x07 Customer'
+            OrderItem.query.one().product_name = '\x00=SUM(A1)'
+            db.session.commit()
+            self.login_admin('scaffolding')
+
+            response = self.client.get('/admin_orders/export?format=xlsx')
+            sheet = zipfile.ZipFile(io.BytesIO(response.get_data())).read('xl/worksheets/sheet1.xml')
+            ElementTree.fromstring(sheet)
+            sheet = sheet.decode('utf-8')
+            self.assertIn('<t>Bell Customer</t>', sheet)
+            self.assertIn("<t>'=SUM(A1)</t>", sheet)
+
+
+if __name__ == '__main__':
+    unittest.main()
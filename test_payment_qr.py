@@ -0,0 +1,54 @@
+"""
+Tests for the cached UPI payment QR endpoint
+"""
+
+import unittest
+from test_support import DatabaseTestCase
+from app import db
+from models import User
+from payment_qr import render_qr_svg, upi_payload
+
+
+class PaymentQrTestCase(DatabaseTestCase):
+    """Test suite for /payment_qr"""
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            user = User(username='buyer', full_name='Buyer', email='b@example.com', phone='9000000000')
+            user.set_password('secret')
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['user_type'] = 'user'
+
+    def test_svg_with_etag_revalidation(self):
+        response = self.client.get('/payment_qr/1770.00.svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertIn(b'<svg', response.data)
+        self.assertIn('max-age', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+
+        response = self.client.get('/payment_qr/1770.00.svg', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        other = self.client.get('/payment_qr/1771.00.svg')
+        self.assertNotEqual(other.headers['ETag'], etag)
+
+    def test_rendered_codes_are_cached(self):
+        render_qr_svg.cache_clear()
+        payload = upi_payload(1770)
+        self.assertIs(render_qr_svg(payload), render_qr_svg(payload))
+        self.assertEqual(render_qr_svg.cache_info().hits, 1)
+        self.assertIn('am=1770.00', payload)
+
+    def test_invalid_amounts(self):
+        for amount in ('abc', '-5', 'nan', 'inf'):
+            self.assertEqual(self.client.get(f'/payment_qr/{amount}.svg').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+Tests for ProductImage rows and product_images.py helpers
+"""
+
+import io
+import os
+import unittest
+import uuid
+from unittest import mock
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from test_support import DatabaseTestCase
+import utils
+from app import db, delete_local_file
+from models import Product, ProductImage
+from product_images import (PLACEHOLDER_IMAGE, image_reference_count, image_row_diagnostic,
+                            load_primary_images, product_image_paths, remove_product_image,
+                            set_product_images)
+from utils import (delete_image_variants, generate_image_variants, image_srcset,
+                   store_upload, variant_path)
+
+
+class ProductImagesTestCase(DatabaseTestCase):
+    """Test suite for ordered product images"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.image_name = f'test_{uuid.uuid4().hex}.png'
+        self.image_path = os.path.join(self.app.static_folder, 'uploads', self.image_name)
+        os.makedirs(os.path.dirname(self.image_path), exist_ok=True)
+        Image.new('RGB', (40, 30), (200, 10, 10)).save(self.image_path, 'PNG')
+        # Written behind the helpers' back; tell an already built image index
+        utils.image_index_add(self.image_path)
+
+    def tearDown(self):
+        super().tearDown()
+        if os.path.exists(self.image_path):
+            os.remove(self.image_path)
+
+    def create_product(self, image_url=None):
+        product = Product(name='Frame', price=10, category='h-frames',
+                          product_type='scaffolding', image_url=image_url, is_active=True)
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def test_set_product_images_orders_rows_and_mirrors_csv(self):
+        with self.app.app_context():
+            product = self.create_product()
+            set_product_images(product, [f'uploads/{self.image_name}', 'uploads/b.jpg'])
+            db.session.commit()
+
+            rows = ProductImage.query.filter_by(product_id=product.id).order_by(ProductImage.position).all()
+            self.assertEqual([r.position for r in rows], [0, 1])
+            self.assertEqual((rows[0].width, rows[0].height, rows[0].format), (40, 30, 'PNG'))
+            self.assertGreater(rows[0].bytes, 0)
+            self.assertEqual(rows[0].dominant_color, '#c80a0a')
+            self.assertEqual(len(rows[0].sha256), 64)
+            self.assertEqual(product.image_url, f'uploads/{self.image_name},uploads/b.jpg')
+            self.assertEqual(load_primary_images([product.id]), {product.id: f'uploads/{self.image_name}'})
+
+    def test_remove_product_image_closes_gap(self):
+        with self.app.app_context():
+            product = self.create_product()
+            set_product_images(product, ['uploads/a.jpg', 'uploads/b.jpg', 'uploads/c.jpg'])
+            db.session.commit()
+
+            self.assertTrue(remove_product_image(product, 'uploads/a.jpg', placeholder=PLACEHOLDER_IMAGE))
+            db.session.commit()
+
+            self.assertEqual([(i.position, i.path) for i in product.images],
+                             [(0, 'uploads/b.jpg'), (1, 'uploads/c.jpg')])
+            self.assertEqual(product.image_url, 'uploads/b.jpg,uploads/c.jpg')
+            self.assertFalse(remove_product_image(product, 'uploads/missing.jpg'))
+
+    def test_variants_generated_and_listed_in_srcset(self):
+        with self.app.app_context():
+            path = f'uploads/{self.image_name}'
+            created = generate_image_variants(path)
+            try:
+                self.assertEqual(len(created), 6)
+                with Image.open(os.path.join(self.app.static_folder, variant_path(path, 'thumb', 'webp'))) as img:
+                    self.assertEqual(img.format, 'WEBP')
+                    self.assertLessEqual(img.width, 160)
+
+                # A 40px upload is never upscaled: one 40w entry, not 160w / 400w / 1000w
+                expected = f'/static/{variant_path(path, "thumb", "jpg")} 40w'
+                self.assertEqual(image_srcset(f'/static/{path}', 'jpg'), expected)
+                # Read back from the file when this process did not generate it
+                utils._variant_widths.clear()
+                self.assertEqual(image_srcset(path, 'jpg'), expected)
+            finally:
+                delete_image_variants(path)
+            self.assertEqual(image_srcset(path), '')
+
+    def test_row_diagnostic_reads_stored_metadata(self):
+        with self.app.app_context():
+            product = self.create_product()
+            set_product_images(product, [f'uploads/{self.image_name}', 'uploads/missing.jpg'])
+            db.session.commit()
+
+            present, missing = [image_row_diagnostic(row) for row in product.images]
+            self.assertTrue(present['valid'])
+            self.assertEqual(present['dimensions'], '40x30')
+            self.assertEqual(present['dominant_color'], '#c80a0a')
+            self.assertFalse(missing['exists'])
+            self.assertFalse(missing['valid'])
+
+    def test_unmigrated_product_falls_back_to_csv(self):
+        with self.app.app_context():
+            product = self.create_product(image_url='uploads/a.jpg, uploads/b.jpg')
+            self.assertEqual(product_image_paths(product), ['uploads/a.jpg', 'uploads/b.jpg'])
+
+            # Removing from an unmigrated product converts it to rows
+            remove_product_image(product, 'uploads/a.jpg', placeholder=PLACEHOLDER_IMAGE)
+            db.session.commit()
+            self.assertEqual([i.path for i in product.images], ['uploads/b.jpg'])
+
+    def test_identical_uploads_share_one_file(self):
+        with open(self.image_path, 'rb') as f:
+            data = f.read()
+
+        with self.app.test_request_context():
+            first = store_upload(FileStorage(io.BytesIO(data), filename='a.PNG'))
+            second = store_upload(FileStorage(io.BytesIO(data), filename='b.png'))
+            fs_path = os.path.join(self.app.static_folder, first)
+            try:
+                self.assertEqual(first, second)
+                self.assertRegex(first, r'^uploads/[0-9a-f]{64}\.png$')
+
+                product_a = self.create_product()
+                product_b = self.create_product()
+                set_product_images(product_a, [first])
+                set_product_images(product_b, [first])
+                db.session.commit()
+
+                # Removing the photo from one product must not take the other's with it
+                set_product_images(product_a, [])
+                db.session.commit()
+                self.assertEqual(image_reference_count(first), 1)
+                self.assertFalse(delete_local_file(first))
+                self.assertTrue(os.path.exists(fs_path))
+
+                # A deactivated product still holds on to its photo
+                product_b.is_active = False
+                db.session.commit()
+                self.assertFalse(delete_local_file(first))
+                self.assertTrue(os.path.exists(fs_path))
+
+                set_product_images(product_b, [])
+                db.session.commit()
+                self.assertTrue(delete_local_file(first))
+                self.assertFalse(os.path.exists(fs_path))
+
+                # Uploading the same picture again brings the file back
+                self.assertEqual(store_upload(FileStorage(io.BytesIO(data), filename='c.png')), first)
+                self.assertTrue(os.path.exists(fs_path))
+                self.assertTrue(os.path.exists(os.path.join(self.app.static_folder,
+                                                            variant_path(first, 'card', 'webp'))))
+            finally:
+                if os.path.exists(fs_path):
+                    os.remove(fs_path)
+                delete_image_variants(first)
+
+    def test_delete_keeps_file_referenced_during_removal(self):
+        with self.app.test_request_context():
+            path = f'uploads/{self.image_name}'
+            # The count is taken again after the move; a product saved in between wins
+            with mock.patch('product_images.image_reference_count', side_effect=[0, 1]):
+                self.assertFalse(delete_local_file(path))
+            self.assertTrue(os.path.exists(self.image_path))
+
+    def test_reference_count_escapes_like_wildcards(self):
+        with self.app.app_context():
+            self.create_product(image_url='uploads/axb.jpg')
+            self.assertEqual(image_reference_count('uploads/a_b.jpg'), 0)
+            self.assertEqual(image_reference_count('uploads/axb.jpg'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+Tests for the hot-query indexes and check_query_plans.py
+"""
+
+import unittest
+from sqlalchemy import select
+from test_support import DatabaseTestCase
+from app import db
+from models import Product
+from check_query_plans import HOT_QUERIES, check_query_plans, explain, full_scans, missing_indexes
+
+
+class QueryPlansTestCase(DatabaseTestCase):
+    """Test suite for the EXPLAIN check"""
+
+    def test_hot_queries_use_indexes(self):
+        with self.app.app_context():
+            self.assertEqual(check_query_plans(), [])
+            plans = {name: ' '.join(explain(statement)) for name, statement in HOT_QUERIES}
+            self.assertIn('ix_products_active_category_lower', plans['active products by lower(category)'])
+            self.assertIn('ix_orders_user_date', plans["a user's orders by date"])
+
+    def test_missing_indexes_are_listed(self):
+        with self.app.app_context():
+            self.assertEqual(missing_indexes(), [])
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('DROP INDEX ix_orders_user_date')
+                conn.commit()
+            self.assertEqual(missing_indexes(), [('orders', 'ix_orders_user_date')])
+
+    def test_full_scan_is_reported(self):
+        with self.app.app_context():
+            unindexed = [('products by name', select(Product.id).where(Product.name == 'Frame'))]
+            self.assertEqual(check_query_plans(unindexed), ['products by name'])
+            self.assertEqual(full_scans(['SEARCH products USING INDEX ix (id=?)', 'Seq Scan on orders']),
+                             ['Seq Scan on orders'])
+
+
+if __name__ == '__main__':
+    unittest.main()
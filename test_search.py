@@ -0,0 +1,101 @@
+"""
+Tests for search.py product search
+"""
+
+import unittest
+from sqlalchemy import text
+from test_support import DatabaseTestCase
+from app import db
+from models import Product, CuplockVerticalSize
+from catalog import catalog_changed, clear_catalog_snapshot, ensure_catalog_version_row
+import search
+from search import rebuild_search_index, search_product_ids
+
+
+class SearchTestCase(DatabaseTestCase):
+    """Test suite for the product search index"""
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            # product_search is not part of the models' metadata; start it empty
+            rebuild_search_index()
+            ensure_catalog_version_row()
+        clear_catalog_snapshot()
+
+    def create_product(self, name, category='accessories', description='', cuplock_type=None):
+        product = Product(name=name, price=10, category=category, description=description,
+                          product_type='scaffolding', cuplock_type=cuplock_type, is_active=True)
+        db.session.add(product)
+        db.session.flush()
+        catalog_changed(product.id)
+        db.session.commit()
+        return product
+
+    def test_ranked_prefix_search(self):
+        with self.app.app_context():
+            jack = self.create_product('U Head Jack', description='Adjustable top support')
+            pin = self.create_product('Joint Pin', description='Connects two tubes')
+            base = self.create_product('Base Jack', description='Use with a u head jack on top')
+
+            ids, has_next = search_product_ids('u head jack')
+            # Name matches outrank description matches
+            self.assertEqual(ids, [jack.id, base.id])
+            self.assertFalse(has_next)
+
+            self.assertEqual(search_product_ids('joint pi')[0], [pin.id])
+            self.assertEqual(search_product_ids('')[0], [])
+            self.assertEqual(search_product_ids('"*) OR (')[0], [])
+
+    def test_index_follows_catalog_changes(self):
+        with self.app.app_context():
+            vertical = self.create_product('Cuplock Vertical', category='cuplock', cuplock_type='vertical')
+            db.session.add(CuplockVerticalSize(product_id=vertical.id, size_label='2.5m', buy_price=100))
+            catalog_changed(vertical.id)
+            db.session.commit()
+            self.assertEqual(search_product_ids('2.5m')[0], [vertical.id])
+
+            vertical.is_active = False
+            catalog_changed(vertical.id)
+            db.session.commit()
+            self.assertEqual(search_product_ids('vertical')[0], [])
+
+    def test_search_pages_and_api(self):
+        with self.app.app_context():
+            for i in range(5):
+                self.create_product(f'Clamp {i}', category='steel')
+
+        data = self.client.get('/api/search?q=clamp&per_page=2&page=3').get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['results']), 1)
+        self.assertFalse(data['has_next'])
+        self.assertIn('/fabrication', data['results'][0]['url'])
+
+        data = self.client.get('/api/search?q=clamp&per_page=2').get_json()
+        self.assertTrue(data['has_next'])
+
+        response = self.client.get('/search?q=clamp')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Clamp 4', response.data)
+
+    def test_table_built_after_startup_is_picked_up(self):
+        with self.app.app_context():
+            db.session.execute(text('DROP TABLE product_search'))
+            db.session.commit()
+            search._search_ready = False
+
+            # No table yet: writes skip the index and search falls back to names
+            jack = self.create_product('U Head Jack')
+            self.assertEqual(search_product_ids('head')[0], [jack.id])
+
+            # rebuild_search_index.py runs in another process
+            with db.engine.connect() as conn:
+                conn.execute(text("CREATE VIRTUAL TABLE product_search USING fts5(name, body)"))
+                conn.commit()
+
+            self.create_product('Joint Pin')
+            self.assertEqual(db.session.execute(text('SELECT count(*) FROM product_search')).scalar(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests for suggest.py autocomplete
+"""
+
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+from sqlalchemy import event
+from test_support import DatabaseTestCase
+from app import db
+from models import Product
+from catalog import catalog_changed, clear_catalog_snapshot, ensure_catalog_version_row
+from suggest import (CATEGORY, PRODUCT, SuggestIndex, clear_suggest_index, ensure_suggest_refresher,
+                     refresh_suggest_index, suggest)
+
+
+class SuggestTestCase(DatabaseTestCase):
+    """Test suite for the in-memory prefix index"""
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            ensure_catalog_version_row()
+        clear_catalog_snapshot()
+        clear_suggest_index()
+
+    def create_product(self, name, category='accessories'):
+        product = Product(name=name, price=10, category=category, product_type='scaffolding', is_active=True)
+        db.session.add(product)
+        db.session.flush()
+        catalog_changed(product.id)
+        db.session.commit()
+        return product
+
+    def test_prefix_matches(self):
+        with self.app.app_context():
+            jack = self.create_product('U Head Jack')
+            self.create_product('Base Jack')
+            self.create_product('Joint Pin', category='fittings')
+            refresh_suggest_index()
+
+            self.assertEqual([s.label for s in suggest('jo')], ['Joint Pin'])
+            # Names starting with the prefix come before later-word matches
+            self.assertEqual([s.label for s in suggest('u h')], ['U Head Jack'])
+            self.assertEqual([s.label for s in suggest('jack')], ['Base Jack', 'U Head Jack'])
+            self.assertEqual(suggest('head')[0].id, jack.id)
+            self.assertEqual([(s.kind, s.label) for s in suggest('fit')], [('category', 'fittings')])
+            self.assertIn(('size', '2.5m'), [(s.kind, s.label) for s in suggest('2.5')])
+            self.assertEqual(suggest(''), [])
+            self.assertEqual(len(suggest('j', limit=1)), 1)
+
+    def test_index_follows_catalog_changes(self):
+        with self.app.app_context():
+            pin = self.create_product('Joint Pin', category='fittings')
+            refresh_suggest_index()
+            self.assertEqual([s.label for s in suggest('joint')], ['Joint Pin'])
+
+            pin.name = 'Spigot Pin'
+            catalog_changed(pin.id)
+            db.session.commit()
+            # Requests keep reading the last synced index until the refresher runs
+            self.assertEqual([s.label for s in suggest('joint')], ['Joint Pin'])
+            index = refresh_suggest_index()
+            self.assertEqual(len(index.products), 1)
+            self.assertEqual(index.lookup('joint'), [])
+            self.assertEqual([s.label for s in suggest('spig')], ['Spigot Pin'])
+
+            pin.is_active = False
+            catalog_changed(pin.id)
+            db.session.commit()
+            refresh_suggest_index()
+            self.assertEqual(suggest('spig'), [])
+            self.assertEqual(suggest('fit'), [])
+
+    def test_start_of_name_match_beyond_later_word_matches(self):
+        # 100 later-word keys ('zap 0'...) sort before the one name starting with 'zz'
+        snapshot = SimpleNamespace(products=[
+            SimpleNamespace(id=i, name=f'Tube Zap {i}', category='tubes') for i in range(100)
+        ] + [SimpleNamespace(id=100, name='Zz Clamp', category='fittings')])
+        index = SuggestIndex()
+        index.sync(snapshot)
+        self.assertEqual(index.lookup('z')[0], (PRODUCT, 'Zz Clamp', 100))
+        self.assertEqual(len(index.lookup('z')), 8)
+        self.assertEqual(index.entries, sorted(index.entries))
+
+        # A category handed from one product to a new one stays listed once
+        index.sync(SimpleNamespace(products=[
+            SimpleNamespace(id=100, name='Zz Clamp', category='tubes'),
+            SimpleNamespace(id=101, name='Coupler', category='fittings'),
+        ]))
+        self.assertEqual([e for e in index.entries if e[2] == CATEGORY],
+                         [('fittings', 0, CATEGORY, 'fittings', None), ('tubes', 0, CATEGORY, 'tubes', None)])
+        self.assertEqual(index.entries, sorted(index.entries))
+
+    def test_api_never_queries_database(self):
+        with self.app.app_context():
+            self.create_product('Joint Pin', category='fittings')
+            refresh_suggest_index()
+            # A later catalog change must not make a request sync inline
+            self.create_product('Joint Clamp', category='fittings')
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            engine = db.engine
+            event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            for prefix in ('j', 'jo', 'joi', 'join'):
+                data = self.client.get(f'/api/suggest?q={prefix}').get_json()
+                self.assertTrue(data['success'])
+                self.assertEqual(data['suggestions'][0]['label'], 'Joint Pin')
+                self.assertIn('/fabrication', data['suggestions'][0]['url'])
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+
+    def test_refresher_started_once_per_process(self):
+        with mock.patch('suggest.threading.Thread') as thread, \
+             mock.patch('suggest._refresher_pid', None):
+            ensure_suggest_refresher(self.app)
+            ensure_suggest_refresher(self.app)
+        thread.assert_called_once()
+        self.assertTrue(thread.call_args.kwargs['daemon'])
+
+
+if __name__ == '__main__':
+    unittest.main()
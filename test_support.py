@@ -0,0 +1,43 @@
+"""
+Shared fixtures for the test suite.
+
+Importing this module points app.py at a throwaway sqlite file through
+TEST_DATABASE_URL before `app` is imported, so create_all / drop_all never
+run against DATABASE_URL or instance/database.db.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import unittest
+
+if not os.environ.get('TEST_DATABASE_URL'):
+    _tmp_dir = tempfile.mkdtemp(prefix='national-scaffolding-tests-')
+    atexit.register(shutil.rmtree, _tmp_dir, ignore_errors=True)
+    os.environ['TEST_DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+
+from app import app, db
+
+if app.config['SQLALCHEMY_DATABASE_URI'] != os.environ['TEST_DATABASE_URL']:
+    raise RuntimeError('app was imported before test_support; refusing to run tests against the configured database')
+
+# Caches the app writes under instance/ (image diagnostics) go next to the test database too
+app.instance_path = tempfile.mkdtemp(prefix='national-scaffolding-instance-')
+atexit.register(shutil.rmtree, app.instance_path, ignore_errors=True)
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Fresh tables and a test client for every test"""
+
+    def setUp(self):
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
@@ -1,11 +1,170 @@
+import hashlib
 import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
 from werkzeug.utils import secure_filename
-from flask import current_app
+from flask import current_app, has_app_context
+from PIL import Image, ImageOps
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+
+# ===========================
+# IMAGE EXISTENCE INDEX
+# ===========================
+# Listing pages resolve every product image through get_image_url(). Instead of
+# an os.path.exists() per image, keep the contents of the image folders in
+# memory. Upload / delete helpers update the index directly; a resync every
+# IMAGE_INDEX_RESYNC_SECONDS picks up files changed behind our back (other
+# workers, manual copies) by comparing directory mtimes.
+
+INDEXED_IMAGE_DIRS = ('static/uploads', 'static/images')
+IMAGE_INDEX_RESYNC_SECONDS = 60
+# Missing paths already warned about; forgotten past this many so a flood of
+# bad paths cannot grow it forever
+WARNED_MISSING_LIMIT = 1000
+
+_image_index = {
+    'files': set(),
+    'dir_mtimes': {},
+    'built': False,
+    'checked_at': 0.0,
+    'static_root': None,
+}
+_image_index_lock = threading.Lock()
+_warned_missing = set()
+# 'static/uploads/variants/...' -> pixel width; variants are never upscaled,
+# so small uploads have variants narrower than their nominal width
+_variant_widths = {}
+
+
+def _static_root():
+    """The app's static folder, whatever the working directory. Scripts
+    running without an app context fall back to ./static."""
+    if _image_index['static_root'] is None:
+        if not has_app_context():
+            return os.path.abspath('static').replace('\\', '/')
+        _image_index['static_root'] = os.path.abspath(current_app.static_folder).replace('\\', '/')
+    return _image_index['static_root']
+
+
+def _folder_path(folder):
+    """'static/uploads' -> absolute path under the static folder"""
+    return posixpath.join(_static_root(), folder[len('static/'):])
+
+
+def _image_index_key(path):
+    """Normalize `path` to 'static/...' if it lives in an indexed folder, else None"""
+    if not path:
+        return None
+    path = path.replace('\\', '/')
+    if os.path.isabs(path):
+        root = _static_root()
+        if not path.startswith(root + '/'):
+            return None
+        path = 'static/' + path[len(root) + 1:]
+    path = posixpath.normpath(path)
+    for folder in INDEXED_IMAGE_DIRS:
+        if path.startswith(folder + '/'):
+            return path
+    return None
+
+
+def _scan_image_dirs():
+    """Walk the indexed folders once; returns (files as 'static/...' keys, dir_mtimes)"""
+    files = set()
+    dir_mtimes = {}
+    root = _static_root()
+    for folder in INDEXED_IMAGE_DIRS:
+        for dirpath, dirnames, filenames in os.walk(_folder_path(folder)):
+            dirpath = dirpath.replace('\\', '/')
+            try:
+                dir_mtimes[dirpath] = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+            key_dir = 'static/' + posixpath.relpath(dirpath, root)
+            for name in filenames:
+                files.add(posixpath.join(key_dir, name))
+    return files, dir_mtimes
+
+
+def rebuild_image_index():
+    """(Re)build the index from disk"""
+    _image_index['static_root'] = None
+    files, dir_mtimes = _scan_image_dirs()
+    with _image_index_lock:
+        _image_index['files'] = files
+        _image_index['dir_mtimes'] = dir_mtimes
+        _image_index['built'] = True
+        _image_index['checked_at'] = time.monotonic()
+        _warned_missing.clear()
+        _variant_widths.clear()
+    logger.info(f"Image index built: {len(files)} files in {len(dir_mtimes)} folders")
+
+
+def _image_index_changed_on_disk():
+    """True if any indexed folder was added, removed or modified"""
+    known = _image_index['dir_mtimes']
+    for folder in INDEXED_IMAGE_DIRS:
+        folder = _folder_path(folder)
+        if os.path.isdir(folder) != (folder in known):
+            return True
+    for dirpath, mtime in known.items():
+        try:
+            if os.stat(dirpath).st_mtime != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def _ensure_image_index():
+    if not _image_index['built']:
+        rebuild_image_index()
+        return
+    if time.monotonic() - _image_index['checked_at'] < IMAGE_INDEX_RESYNC_SECONDS:
+        return
+    _image_index['checked_at'] = time.monotonic()
+    if _image_index_changed_on_disk():
+        rebuild_image_index()
+
+
+def image_index_add(path):
+    """Record a file that was just written"""
+    key = _image_index_key(path)
+    if key is None or not _image_index['built']:
+        return
+    with _image_index_lock:
+        _image_index['files'].add(key)
+        _warned_missing.discard(key)
+
+
+def image_index_discard(path):
+    """Forget a file that was just deleted"""
+    key = _image_index_key(path)
+    if key is None or not _image_index['built']:
+        return
+    with _image_index_lock:
+        _image_index['files'].discard(key)
+        _variant_widths.pop(key, None)
+
+
+def image_exists(fs_path):
+    """
+    Existence check for files under static/. Paths inside the indexed
+    folders are answered from memory; anything else hits the filesystem.
+    """
+    key = _image_index_key(fs_path)
+    if key is None:
+        return os.path.exists(fs_path)
+    _ensure_image_index()
+    return key in _image_index['files']
+
 def get_image_url(image_path):
     """
     Convert database image path to proper URL for templates
@@ -36,32 +195,317 @@ def get_image_url(image_path):
         fs_path = os.path.join('static', normalized)
 
     # If the file exists on disk, return a URL path; else return no-image
-    if os.path.exists(fs_path):
+    if image_exists(fs_path):
         # Ensure URL starts with /static/
         if fs_path.startswith('static/'):
             return '/' + fs_path
         else:
             return '/' + fs_path.replace('\\', '/')
     else:
-        logger.warning(f"Image not found on disk: {fs_path}; falling back to no-image.png")
+        # Warn once per path instead of on every render
+        if fs_path not in _warned_missing:
+            if len(_warned_missing) >= WARNED_MISSING_LIMIT:
+                _warned_missing.clear()
+            _warned_missing.add(fs_path)
+            logger.warning(f"Image not found on disk: {fs_path}; falling back to no-image.png")
         return '/static/images/no-image.png'
 
 
+# ===========================
+# IMAGE VARIANTS
+# ===========================
+# Every upload gets resized copies next to it in static/uploads/variants:
+# <stem>_<variant>.webp and <stem>_<variant>.jpg. Templates build srcset
+# attributes from them with image_srcset().
+
+IMAGE_VARIANTS = (
+    ('thumb', 160),
+    ('card', 400),
+    ('detail', 1000),
+)
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+VARIANT_FOLDER = 'uploads/variants'
+
+
+def _upload_relative_path(path):
+    """'/static/uploads/x.jpg' or 'uploads/x.jpg' -> 'uploads/x.jpg'; None for anything else"""
+    if not path:
+        return None
+    path = path.strip().replace('\\', '/')
+    if path.startswith('http://') or path.startswith('https://'):
+        return None
+    path = path.lstrip('/')
+    if path.startswith('static/'):
+        path = path[len('static/'):]
+    if not path.startswith('uploads/') or path.startswith(VARIANT_FOLDER + '/'):
+        return None
+    return path
+
+
+def variant_path(path, variant, ext):
+    """Stored path of one variant ('uploads/variants/<stem>_card.webp'), or None"""
+    rel = _upload_relative_path(path)
+    if rel is None:
+        return None
+    stem = posixpath.splitext(posixpath.basename(rel))[0]
+    return f"{VARIANT_FOLDER}/{stem}_{variant}.{ext}"
+
+
+def generate_image_variants(path):
+    """
+    Write thumb / card / detail variants of an uploaded image in WebP and
+    JPEG. Failures are logged and never block the upload itself.
+    Returns the stored paths that were written.
+    """
+    rel = _upload_relative_path(path)
+    if rel is None:
+        return []
+
+    static_folder = current_app.static_folder
+    created = []
+    try:
+        os.makedirs(os.path.join(static_folder, VARIANT_FOLDER), exist_ok=True)
+        with Image.open(os.path.join(static_folder, rel)) as original:
+            img = ImageOps.exif_transpose(original)
+            if img.mode != 'RGB':
+                # JPEG has no alpha: flatten transparent PNGs onto white
+                rgba = img.convert('RGBA')
+                img = Image.new('RGB', rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.split()[-1])
+
+            for variant, width in IMAGE_VARIANTS:
+                resized = img.copy()
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+                for ext, fmt, options in VARIANT_FORMATS:
+                    target = variant_path(rel, variant, ext)
+                    target_fs = os.path.join(static_folder, target)
+                    resized.save(target_fs, fmt, **options)
+                    image_index_add(target_fs)
+                    _variant_widths[f"static/{target}"] = resized.width
+                    created.append(target)
+    except Exception as e:
+        logger.error(f"Error generating image variants for {path}: {e}")
+    return created
+
+
+def delete_image_variants(path):
+    """Remove the variants of an uploaded image"""
+    static_folder = current_app.static_folder
+    for variant, _ in IMAGE_VARIANTS:
+        for ext, _, _ in VARIANT_FORMATS:
+            target = variant_path(path, variant, ext)
+            if target is None:
+                return
+            target_fs = os.path.join(static_folder, target)
+            try:
+                if os.path.exists(target_fs):
+                    os.remove(target_fs)
+                image_index_discard(target_fs)
+            except Exception as e:
+                logger.error(f"Error deleting image variant {target_fs}: {e}")
+
+
+def _variant_width(target):
+    """Real pixel width of a stored variant: recorded when it was generated,
+    else read once from the file header"""
+    key = f"static/{target}"
+    width = _variant_widths.get(key)
+    if width is None:
+        try:
+            with Image.open(os.path.join(current_app.static_folder, target)) as img:
+                width = img.width
+        except Exception as e:
+            logger.warning(f"Could not read width of image variant {target}: {e}")
+            return None
+        _variant_widths[key] = width
+    return width
+
+
+def image_srcset(path, ext='webp'):
+    """
+    srcset value ('/static/... 160w, /static/... 400w, ...') built from the
+    variants that exist for `path`, each with its real width; empty string
+    if there are none. Variants of a small upload that came out the same
+    width are listed once. Existence goes through the image index and widths
+    are cached, so a render touches the filesystem at most once per variant.
+    """
+    entries = []
+    widths = set()
+    for variant, _ in IMAGE_VARIANTS:
+        target = variant_path(path, variant, ext)
+        if target is None:
+            return ''
+        if not image_exists(f"static/{target}"):
+            continue
+        width = _variant_width(target)
+        if width is None or width in widths:
+            continue
+        widths.add(width)
+        entries.append(f"/static/{target} {width}w")
+    return ', '.join(entries)
+
+
+# ===========================
+# CONTENT-ADDRESSED UPLOADS
+# ===========================
+# Uploads are stored as static/uploads/<sha256>.<ext>. Re-uploading the same
+# picture (a very common admin habit) reuses the existing file instead of
+# writing another copy. Because several products can now share one file,
+# deletes go through image_reference_count() and move the file into the
+# upload quarantine (instance/upload_quarantine, purged by gc_uploads.py)
+# instead of unlinking it.
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_QUARANTINE_FOLDER = 'upload_quarantine'
+
+
+def upload_extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return '.jpg' if ext == '.jpeg' else ext
+
+
+def store_upload(file, filename=None):
+    """
+    Stream an uploaded file to disk while hashing it and return its stored
+    path ('uploads/<sha256>.<ext>'). If a file with the same content already
+    exists it is reused and the new copy is discarded.
+    """
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
+    os.makedirs(upload_folder, exist_ok=True)
+    ext = upload_extension(filename or getattr(file, 'filename', ''))
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-', suffix='.tmp')
+    try:
+        stream = getattr(file, 'stream', file)
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = f"{digest.hexdigest()}{ext}"
+        final_path = os.path.join(upload_folder, name)
+        existed = os.path.exists(final_path)
+        # Same bytes either way; replacing rather than discarding our copy also
+        # brings the file back if a concurrent delete moved it away just now
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, final_path)
+        image_index_add(final_path)
+        if existed and all(os.path.exists(os.path.join(current_app.static_folder, v))
+                           for v in _variant_paths(f"uploads/{name}")):
+            logger.info(f"Upload matches existing file {name}; reusing it")
+        else:
+            generate_image_variants(f"uploads/{name}")
+
+        return f"uploads/{name}"
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _variant_paths(rel):
+    return [variant_path(rel, variant, ext) for variant, _ in IMAGE_VARIANTS for ext, _, _ in VARIANT_FORMATS]
+
+
+def _quarantine_dir():
+    return os.path.join(current_app.instance_path, UPLOAD_QUARANTINE_FOLDER)
+
+
+def quarantine_upload(path, now=None):
+    """
+    Move an upload and its variants into the quarantine, restarting their
+    purge clock. Returns False if the upload was not on disk.
+    """
+    rel = _upload_relative_path(path)
+    if rel is None:
+        return False
+    static_folder = current_app.static_folder
+    quarantine_dir = _quarantine_dir()
+    now = now or time.time()
+
+    moved = False
+    for stored in [rel] + _variant_paths(rel):
+        source = os.path.join(static_folder, stored)
+        target = os.path.join(quarantine_dir, stored[len('uploads/'):])
+        if not os.path.exists(source):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            shutil.move(source, target)
+        except FileNotFoundError:
+            continue
+        os.utime(target, (now, now))
+        image_index_discard(source)
+        moved = moved or stored == rel
+    return moved
+
+
+def restore_upload(path):
+    """
+    Move a quarantined upload and its variants back into uploads/. Files that
+    already exist there again (a fresh upload of the same content) win.
+    Returns True if the upload itself is in place afterwards.
+    """
+    rel = _upload_relative_path(path)
+    if rel is None:
+        return False
+    static_folder = current_app.static_folder
+    quarantine_dir = _quarantine_dir()
+    for stored in [rel] + _variant_paths(rel):
+        source = os.path.join(quarantine_dir, stored[len('uploads/'):])
+        target = os.path.join(static_folder, stored)
+        if not os.path.exists(source):
+            continue
+        if os.path.exists(target):
+            os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+        image_index_add(target)
+    return os.path.exists(os.path.join(static_folder, rel))
+
+
+def discard_upload(path):
+    """
+    Retire an upload once nothing references it; returns True if it was
+    moved out. The reference count is taken again after the move: a product
+    saved with the same content in between gets its file straight back, and
+    one saved later still is restored by gc_uploads.py before the purge.
+    """
+    from product_images import image_reference_count
+
+    rel = _upload_relative_path(path)
+    if rel is None:
+        return False
+    if image_reference_count(rel) > 0:
+        logger.info(f"Keeping {rel}: still referenced")
+        return False
+    if not quarantine_upload(rel):
+        logger.warning(f"File not found for deletion: {rel}")
+        return False
+    if image_reference_count(rel) > 0:
+        restore_upload(rel)
+        logger.info(f"Kept {rel}: referenced again while it was being removed")
+        return False
+    logger.info(f"Moved {rel} to the upload quarantine")
+    return True
+
+
 def upload_to_s3(file, filename, folder='uploads'):
     """
     Local storage version - saves file to local filesystem
     (Function name kept as upload_to_s3 for compatibility)
     """
     try:
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder, exist_ok=True)
-        
-        filepath = os.path.join(upload_folder, filename)
-        file.save(filepath)
-        
         # Return relative path for database storage (without 'static/')
-        return f"uploads/{filename}"
+        return store_upload(file, filename)
         
     except Exception as e:
         logger.error(f"Error saving file locally: {e}")
@@ -70,31 +514,13 @@ def upload_to_s3(file, filename, folder='uploads'):
 
 def delete_from_s3(file_path):
     """
-    Local storage version - deletes file from local filesystem
+    Local storage version - retires the upload with discard_upload()
     (Function name kept as delete_from_s3 for compatibility)
     """
     try:
         if not file_path:
             return False
-            
-        # Convert database path to filesystem path
-        if file_path.startswith('uploads/'):
-            full_path = os.path.join('static', file_path)
-        elif file_path.startswith('/static/'):
-            full_path = file_path[1:]  # Remove leading /
-        elif file_path.startswith('static/'):
-            full_path = file_path
-        else:
-            full_path = file_path
-        
-        if os.path.exists(full_path):
-            os.remove(full_path)
-            logger.info(f"Deleted local file: {full_path}")
-            return True
-        else:
-            logger.warning(f"File not found for deletion: {full_path}")
-            return False
-            
+        return discard_upload(file_path)
     except Exception as e:
         logger.error(f"Error deleting local file: {e}")
         return False